@@ -0,0 +1,437 @@
+import argparse
+import hashlib
+import html
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+from pipeline import is_valid_url
+from profiling import add_profile_argument, profile_run, stage
+from page_reader import MirrorSource
+from replay_server import replay_url
+from sites import SITES
+
+
+OFFLINE_ROOT = "offline"
+ASSETS_DIRNAME = "assets"
+ASSET_INDEX_FILENAME = ".assets.jsonl"
+WORKERS = 8
+TIMEOUT_SECONDS = 30
+MAX_ASSET_BYTES = 50 * 1024 * 1024
+USER_AGENT = "Mozilla/5.0 (asset-mirror)"
+ASSET_RELS = {"stylesheet", "icon", "apple-touch-icon", "mask-icon", "preload", "modulepreload"}
+URL_ATTRIBUTES = {"src", "href", "poster", "data-src"}
+SRCSET_ATTRIBUTES = {"srcset", "data-srcset", "imagesrcset"}
+# Local copies, and CSS with rewritten url()s, no longer match the page's hashes or need CORS.
+SRI_ATTRIBUTES = ("integrity", "crossorigin")
+
+TAG_PATTERN = re.compile(r"<(link|script|img|source|video|audio|track|input|base)\b[^>]*>", re.I)
+ATTRIBUTE_PATTERN = re.compile(r"""([\w:-]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+STYLE_PATTERN = re.compile(r"(<style\b[^>]*>)(.*?)(</style>)", re.I | re.S)
+CSS_URL_PATTERN = re.compile(
+    r"""url\(\s*(?:"([^"]*)"|'([^']*)'|([^)'"\s]*))\s*\)|@import\s+(?:"([^"]*)"|'([^']*)')"""
+)
+
+
+def _value_span(match):
+    for group in (2, 3, 4):
+        if match.group(group) is not None:
+            return group
+    return None
+
+
+def _is_asset_tag(tag: str, attributes: dict) -> bool:
+    if tag != "link":
+        return True
+    rels = set(attributes.get("rel", "").lower().split())
+    return bool(rels & ASSET_RELS)
+
+
+def _rewrite_srcset(value: str, replace) -> str:
+    candidates = []
+    for candidate in value.split(","):
+        parts = candidate.split()
+        if parts:
+            parts[0] = replace(parts[0])
+            candidates.append(" ".join(parts))
+    return ", ".join(candidates)
+
+
+def _resolve(base_url: str, value: str):
+    value = html.unescape(value.strip())
+    if not value or value.startswith(("data:", "#", "javascript:", "about:", "blob:")):
+        return None
+    url = urljoin(base_url, value).split("#", 1)[0]
+    return url if is_valid_url(url) else None
+
+
+def _drop_attributes(tag_text: str, names) -> str:
+    bare = re.compile(r"\s+(?:%s)(?=[\s/>]|$)" % "|".join(names), re.I)
+    pieces = []
+    position = 0
+    for match in ATTRIBUTE_PATTERN.finditer(tag_text):
+        pieces.append(bare.sub("", tag_text[position : match.start()]))
+        if match.group(1).lower() in names:
+            pieces[-1] = pieces[-1].rstrip()
+        else:
+            pieces.append(match.group(0))
+        position = match.end()
+    pieces.append(bare.sub("", tag_text[position:]))
+    return "".join(pieces)
+
+
+def _rewrite_tags(text: str, base_url: str, replace) -> str:
+    def rewrite_tag(tag_match):
+        tag_text = tag_match.group(0)
+        tag = tag_match.group(1).lower()
+        attributes = {}
+        for match in ATTRIBUTE_PATTERN.finditer(tag_text):
+            group = _value_span(match)
+            attributes[match.group(1).lower()] = match.group(group) if group else ""
+        if tag == "base":
+            # Rewritten references are relative to the snapshot, not to the site's base.
+            return _drop_attributes(tag_text, ("href",))
+        if not _is_asset_tag(tag, attributes):
+            return tag_text
+
+        pieces = []
+        position = 0
+        for match in ATTRIBUTE_PATTERN.finditer(tag_text):
+            name = match.group(1).lower()
+            group = _value_span(match)
+            if group is None or (name not in URL_ATTRIBUTES and name not in SRCSET_ATTRIBUTES):
+                continue
+            value = match.group(group)
+            if name in SRCSET_ATTRIBUTES:
+                new_value = _rewrite_srcset(value, lambda item: replace(base_url, item))
+            else:
+                new_value = replace(base_url, value)
+            if new_value == value:
+                continue
+            start, end = match.span(group)
+            pieces.append(tag_text[position:start])
+            pieces.append(html.escape(new_value) if group != 4 else new_value)
+            position = end
+        if not pieces:
+            return tag_text
+        pieces.append(tag_text[position:])
+        return _drop_attributes("".join(pieces), SRI_ATTRIBUTES)
+
+    return TAG_PATTERN.sub(rewrite_tag, text)
+
+
+def rewrite_css(text: str, base_url: str, replace) -> str:
+    def rewrite(match):
+        group = _value_span_css(match)
+        if group is None:
+            return match.group(0)
+        value = match.group(group)
+        new_value = replace(base_url, value)
+        if new_value == value:
+            return match.group(0)
+        start, end = match.span(group)
+        offset = match.start()
+        whole = match.group(0)
+        return whole[: start - offset] + new_value + whole[end - offset :]
+
+    return CSS_URL_PATTERN.sub(rewrite, text)
+
+
+def _value_span_css(match):
+    for group in range(1, 6):
+        if match.group(group):
+            return group
+    return None
+
+
+def page_base(page_url: str, text: str) -> str:
+    for tag_match in TAG_PATTERN.finditer(text):
+        if tag_match.group(1).lower() != "base":
+            continue
+        for match in ATTRIBUTE_PATTERN.finditer(tag_match.group(0)):
+            group = _value_span(match)
+            if match.group(1).lower() == "href" and group:
+                return urljoin(page_url, html.unescape(match.group(group)))
+    return page_url
+
+
+def rewrite_html(text: str, page_url: str, replace) -> str:
+    base_url = page_base(page_url, text)
+    text = _rewrite_tags(text, base_url, replace)
+
+    def rewrite_style(match):
+        return match.group(1) + rewrite_css(match.group(2), base_url, replace) + match.group(3)
+
+    return STYLE_PATTERN.sub(rewrite_style, text)
+
+
+def _collect(rewrite, text: str, url: str) -> set:
+    found = set()
+
+    def collect(base_url: str, value: str) -> str:
+        resolved = _resolve(base_url, value)
+        if resolved is not None:
+            found.add(resolved)
+        return value
+
+    rewrite(text, url, collect)
+    return found
+
+
+def html_assets(text: str, page_url: str) -> set:
+    return _collect(rewrite_html, text, page_url)
+
+
+def css_assets(text: str, css_url: str) -> set:
+    return _collect(rewrite_css, text, css_url)
+
+
+def _extension(url: str, content_type: str) -> str:
+    extension = posixpath.splitext(urlparse(url).path)[1].lower()
+    if re.fullmatch(r"\.[a-z0-9]{1,5}", extension):
+        return extension
+    mime = (content_type or "").split(";", 1)[0].strip()
+    if mime == "text/css":
+        return ".css"
+    return mimetypes.guess_extension(mime) or ""
+
+
+def _is_css(url: str, content_type: str) -> bool:
+    return "text/css" in (content_type or "") or urlparse(url).path.lower().endswith(".css")
+
+
+class AssetCache:
+    def __init__(
+        self, directory: str, replay_base: str = None, timeout: float = TIMEOUT_SECONDS
+    ) -> None:
+        self.directory = directory
+        self.replay_base = replay_base
+        self.timeout = timeout
+        self.index = {}
+        self.failed = set()
+        self.fetched = 0
+        self.fetched_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, ASSET_INDEX_FILENAME)
+        if os.path.exists(self.index_path):
+            self._load()
+        self._journal = open(self.index_path, "a", encoding="utf-8")
+
+    def _load(self) -> None:
+        with open(self.index_path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Ignoring corrupt asset record in %s", self.index_path)
+                    continue
+                if os.path.exists(os.path.join(self.directory, record["path"])):
+                    self.index[record["url"]] = record
+
+    def path_for(self, url: str):
+        record = self.index.get(url)
+        return os.path.join(self.directory, record["path"]) if record else None
+
+    def _download(self, url: str):
+        request = urllib.request.Request(
+            replay_url(self.replay_base, url), headers={"User-Agent": USER_AGENT}
+        )
+        try:
+            with stage("asset_fetch"):
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    body = response.read(MAX_ASSET_BYTES + 1)
+                    content_type = response.headers.get("Content-Type", "")
+        except (urllib.error.URLError, OSError, ValueError) as exc:
+            logging.warning("Asset fetch failed for %s: %s", url, exc)
+            return None
+        if len(body) > MAX_ASSET_BYTES:
+            logging.warning("Skipping oversized asset: %s", url)
+            return None
+        return body, content_type
+
+    def _store(self, url: str, body: bytes, content_type: str) -> None:
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        relative = posixpath.join(digest[:2], digest + _extension(url, content_type))
+        path = os.path.join(self.directory, relative)
+        # Identical bytes from any page, site or URL land on the same file.
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with stage("asset_write"), open(temp_path, "wb") as out:
+                out.write(body)
+            os.replace(temp_path, path)
+        record = {
+            "url": url,
+            "path": relative,
+            "size": len(body),
+            "content_type": content_type,
+            "fetched_at": int(time.time()),
+        }
+        with self._lock:
+            self.index[url] = record
+            self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _fetch_one(self, url: str):
+        result = self._download(url)
+        if result is None:
+            with self._lock:
+                self.failed.add(url)
+            return None
+        body, content_type = result
+        with self._lock:
+            self.fetched += 1
+            self.fetched_bytes += len(body)
+        if _is_css(url, content_type):
+            return body.decode("utf-8", errors="replace"), content_type
+        self._store(url, body, content_type)
+        return None
+
+    def fetch(self, urls, workers: int = WORKERS) -> None:
+        pending = sorted(set(urls) - self.index.keys() - self.failed)
+        stylesheets = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asset") as executor:
+            while pending:
+                found = set()
+                for url, stylesheet in zip(pending, executor.map(self._fetch_one, pending)):
+                    if stylesheet is not None:
+                        stylesheets[url] = stylesheet
+                        found.update(css_assets(stylesheet[0], url))
+                pending = sorted(found - self.index.keys() - self.failed - stylesheets.keys())
+        # Stylesheets are stored last, imported ones first, so their url() references can
+        # point at cached files. Every object sits one level below the cache root.
+        replace = self.replacer(os.path.join(self.directory, "_"))
+        for url, (text, content_type) in reversed(list(stylesheets.items())):
+            self._store(url, rewrite_css(text, url, replace).encode("utf-8"), content_type)
+        self._journal.flush()
+
+    def replacer(self, from_directory: str):
+        def replace(base_url: str, value: str) -> str:
+            url = _resolve(base_url, value)
+            path = self.path_for(url) if url is not None else None
+            if path is None:
+                return value
+            return os.path.relpath(path, from_directory).replace(os.sep, "/")
+
+        return replace
+
+    @property
+    def stored_bytes(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name != ASSET_INDEX_FILENAME:
+                    total += os.path.getsize(os.path.join(root, name))
+        return total
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def site_pages(site, root: str = "."):
+    mirror = MirrorSource(root)
+    mirror.load_sites([site])
+    names = set()
+    for url, source in mirror.entries.items():
+        if source[0] == "file":
+            name = os.path.basename(source[1])
+        elif source[0] == "zip":
+            name = posixpath.basename(source[2])
+        else:
+            name = f"{site.slug_for('', url) or 'home'}.html"
+        stem, extension = os.path.splitext(name)
+        index = 2
+        while name in names:
+            name = f"{stem}-{index}{extension}"
+            index += 1
+        names.add(name)
+        yield url, name, mirror.read(source).decode("utf-8", errors="replace")
+
+
+def mirror_site_assets(
+    site, cache: AssetCache, output_root: str, workers: int = WORKERS, root: str = "."
+):
+    pages = list(site_pages(site, root))
+    references = 0
+    wanted = set()
+    with stage("asset_extract"):
+        for url, _, text in pages:
+            found = html_assets(text, url)
+            references += len(found)
+            wanted.update(found)
+    logging.info(
+        "%s: %d pages reference %d assets (%d unique)",
+        site.name,
+        len(pages),
+        references,
+        len(wanted),
+    )
+    cache.fetch(wanted, workers)
+
+    output_dir = os.path.join(output_root, site.name)
+    os.makedirs(output_dir, exist_ok=True)
+    replace = cache.replacer(output_dir)
+    for url, name, text in pages:
+        with stage("asset_rewrite"):
+            rewritten = rewrite_html(text, url, replace)
+        with open(os.path.join(output_dir, name), "w", encoding="utf-8") as out:
+            out.write(rewritten)
+    return len(pages), references, len(wanted)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Mirror page assets into a shared content-addressed cache for offline viewing."
+    )
+    parser.add_argument("--site", action="append", default=[], help="site name (default: all)")
+    parser.add_argument("--root", default=".", help="repository root holding the mirrors")
+    parser.add_argument("--output", default=OFFLINE_ROOT, help="directory for offline snapshots")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="concurrent asset downloads")
+    parser.add_argument("--replay", metavar="URL", help="fetch assets through a replay server")
+    add_profile_argument(parser, "assets")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    try:
+        sites = [SITES[name] for name in args.site] if args.site else list(SITES.values())
+    except KeyError as exc:
+        logging.error("Unknown site: %s", exc.args[0])
+        return 2
+
+    cache = AssetCache(os.path.join(args.output, ASSETS_DIRNAME), args.replay)
+    started = time.perf_counter()
+    try:
+        with profile_run(args.profile):
+            for site in sites:
+                mirror_site_assets(site, cache, args.output, args.workers, args.root)
+    finally:
+        cache.close()
+    logging.info(
+        "Fetched %d assets (%d bytes) in %.1fs; cache holds %d URLs in %d bytes; %d failed",
+        cache.fetched,
+        cache.fetched_bytes,
+        time.perf_counter() - started,
+        len(cache.index),
+        cache.stored_bytes,
+        len(cache.failed),
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
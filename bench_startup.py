@@ -0,0 +1,105 @@
+import argparse
+import os
+import subprocess
+import sys
+
+
+REPEAT = 5
+FORBIDDEN_MODULES = ("selenium", "undetected_chromedriver", "pandas", "numpy", "pyarrow")
+
+# Cold-start budget per entry point in milliseconds, measured with -X importtime.
+ENTRY_POINTS = {
+    "scraper": 60,
+    "scraper_pipedrive": 60,
+    "scraper_digital": 60,
+    "scraper_familyoffice": 60,
+    "scraper_fantezii": 60,
+    "scraper_fantezii_articles": 60,
+    "sites": 80,
+    "dom_extract": 40,
+    "frontier": 40,
+    "link_check": 150,
+    "link_graph": 40,
+    "link_table": 60,
+    "log_stats": 60,
+    "page_reader": 40,
+    "name_registry": 40,
+    "near_duplicates": 80,
+    "page_ring": 40,
+    "pipeline": 40,
+    "profiling": 40,
+    "storage": 100,
+    "warc_archive": 80,
+    "assets": 150,
+    "browser": 60,
+    "cdp": 120,
+    "catalog": 60,
+    "extract_cache": 60,
+    "download_html": 120,
+    "download_pipedrive": 120,
+    "download_fantezii_articles": 120,
+    "close": 60,
+    "crawl": 200,
+    "replay_server": 150,
+    "revisit": 80,
+    "sitemap_seed": 150,
+    "work_queue": 150,
+}
+
+
+def import_profile(module: str):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+    cumulative = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        name = fields[2].strip()
+        if not fields[1].strip().isdigit():
+            continue
+        imported.add(name.split(".", 1)[0])
+        if name == module:
+            cumulative = int(fields[1]) / 1000
+    return cumulative, imported
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Guard cold-start import time of each entry point.")
+    parser.add_argument("modules", nargs="*", help="entry points to check (default: all)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs per module; best is kept")
+    args = parser.parse_args(argv)
+
+    modules = args.modules or list(ENTRY_POINTS)
+    failures = 0
+    print(f"{'module':28} {'best ms':>9} {'budget':>8}  status")
+    for module in modules:
+        budget = ENTRY_POINTS.get(module)
+        best = None
+        forbidden = set()
+        for _ in range(max(1, args.repeat)):
+            cumulative, imported = import_profile(module)
+            forbidden |= imported.intersection(FORBIDDEN_MODULES)
+            if cumulative is not None and (best is None or cumulative < best):
+                best = cumulative
+        problems = []
+        if forbidden:
+            problems.append("imports " + ", ".join(sorted(forbidden)))
+        if budget is not None and best is not None and best > budget:
+            problems.append("over budget")
+        failures += bool(problems)
+        status = "; ".join(problems) or "ok"
+        budget_label = f"{budget}" if budget is not None else "-"
+        print(f"{module:28} {best or 0:>9.1f} {budget_label:>8}  {status}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import contextlib
+import logging
+import queue
+import threading
+
+from dom_extract import extract_links_in_browser
+from profiling import stage
+
+
+PAGE_LOAD_TIMEOUT = 30
+
+
+def webdriver_exceptions():
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+
+    return TimeoutException, WebDriverException
+
+
+def new_driver(page_load_timeout: int = PAGE_LOAD_TIMEOUT):
+    with stage("driver_start"):
+        import undetected_chromedriver as uc
+
+        driver = uc.Chrome()
+    driver.set_page_load_timeout(page_load_timeout)
+    return driver
+
+
+class DriverPool:
+    def __init__(
+        self,
+        size: int = 1,
+        page_load_timeout: int = PAGE_LOAD_TIMEOUT,
+        replay_base: str = None,
+        factory=new_driver,
+    ) -> None:
+        self.size = max(1, size)
+        self.page_load_timeout = page_load_timeout
+        self.replay_base = replay_base
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def _take(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._drivers) < self.size:
+                driver = self.factory(self.page_load_timeout)
+                self._drivers.append(driver)
+                return driver
+        return self._idle.get()
+
+    def _discard(self, driver) -> None:
+        _, WebDriverException = webdriver_exceptions()
+        with self._lock:
+            if driver in self._drivers:
+                self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except WebDriverException as exc:
+            logging.warning("Error while closing a broken driver: %s", exc)
+
+    def exceptions(self):
+        return webdriver_exceptions()
+
+    @contextlib.contextmanager
+    def acquire(self):
+        driver = self._take()
+        _, WebDriverException = webdriver_exceptions()
+        try:
+            yield driver
+        except WebDriverException:
+            if not is_alive(driver):
+                self._discard(driver)
+                driver = None
+            raise
+        finally:
+            if driver is not None:
+                self._idle.put(driver)
+
+    def close(self) -> None:
+        with self._lock:
+            drivers = list(self._drivers)
+            self._drivers = []
+        if not drivers:
+            return
+        _, WebDriverException = webdriver_exceptions()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except WebDriverException as exc:
+                logging.warning("Error while closing driver: %s", exc)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def is_alive(driver) -> bool:
+    _, WebDriverException = webdriver_exceptions()
+    try:
+        driver.current_url
+    except WebDriverException:
+        return False
+    return True
+
+
+def fetch_page_source(driver, url: str) -> str:
+    with stage("driver_get"):
+        driver.get(url)
+    with stage("page_source"):
+        return driver.page_source
+
+
+def fetch_page_and_url(driver, url: str):
+    html = fetch_page_source(driver, url)
+    return html, driver.current_url
+
+
+def fetch_links(driver, url: str, selector: str, exclude_text_selector: str = None):
+    with stage("driver_get"):
+        driver.get(url)
+    return extract_links_in_browser(driver, selector, exclude_text_selector)
@@ -0,0 +1,364 @@
+import argparse
+import csv
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+from profiling import add_profile_argument, profile_run, stage
+
+
+CATALOG_PATH = "crawl_catalog.db"
+BATCH_SIZE = 1000
+DAY_SECONDS = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    host TEXT NOT NULL,
+    site_id INTEGER REFERENCES sites (id),
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    url_id INTEGER NOT NULL REFERENCES urls (id),
+    fetched_at REAL NOT NULL,
+    status INTEGER NOT NULL,
+    latency_ms REAL,
+    size INTEGER,
+    content_hash TEXT,
+    changed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS links (
+    id INTEGER PRIMARY KEY,
+    site_id INTEGER NOT NULL REFERENCES sites (id),
+    source_id INTEGER REFERENCES urls (id),
+    target_id INTEGER NOT NULL REFERENCES urls (id),
+    link_text TEXT,
+    fetch_time TEXT,
+    extracted_at REAL NOT NULL,
+    run_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS urls_site ON urls (site_id);
+CREATE INDEX IF NOT EXISTS urls_host ON urls (host);
+CREATE INDEX IF NOT EXISTS captures_url ON captures (url_id, fetched_at);
+CREATE INDEX IF NOT EXISTS captures_time ON captures (fetched_at);
+CREATE INDEX IF NOT EXISTS captures_changed ON captures (fetched_at, url_id) WHERE changed = 1;
+CREATE INDEX IF NOT EXISTS links_run ON links (site_id, run_id);
+CREATE INDEX IF NOT EXISTS links_time ON links (site_id, extracted_at);
+CREATE INDEX IF NOT EXISTS links_target ON links (target_id);
+
+CREATE VIEW IF NOT EXISTS link_table AS
+SELECT
+    l.link_text AS link_text,
+    t.url AS full_url,
+    t.host AS host,
+    COALESCE(s.url, '') AS source_page,
+    si.name AS site,
+    l.fetch_time AS fetch_time,
+    l.run_id AS run_id
+FROM links l
+JOIN urls t ON t.id = l.target_id
+LEFT JOIN urls s ON s.id = l.source_id
+JOIN sites si ON si.id = l.site_id;
+
+CREATE VIEW IF NOT EXISTS latest_link_table AS
+SELECT lt.*
+FROM link_table lt
+WHERE lt.run_id = (
+    SELECT l.run_id FROM links l JOIN sites si ON si.id = l.site_id
+    WHERE si.name = lt.site ORDER BY l.extracted_at DESC, l.id DESC LIMIT 1
+);
+
+CREATE VIEW IF NOT EXISTS capture_history AS
+SELECT
+    si.name AS site,
+    u.url AS url,
+    u.host AS host,
+    c.fetched_at AS fetched_at,
+    c.status AS status,
+    c.latency_ms AS latency_ms,
+    c.size AS size,
+    c.content_hash AS content_hash,
+    c.changed AS changed
+FROM captures c
+JOIN urls u ON u.id = c.url_id
+LEFT JOIN sites si ON si.id = u.site_id;
+"""
+
+URL_UPSERT = (
+    "INSERT INTO urls (url, host, site_id, first_seen, last_seen)"
+    " VALUES (?, ?, (SELECT id FROM sites WHERE name = ?), ?, ?)"
+    " ON CONFLICT (url) DO UPDATE SET last_seen = excluded.last_seen,"
+    " site_id = COALESCE(urls.site_id, excluded.site_id)"
+)
+CAPTURE_INSERT = (
+    "INSERT INTO captures (url_id, fetched_at, status, latency_ms, size, content_hash, changed)"
+    " SELECT u.id, ?, ?, ?, ?, ?,"
+    " COALESCE((SELECT p.content_hash != ? FROM captures p WHERE p.url_id = u.id"
+    " AND p.content_hash IS NOT NULL ORDER BY p.fetched_at DESC LIMIT 1), 0)"
+    " FROM urls u WHERE u.url = ?"
+)
+LINK_INSERT = (
+    "INSERT INTO links (site_id, source_id, target_id, link_text, fetch_time, extracted_at, run_id)"
+    " VALUES ((SELECT id FROM sites WHERE name = ?), (SELECT id FROM urls WHERE url = ?),"
+    " (SELECT id FROM urls WHERE url = ?), ?, ?, ?, ?)"
+)
+
+
+def parse_since(value: str) -> float:
+    units = {"m": 60, "h": 3600, "d": DAY_SECONDS, "w": 7 * DAY_SECONDS}
+    if value and value[-1] in units and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * units[value[-1]]
+    return datetime.fromisoformat(value).timestamp()
+
+
+class Catalog:
+    def __init__(self, path: str = CATALOG_PATH, batch_size: int = BATCH_SIZE) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._sites = set()
+        self._urls = []
+        self._captures = []
+        self._links = []
+
+    def _transaction(self, function):
+        with stage("catalog"):
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def _pending(self) -> int:
+        return len(self._urls) + len(self._captures) + len(self._links)
+
+    def _url(self, url: str, site: str, seen_at: float) -> None:
+        self._urls.append((url, urlparse(url).netloc.lower(), site, seen_at, seen_at))
+
+    def record_link(
+        self,
+        site: str,
+        full_url: str,
+        link_text: str = "",
+        source_page: str = "",
+        fetch_time: str = None,
+        run_id: str = "",
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._sites.add(site)
+            self._url(full_url, site, now)
+            if "://" in (source_page or ""):
+                self._url(source_page, site, now)
+            self._links.append((site, source_page, full_url, link_text, fetch_time, now, run_id))
+            if self._pending() >= self.batch_size:
+                self._flush()
+
+    def record_capture(
+        self,
+        site: str,
+        url: str,
+        status: int = 200,
+        latency_ms: float = None,
+        size: int = None,
+        content_hash: str = None,
+        fetched_at: float = None,
+    ) -> None:
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self._lock:
+            if site:
+                self._sites.add(site)
+            self._url(url, site, fetched_at)
+            self._captures.append(
+                (fetched_at, status, latency_ms, size, content_hash, content_hash, url)
+            )
+            if self._pending() >= self.batch_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending() and not self._sites:
+            return
+        sites = [(name,) for name in self._sites]
+        urls, captures, links = self._urls, self._captures, self._links
+
+        def insert(db):
+            db.executemany("INSERT OR IGNORE INTO sites (name) VALUES (?)", sites)
+            db.executemany(URL_UPSERT, urls)
+            db.executemany(CAPTURE_INSERT, captures)
+            db.executemany(LINK_INSERT, links)
+
+        self._transaction(insert)
+        self._sites = set()
+        self._urls, self._captures, self._links = [], [], []
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def query(self, sql: str, params=()):
+        with self._lock, stage("catalog"):
+            self._flush()
+            cursor = self._db.execute(sql, params)
+            columns = [description[0] for description in cursor.description or ()]
+            return columns, cursor.fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is None:
+                return
+            self._flush()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_catalog(path: str = CATALOG_PATH):
+    return Catalog(path) if path else None
+
+
+def latest_run_id(catalog: Catalog, site: str):
+    _, rows = catalog.query(
+        "SELECT l.run_id FROM links l JOIN sites si ON si.id = l.site_id WHERE si.name = ?"
+        " ORDER BY l.extracted_at DESC LIMIT 1",
+        (site,),
+    )
+    return rows[0][0] if rows else None
+
+
+def export_link_table(catalog: Catalog, site: str, path: str, columns, run_id: str = None) -> int:
+    run_id = run_id or latest_run_id(catalog, site)
+    names, rows = catalog.query(
+        "SELECT * FROM link_table WHERE site = ? AND run_id = ? ORDER BY rowid", (site, run_id)
+    )
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        for row in rows:
+            record = dict(zip(names, row))
+            record["post_url"] = record["full_url"]
+            writer.writerow([record[name] for name in columns])
+    return len(rows)
+
+
+QUERIES = {
+    "changed": (
+        "pages whose content changed",
+        "SELECT si.name AS site, u.url, COUNT(*) AS changes,"
+        " datetime(MAX(c.fetched_at), 'unixepoch') AS last_change"
+        " FROM captures c JOIN urls u ON u.id = c.url_id LEFT JOIN sites si ON si.id = u.site_id"
+        " WHERE c.changed = 1 AND c.fetched_at >= :since AND (:site IS NULL OR si.name = :site)"
+        " GROUP BY u.id ORDER BY last_change DESC LIMIT :limit",
+    ),
+    "slow-hosts": (
+        "hosts by mean fetch latency",
+        "SELECT u.host, COUNT(*) AS captures, ROUND(AVG(c.latency_ms), 1) AS mean_ms,"
+        " ROUND(MAX(c.latency_ms), 1) AS max_ms"
+        " FROM captures c JOIN urls u ON u.id = c.url_id LEFT JOIN sites si ON si.id = u.site_id"
+        " WHERE c.fetched_at >= :since AND c.latency_ms IS NOT NULL"
+        " AND (:site IS NULL OR si.name = :site)"
+        " GROUP BY u.host ORDER BY mean_ms DESC LIMIT :limit",
+    ),
+    "errors": (
+        "hosts by failed fetches",
+        "SELECT u.host, SUM(c.status = 0 OR c.status >= 400) AS errors, COUNT(*) AS captures,"
+        " ROUND(100.0 * SUM(c.status = 0 OR c.status >= 400) / COUNT(*), 2) AS error_pct"
+        " FROM captures c JOIN urls u ON u.id = c.url_id LEFT JOIN sites si ON si.id = u.site_id"
+        " WHERE c.fetched_at >= :since AND (:site IS NULL OR si.name = :site)"
+        " GROUP BY u.host HAVING errors > 0 ORDER BY errors DESC LIMIT :limit",
+    ),
+    "stale": (
+        "URLs not captured since the given time",
+        "SELECT si.name AS site, u.url, datetime(MAX(c.fetched_at), 'unixepoch') AS last_capture"
+        " FROM urls u LEFT JOIN captures c ON c.url_id = u.id LEFT JOIN sites si ON si.id = u.site_id"
+        " WHERE (:site IS NULL OR si.name = :site)"
+        " GROUP BY u.id HAVING MAX(c.fetched_at) IS NULL OR MAX(c.fetched_at) < :since"
+        " ORDER BY last_capture LIMIT :limit",
+    ),
+    "sites": (
+        "URL, capture and link counts per site",
+        "SELECT si.name AS site,"
+        " (SELECT COUNT(*) FROM urls u WHERE u.site_id = si.id) AS urls,"
+        " (SELECT COUNT(*) FROM captures c JOIN urls u ON u.id = c.url_id"
+        " WHERE u.site_id = si.id AND c.fetched_at >= :since) AS captures,"
+        " (SELECT COUNT(*) FROM links l WHERE l.site_id = si.id) AS links"
+        " FROM sites si WHERE (:site IS NULL OR si.name = :site) ORDER BY si.name LIMIT :limit",
+    ),
+}
+
+
+def print_rows(columns, rows) -> None:
+    widths = [len(name) for name in columns]
+    text_rows = [["" if value is None else str(value) for value in row] for row in rows]
+    for row in text_rows:
+        widths = [max(width, len(value)) for width, value in zip(widths, row)]
+    print("  ".join(name.ljust(width) for name, width in zip(columns, widths)))
+    for row in text_rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Query the crawl catalog.")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="SQLite catalog path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, (description, _) in QUERIES.items():
+        query_parser = commands.add_parser(name, help=description)
+        query_parser.add_argument("--site", help="limit to one site")
+        query_parser.add_argument(
+            "--since", default="7d", help="age like 30m, 12h, 7d, 2w or an ISO timestamp"
+        )
+        query_parser.add_argument("--limit", type=int, default=20)
+    sql_parser = commands.add_parser("sql", help="run a read-only SQL statement")
+    sql_parser.add_argument("statement")
+    export_parser = commands.add_parser("export", help="write a site's link table view to CSV")
+    export_parser.add_argument("--site", required=True)
+    export_parser.add_argument("--output", required=True)
+    export_parser.add_argument("--run-id", help="export this run instead of the latest one")
+    export_parser.add_argument(
+        "--columns", default="link_text,full_url", help="comma-separated CSV columns"
+    )
+    add_profile_argument(parser, "catalog")
+    args = parser.parse_args(argv)
+
+    with profile_run(args.profile), Catalog(args.catalog) as catalog:
+        started = time.perf_counter()
+        if args.command == "export":
+            columns = args.columns.split(",")
+            count = export_link_table(catalog, args.site, args.output, columns, args.run_id)
+            print(f"Wrote {count} rows to {args.output}")
+            return 0
+        if args.command == "sql":
+            catalog._db.execute("PRAGMA query_only = ON")
+            columns, rows = catalog.query(args.statement)
+        else:
+            params = {"site": args.site, "since": parse_since(args.since), "limit": args.limit}
+            columns, rows = catalog.query(QUERIES[args.command][1], params)
+        print_rows(columns, rows)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"({len(rows)} rows in {elapsed:.1f} ms)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
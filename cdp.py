@@ -0,0 +1,484 @@
+import asyncio
+import base64
+import contextlib
+import hashlib
+import itertools
+import json
+import logging
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+from profiling import stage
+
+
+TABS = 4
+PAGE_LOAD_TIMEOUT = 30
+COMMAND_TIMEOUT = 30
+LAUNCH_TIMEOUT = 30
+# Renderers grow over long runs; a fresh target every N pages keeps that bounded.
+RECYCLE_AFTER = 50
+CHROME_BINARIES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+CHROME_FLAGS = [
+    "--no-first-run",
+    "--no-default-browser-check",
+    # Background tabs are throttled by default, which would serialise the K tabs.
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+PAGE_SOURCE_SCRIPT = "document.documentElement ? document.documentElement.outerHTML : ''"
+
+
+class CdpError(Exception):
+    pass
+
+
+class CdpTimeout(CdpError):
+    pass
+
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    repeated = (key * (len(payload) // 4 + 1))[: len(payload)]
+    masked = int.from_bytes(payload, "little") ^ int.from_bytes(repeated, "little")
+    return masked.to_bytes(len(payload), "little")
+
+
+class WebSocket:
+    def __init__(self, reader, writer) -> None:
+        self.reader = reader
+        self.writer = writer
+        self._send_lock = asyncio.Lock()
+
+    async def _send_frame(self, opcode: int, payload: bytes) -> None:
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        key = os.urandom(4)
+        async with self._send_lock:
+            self.writer.write(header + key + _mask(payload, key))
+            await self.writer.drain()
+
+    async def send(self, text: str) -> None:
+        await self._send_frame(0x1, text.encode("utf-8"))
+
+    async def recv(self) -> str:
+        parts = []
+        while True:
+            first, second = await self.reader.readexactly(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", await self.reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", await self.reader.readexactly(8))
+            key = await self.reader.readexactly(4) if second & 0x80 else None
+            payload = await self.reader.readexactly(length)
+            if key is not None:
+                payload = _mask(payload, key)
+            if opcode == 0x8:
+                raise ConnectionResetError("websocket closed by the browser")
+            if opcode == 0x9:
+                await self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            parts.append(payload)
+            if first & 0x80:
+                return b"".join(parts).decode("utf-8")
+
+    async def close(self) -> None:
+        with contextlib.suppress(OSError):
+            await self._send_frame(0x8, struct.pack("!H", 1000))
+        self.writer.close()
+
+
+async def open_websocket(url: str) -> WebSocket:
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    request = (
+        f"GET {parts.path or '/'} HTTP/1.1\r\n"
+        f"Host: {parts.netloc}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n\r\n"
+    )
+    writer.write(request.encode("latin-1"))
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    expected = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest())
+    if b" 101 " not in status_line or headers.get("sec-websocket-accept") != expected.decode("ascii"):
+        writer.close()
+        raise CdpError(f"websocket handshake failed: {status_line.decode('latin-1').strip()}")
+    return WebSocket(reader, writer)
+
+
+class CdpConnection:
+    def __init__(self, socket: WebSocket) -> None:
+        self.socket = socket
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._waiters = {}
+        self._reader = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                message = json.loads(await self.socket.recv())
+                if "id" in message:
+                    future = self._pending.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CdpError(message["error"].get("message", "CDP error")))
+                    else:
+                        future.set_result(message.get("result", {}))
+                    continue
+                key = (message.get("sessionId"), message.get("method"))
+                for future in self._waiters.pop(key, ()):
+                    if not future.done():
+                        future.set_result(message.get("params", {}))
+        except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+            reason = str(exc) or type(exc).__name__
+        finally:
+            self.closed = True
+        error = CdpError(f"browser connection lost: {reason}")
+        for future in itertools.chain(self._pending.values(), *self._waiters.values()):
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        self._waiters.clear()
+
+    async def call(
+        self, method: str, params: dict = None, session_id: str = None, timeout: float = COMMAND_TIMEOUT
+    ):
+        if self.closed:
+            raise CdpError("browser connection lost")
+        message_id = next(self._ids)
+        future = self._pending[message_id] = asyncio.get_running_loop().create_future()
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id is not None:
+            message["sessionId"] = session_id
+        try:
+            await self.socket.send(json.dumps(message))
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise CdpTimeout(f"{method} timed out after {timeout:.0f}s") from None
+        except OSError as exc:
+            raise CdpError(f"browser connection lost: {exc}") from exc
+        finally:
+            self._pending.pop(message_id, None)
+
+    def expect(self, session_id: str, method: str):
+        # Register before sending the command that triggers the event so it cannot be missed.
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault((session_id, method), []).append(future)
+        return future
+
+    def forget(self, session_id: str, method: str, future) -> None:
+        if not future.cancel() and not future.cancelled():
+            future.exception()
+        waiters = self._waiters.get((session_id, method))
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiters[(session_id, method)]
+
+    async def close(self) -> None:
+        await self.socket.close()
+        with contextlib.suppress(Exception):
+            await self._reader
+
+
+class Tab:
+    def __init__(self, connection: CdpConnection, target_id: str, session_id: str) -> None:
+        self.connection = connection
+        self.target_id = target_id
+        self.session_id = session_id
+        self.uses = 0
+
+    async def call(self, method: str, params: dict = None, timeout: float = COMMAND_TIMEOUT):
+        return await self.connection.call(method, params, self.session_id, timeout)
+
+    async def navigate(self, url: str, timeout: float = PAGE_LOAD_TIMEOUT) -> None:
+        self.uses += 1
+        ready = self.connection.expect(self.session_id, "Page.domContentEventFired")
+        try:
+            result = await self.call("Page.navigate", {"url": url}, timeout)
+            if result.get("errorText"):
+                raise CdpError(f"{result['errorText']} while loading {url}")
+            if not result.get("loaderId"):
+                # Same-document navigation: there is no new DOMContentLoaded to wait for.
+                return
+            try:
+                await asyncio.wait_for(ready, timeout)
+            except asyncio.TimeoutError:
+                with contextlib.suppress(CdpError):
+                    await self.call("Page.stopLoading")
+                raise CdpTimeout(f"Timed out after {timeout:.0f}s waiting for {url}") from None
+        finally:
+            self.connection.forget(self.session_id, "Page.domContentEventFired", ready)
+
+    async def evaluate(self, expression: str):
+        result = await self.call(
+            "Runtime.evaluate", {"expression": expression, "returnByValue": True, "awaitPromise": True}
+        )
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            description = details.get("exception", {}).get("description") or details.get("text")
+            raise CdpError(f"script error: {description}")
+        return result.get("result", {}).get("value")
+
+    async def snapshot(self):
+        # One round trip for both, as fetch_page_and_url needs them together.
+        value = await self.evaluate(f"JSON.stringify([location.href, {PAGE_SOURCE_SCRIPT}])")
+        current_url, html = json.loads(value)
+        return html, current_url
+
+
+async def open_tab(connection: CdpConnection) -> Tab:
+    target = await connection.call("Target.createTarget", {"url": "about:blank"})
+    attached = await connection.call(
+        "Target.attachToTarget", {"targetId": target["targetId"], "flatten": True}
+    )
+    tab = Tab(connection, target["targetId"], attached["sessionId"])
+    await tab.call("Page.enable")
+    return tab
+
+
+async def close_tab(tab: Tab) -> None:
+    with contextlib.suppress(CdpError):
+        await tab.connection.call("Target.closeTarget", {"targetId": tab.target_id})
+
+
+def find_chrome() -> str:
+    binary = os.environ.get("CHROME_BINARY")
+    if binary:
+        return binary
+    for name in CHROME_BINARIES:
+        binary = shutil.which(name)
+        if binary:
+            return binary
+    raise CdpError("Chrome not found; set CHROME_BINARY")
+
+
+class ChromeProcess:
+    def __init__(self, process, profile_dir: str, websocket_url: str) -> None:
+        self.process = process
+        self.profile_dir = profile_dir
+        self.websocket_url = websocket_url
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+async def launch_chrome(headless: bool = False, binary: str = None) -> ChromeProcess:
+    profile_dir = tempfile.mkdtemp(prefix="cdp-profile-")
+    command = [binary or find_chrome(), "--remote-debugging-port=0", f"--user-data-dir={profile_dir}"]
+    command += CHROME_FLAGS + (["--headless=new"] if headless else []) + ["about:blank"]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    chrome = ChromeProcess(process, profile_dir, None)
+    # Chrome writes the port it picked and the browser endpoint path once it is listening.
+    port_file = os.path.join(profile_dir, "DevToolsActivePort")
+    deadline = time.monotonic() + LAUNCH_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            chrome.close()
+            raise CdpError(f"Chrome exited with status {process.returncode}")
+        try:
+            with open(port_file, "r", encoding="utf-8") as handle:
+                lines = handle.read().split()
+        except FileNotFoundError:
+            lines = []
+        if len(lines) >= 2:
+            chrome.websocket_url = f"ws://127.0.0.1:{lines[0]}{lines[1]}"
+            return chrome
+        await asyncio.sleep(0.05)
+    chrome.close()
+    raise CdpError(f"Chrome did not open a DevTools port within {LAUNCH_TIMEOUT}s")
+
+
+class TabDriver:
+    def __init__(self, pool, tab: Tab) -> None:
+        self.pool = pool
+        self.tab = tab
+        self._snapshot = None
+
+    def set_page_load_timeout(self, timeout: float) -> None:
+        self.pool.page_load_timeout = timeout
+
+    def get(self, url: str) -> None:
+        self._snapshot = None
+        self.pool.run(self.tab.navigate(url, self.pool.page_load_timeout))
+
+    def _page(self):
+        if self._snapshot is None:
+            self._snapshot = self.pool.run(self.tab.snapshot())
+        return self._snapshot
+
+    @property
+    def page_source(self) -> str:
+        return self._page()[0]
+
+    @property
+    def current_url(self) -> str:
+        return self._page()[1]
+
+    def execute_script(self, script: str):
+        return self.pool.run(self.tab.evaluate(f"(() => {{{script}\n}})()"))
+
+
+class TabPool:
+    def __init__(
+        self,
+        size: int = TABS,
+        page_load_timeout: int = PAGE_LOAD_TIMEOUT,
+        replay_base: str = None,
+        recycle_after: int = RECYCLE_AFTER,
+        launcher=launch_chrome,
+    ) -> None:
+        self.size = max(1, size)
+        self.page_load_timeout = page_load_timeout
+        self.replay_base = replay_base
+        self.recycle_after = recycle_after
+        self.launcher = launcher
+        self.opened = 0
+        self.recycled = 0
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._browser = None
+        self._connection = None
+        self._browser_lock = None
+
+    def exceptions(self):
+        return CdpTimeout, CdpError
+
+    def run(self, coroutine):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name="cdp", daemon=True
+                )
+                self._thread.start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _connect(self) -> CdpConnection:
+        if self._browser_lock is None:
+            self._browser_lock = asyncio.Lock()
+        async with self._browser_lock:
+            if self._connection is None or self._connection.closed:
+                if self._connection is not None:
+                    logging.warning("Browser connection lost; relaunching")
+                    await self._connection.close()
+                if self._browser is not None:
+                    self._browser.close()
+                with stage("driver_start"):
+                    self._browser = await self.launcher()
+                    try:
+                        socket = await open_websocket(self._browser.websocket_url)
+                    except OSError as exc:
+                        raise CdpError(f"cannot reach the browser: {exc}") from exc
+                    self._connection = CdpConnection(socket)
+            return self._connection
+
+    async def _open_tab(self) -> Tab:
+        tab = await open_tab(await self._connect())
+        self.opened += 1
+        return tab
+
+    def _take(self) -> Tab:
+        while True:
+            try:
+                tab = self._idle.get_nowait()
+            except queue.Empty:
+                return self.run(self._open_tab())
+            if not tab.connection.closed:
+                return tab
+
+    def _discard(self, tab: Tab) -> None:
+        if not tab.connection.closed:
+            self.run(close_tab(tab))
+
+    @contextlib.contextmanager
+    def acquire(self):
+        self._slots.acquire()
+        tab = None
+        try:
+            tab = self._take()
+            yield TabDriver(self, tab)
+        except CdpError:
+            # A tab that failed mid-load may be wedged; start the next fetch on a fresh one.
+            if tab is not None:
+                self._discard(tab)
+                tab = None
+            raise
+        finally:
+            if tab is not None:
+                if tab.uses >= self.recycle_after:
+                    self.recycled += 1
+                    self._discard(tab)
+                else:
+                    self._idle.put(tab)
+            self._slots.release()
+
+    async def _shutdown(self) -> None:
+        if self._connection is not None:
+            if not self._connection.closed:
+                with contextlib.suppress(CdpError):
+                    await self._connection.call("Browser.close", timeout=5)
+            await self._connection.close()
+            self._connection = None
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+        if self._browser is not None:
+            self._browser.close()
+            self._browser = None
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        logging.info("Closed browser after opening %d tabs (%d recycled)", self.opened, self.recycled)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
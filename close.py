@@ -1,14 +1,21 @@
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import time
-import pandas as pd
-import numpy as np
-import undetected_chromedriver as uc
-driver = uc.Chrome()
-driver.get("https://fanteziigreieriprostii.ro/")
-# save html page of this url
-with open("fanteziigreieriprostii.html", "w", encoding="utf-8") as f:
-    f.write(driver.page_source)
+from browser import fetch_page_source, new_driver
+from profiling import run_profiled
+
+
+URL = "https://fanteziigreieriprostii.ro/"
+OUTPUT_HTML = "fanteziigreieriprostii.html"
+
+
+def main() -> None:
+    driver = new_driver()
+    try:
+        html_text = fetch_page_source(driver, URL)
+    finally:
+        driver.quit()
+    # save html page of this url
+    with open(OUTPUT_HTML, "w", encoding="utf-8") as f:
+        f.write(html_text)
+
+
+if __name__ == "__main__":
+    run_profiled(main, "close")
@@ -0,0 +1,777 @@
+import argparse
+import functools
+import itertools
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timezone
+
+from assets import ASSETS_DIRNAME, OFFLINE_ROOT, WORKERS, AssetCache, mirror_site_assets
+from browser import DriverPool, fetch_links, fetch_page_and_url, fetch_page_source
+from catalog import CATALOG_PATH, open_catalog
+from cdp import RECYCLE_AFTER, TabPool, launch_chrome
+from frontier import add_memory_arguments, url_set_from_args
+from link_check import add_check_arguments, check_sites
+from link_graph import EdgeWriter, graph_path, page_links
+from link_table import (
+    LinkTableWriter,
+    columnar_path,
+    count_link_rows,
+    find_link_table,
+    read_link_rows,
+    utc_now,
+)
+from name_registry import legacy_links
+from page_reader import file_chunks
+from pipeline import (
+    RateLimiter,
+    canonicalize_url,
+    is_valid_url,
+    prefetch,
+    progress_label,
+    work_items,
+)
+from profiling import add_profile_argument, profile_run
+from replay_server import original_url, replay_url
+from revisit import plan_revisits
+from sitemap_seed import RobotsCache, SitemapState, seed_urls
+from sites import SITES, get_site
+from storage import STORAGE_BACKENDS, open_storage
+from work_queue import DEFAULT_MAX_ATTEMPTS, DEFAULT_VISIBILITY_TIMEOUT, open_queue
+
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+ENQUEUE_BATCH_SIZE = 1000
+IDLE_POLL_SECONDS = 5
+
+_fetched_lock = threading.Lock()
+
+
+def site_logger(site) -> logging.Logger:
+    logger = logging.getLogger(f"crawl.{site.name}")
+    if not logger.handlers:
+        handler = logging.FileHandler(site.log_path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(handler)
+    return logger
+
+
+def fetch(pool: DriverPool, limiter: RateLimiter, logger, url: str, read=fetch_page_source):
+    TimeoutException, WebDriverException = pool.exceptions()
+    limiter.wait()
+    try:
+        with pool.acquire() as driver:
+            return read(driver, replay_url(pool.replay_base, url))
+    except TimeoutException:
+        logger.error("Timeout while downloading: %s", url)
+    except WebDriverException as exc:
+        logger.error("WebDriver error for %s: %s", url, exc)
+    return None
+
+
+def read_links_in_browser(site):
+    def read(driver, url: str):
+        return fetch_links(driver, url, site.link_selector, site.exclude_text_selector)
+
+    return read
+
+
+def parse_seed(site, page_url: str, html_text: str):
+    if not site.filter_links:
+        return site.extract(html_text), []
+    page = page_links(site, page_url, html_text)
+    return site.filter_links(page.collected()), page.graph_edges()
+
+
+def seed_links(site, pool: DriverPool, limiter: RateLimiter, logger, refresh: bool, archive: bool):
+    if site.seed_html and os.path.exists(site.seed_html) and not refresh:
+        logger.info("Parsing seed file %s", site.seed_html)
+        html_text = file_chunks(site.seed_html)
+        fetch_time = datetime.fromtimestamp(
+            os.path.getmtime(site.seed_html), timezone.utc
+        ).isoformat(timespec="seconds")
+        yield (site.seed_urls[0], fetch_time, *parse_seed(site, site.seed_urls[0], html_text))
+        return
+
+    for page_url in site.seed_urls:
+        logger.info("Scraping links from %s", page_url)
+        archive_page = archive and site.seed_html and page_url == site.seed_urls[0]
+        if site.link_selector and not archive_page:
+            collected = fetch(pool, limiter, logger, page_url, read_links_in_browser(site))
+            if collected is None:
+                continue
+            yield page_url, utc_now(), site.filter_links(collected), []
+            continue
+        html_text = fetch(pool, limiter, logger, page_url)
+        if html_text is None:
+            continue
+        if archive_page:
+            with open(site.seed_html, "w", encoding="utf-8") as out:
+                out.write(html_text)
+        yield (page_url, utc_now(), *parse_seed(site, page_url, html_text))
+
+
+def scrape_links(
+    site,
+    pool,
+    limiter,
+    logger,
+    refresh: bool,
+    output_format: str,
+    archive: bool = False,
+    link_graph: bool = False,
+    seen_urls=None,
+    catalog=None,
+) -> None:
+    output_path = columnar_path(site.links_csv, output_format)
+    edges = EdgeWriter(graph_path(site)) if link_graph else None
+    seen_urls = set() if seen_urls is None else seen_urls
+    try:
+        with LinkTableWriter(
+            output_path, site.name, csv_columns=list(site.csv_columns), catalog=catalog
+        ) as writer:
+            pages = seed_links(site, pool, limiter, logger, refresh, archive)
+            for page_url, fetch_time, links, page_edges in pages:
+                for text, url in links:
+                    if url in seen_urls:
+                        continue
+                    seen_urls.add(url)
+                    writer.write(text, url, page_url, fetch_time)
+                if edges is not None:
+                    for edge in page_edges:
+                        edges.write(edge, site.name)
+    finally:
+        if edges is not None:
+            edges.close()
+            logger.info("Saved %d link graph edges to %s", edges.count, edges.path)
+    logger.info("Saved %d links to %s", writer.count, output_path)
+
+
+def timed(read, capture_info: dict):
+    def read_timed(driver, url: str):
+        started = time.monotonic()
+        try:
+            return read(driver, url)
+        finally:
+            capture_info["latency_ms"] = (time.monotonic() - started) * 1000
+
+    return read_timed
+
+
+def already_captured(storage, site, url: str, fetched: set, skip_existing: bool) -> bool:
+    with _fetched_lock:
+        if canonicalize_url(url) in fetched:
+            return True
+    return skip_existing and storage.has(site.output_dir, url)
+
+
+def claim_fetched(fetched: set, url: str) -> bool:
+    # --tabs threads share one set; only one of them may store a given landing URL.
+    key = canonicalize_url(url)
+    with _fetched_lock:
+        if key in fetched:
+            return False
+        fetched.add(key)
+        return True
+
+
+def capture(
+    site,
+    pool,
+    storage,
+    limiter,
+    logger,
+    url: str,
+    link_text: str,
+    fetched: set,
+    skip_existing: bool,
+    callback=None,
+) -> bool:
+    target = storage.resolve(site.output_dir, url)
+    if target != url and already_captured(storage, site, target, fetched, skip_existing):
+        logger.info("Skipping known redirect: %s -> %s", url, target)
+        storage.alias(site.output_dir, url, target, logger, callback)
+        return True
+
+    capture_info = {"site": site.name, "fetched_at": time.time()}
+    page = fetch(pool, limiter, logger, target, read=timed(fetch_page_and_url, capture_info))
+    if page is None:
+        if storage.catalog is not None:
+            storage.catalog.record_capture(
+                site.name, target, 0, capture_info.get("latency_ms"), fetched_at=time.time()
+            )
+        return False
+    html, landed = page
+    landed = original_url(pool.replay_base, landed or target)
+    storage.record_redirect(site.output_dir, url, landed)
+    if canonicalize_url(landed) == canonicalize_url(url):
+        landed = url
+    duplicate = not claim_fetched(fetched, landed)
+    if landed != url and (duplicate or (skip_existing and storage.has(site.output_dir, landed))):
+        logger.info("Redirected to an existing capture: %s -> %s", url, landed)
+        storage.alias(site.output_dir, url, landed, logger, callback)
+        return True
+    if duplicate:
+        logger.info("Skipping capture stored by another tab: %s", url)
+        if callback is not None:
+            callback(True)
+        return True
+
+    aliases = [url] if landed != url else []
+    if aliases:
+        logger.info("Redirected: %s -> %s", url, landed)
+    slug = site.slug_for(link_text, url)
+    storage.store(
+        site.output_dir, slug, landed, html, logger, callback, aliases=aliases, capture=capture_info
+    )
+    return True
+
+
+def seed_legacy_names(site, storage, table_path: str) -> None:
+    # Only read if the mirror has no name registry yet and old files have to be adopted.
+    links = legacy_links(read_link_rows(table_path), site.row_link, site.slug_for)
+    storage.seed_legacy_names(site.output_dir, links)
+
+
+def revisit_items(site, storage, logger, table_path: str, budget: int):
+    items = list(work_items(read_link_rows(table_path), extract=site.row_link))
+    history = storage.history(site.output_dir)
+    planned = plan_revisits(
+        items, history, budget, resolve=lambda url: storage.resolve(site.output_dir, url)
+    )
+    logger.info("Revisit budget %d: scheduling %d of %d URLs", budget, len(planned), len(items))
+    return [(position, link_text, url) for position, (_, link_text, url) in enumerate(planned, 1)]
+
+
+def download_site(
+    site,
+    pool,
+    storage,
+    limiter,
+    logger,
+    skip_existing: bool,
+    budget: int = None,
+    new_set=set,
+    concurrency: int = 1,
+) -> None:
+    table_path = find_link_table(site.links_csv)
+    if not os.path.exists(table_path):
+        logger.error("Missing CSV file: %s", table_path)
+        return
+
+    seed_legacy_names(site, storage, table_path)
+    fetched = new_set()
+    if budget is not None:
+        items = revisit_items(site, storage, logger, table_path, budget)
+        total = len(items)
+    else:
+        total = count_link_rows(table_path)
+        rows = read_link_rows(table_path)
+        items = prefetch(work_items(rows, extract=site.row_link, seen=new_set()))
+
+    def download(index: int, link_text: str, url: str) -> None:
+        if not site.owns(url):
+            logger.info("Skipping off-site URL at row %d: %s", index, url)
+            return
+        if skip_existing and storage.has(site.output_dir, url):
+            logger.info("Skipping existing capture: %s", url)
+            return
+        logger.info("Downloading (%s): %s", progress_label(index, total), url)
+        capture(site, pool, storage, limiter, logger, url, link_text, fetched, skip_existing)
+
+    if concurrency <= 1:
+        for item in items:
+            download(*item)
+        return
+    # The rate limiter still spaces out request starts; overlapping page loads is the gain.
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=site.name) as executor:
+        running = set()
+        for item in items:
+            if len(running) >= concurrency:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            running.add(executor.submit(download, *item))
+        for future in as_completed(running):
+            future.result()
+
+
+def site_delay(site, robots, logger) -> float:
+    if robots is None:
+        return site.base_delay
+    crawl_delay = robots.crawl_delay(site.base_url)
+    if crawl_delay is not None and crawl_delay > site.base_delay:
+        logger.info("Using robots.txt crawl-delay of %.1fs for %s", crawl_delay, site.name)
+        return crawl_delay
+    return site.base_delay
+
+
+def run_site(site, pool, storage, robots, args) -> float:
+    logger = site_logger(site)
+    limiter = RateLimiter(site_delay(site, robots, logger), site.jitter)
+    started = time.monotonic()
+    if args.scrape:
+        scrape_links(
+            site,
+            pool,
+            limiter,
+            logger,
+            args.refresh_seeds,
+            args.output_format,
+            args.archive_seeds,
+            args.link_graph,
+            url_set_from_args(args),
+            storage.catalog,
+        )
+    download_site(
+        site,
+        pool,
+        storage,
+        limiter,
+        logger,
+        args.skip_existing,
+        args.budget,
+        lambda: url_set_from_args(args),
+        args.tabs or 1,
+    )
+    return time.monotonic() - started
+
+
+def selected_sites(args):
+    names = list(SITES) if args.all else args.site
+    if not names:
+        logging.error("No sites selected; use --site NAME or --all")
+        return None
+    try:
+        return [get_site(name) for name in dict.fromkeys(names)]
+    except KeyError as exc:
+        logging.error("%s", exc.args[0])
+        return None
+
+
+def browser_pool(args, drivers: int):
+    if not args.tabs:
+        return DriverPool(drivers, replay_base=args.replay)
+    return TabPool(
+        args.tabs,
+        replay_base=args.replay,
+        recycle_after=args.recycle_tabs,
+        launcher=functools.partial(launch_chrome, args.headless),
+    )
+
+
+def run(args) -> int:
+    sites = selected_sites(args)
+    if sites is None:
+        return 2
+
+    robots = None if args.replay or args.ignore_robots else RobotsCache()
+    failures = 0
+    pool = browser_pool(args, args.drivers or len(sites))
+    catalog = open_catalog(args.catalog)
+    storage = open_storage(args.storage, near_duplicate_mode=args.near_duplicates, catalog=catalog)
+    try:
+        with ThreadPoolExecutor(max_workers=len(sites), thread_name_prefix="site") as executor:
+            futures = {executor.submit(run_site, site, pool, storage, robots, args): site for site in sites}
+            for future in as_completed(futures):
+                site = futures[future]
+                try:
+                    elapsed = future.result()
+                except Exception:
+                    failures += 1
+                    logging.exception("Site %s failed", site.name)
+                    continue
+                logging.info("Finished %s in %.1fs", site.name, elapsed)
+    finally:
+        storage.close()
+        pool.close()
+        if catalog is not None:
+            catalog.close()
+    return 1 if failures else 0
+
+
+def merge_sitemap_delta(site, urls, output_path: str, catalog) -> int:
+    # An incremental run only sees changed URLs; the table must keep everything seeded before.
+    delta = {}
+    for url, fetch_time in urls:
+        delta[canonicalize_url(url)] = (url, fetch_time)
+    table_path = find_link_table(site.links_csv)
+    stem, extension = os.path.splitext(output_path)
+    partial_path = f"{stem}.partial{extension}"
+    with LinkTableWriter(
+        partial_path, site.name, csv_columns=list(site.csv_columns), catalog=catalog
+    ) as writer:
+        if os.path.exists(table_path):
+            for row in read_link_rows(table_path):
+                link_text, url = site.row_link(row)
+                changed = delta.pop(canonicalize_url(url), None) if is_valid_url(url) else None
+                if changed is not None:
+                    writer.write(link_text, url, "sitemap", changed[1])
+                else:
+                    writer.write(
+                        link_text,
+                        url,
+                        row.get("source_page") or "",
+                        row.get("fetch_time"),
+                        record_link=False,
+                    )
+        for url, fetch_time in delta.values():
+            writer.write("", url, "sitemap", fetch_time)
+    os.replace(partial_path, output_path)
+    return writer.count
+
+
+def seed(args) -> int:
+    sites = selected_sites(args)
+    if sites is None:
+        return 2
+
+    robots = RobotsCache()
+    state = SitemapState()
+    catalog = open_catalog(args.catalog)
+    try:
+        for site in sites:
+            logger = site_logger(site)
+            since = None if args.full else state.last_run(site.name)
+            started = datetime.now(timezone.utc)
+            if since is not None:
+                logger.info("Seeding %s from sitemaps changed since %s", site.name, since.isoformat())
+            output_path = columnar_path(site.links_csv, args.output_format)
+            urls = seed_urls(
+                site.base_url,
+                robots,
+                since=since,
+                url_pattern=site.sitemap_url_pattern,
+                sitemap_pattern=site.sitemap_index_pattern,
+            )
+            urls = (
+                (url, lastmod.isoformat(timespec="seconds") if lastmod else None)
+                for url, lastmod in urls
+                if site.owns(url)
+            )
+            if since is None:
+                with LinkTableWriter(
+                    output_path, site.name, csv_columns=list(site.csv_columns), catalog=catalog
+                ) as writer:
+                    for url, fetch_time in urls:
+                        writer.write("", url, "sitemap", fetch_time)
+                seeded = writer.count
+            else:
+                seeded = merge_sitemap_delta(site, urls, output_path, catalog)
+            state.mark_run(site.name, started, seeded)
+            logger.info("Saved %d sitemap URLs to %s", seeded, output_path)
+    finally:
+        if catalog is not None:
+            catalog.close()
+    return 0
+
+
+def enqueue(args) -> int:
+    sites = selected_sites(args)
+    if sites is None:
+        return 2
+
+    queue = open_queue(args.queue)
+    try:
+        for site in sites:
+            table_path = find_link_table(site.links_csv)
+            if not os.path.exists(table_path):
+                logging.error("Missing CSV file: %s", table_path)
+                continue
+            items = (
+                (url, {"site": site.name, "link_text": link_text})
+                for _, link_text, url in work_items(read_link_rows(table_path), extract=site.row_link)
+                if site.owns(url)
+            )
+            added = 0
+            while True:
+                batch = list(itertools.islice(items, ENQUEUE_BATCH_SIZE))
+                if not batch:
+                    break
+                added += queue.put(batch)
+            logging.info("Queued %d new URLs for %s", added, site.name)
+    finally:
+        queue.close()
+    return 0
+
+
+def settle(queue, lease, stored: bool) -> None:
+    if stored:
+        queue.ack(lease.url, lease.token)
+    else:
+        queue.nack(lease.url, lease.token)
+
+
+def work(args) -> int:
+    queue = open_queue(args.queue, args.max_attempts)
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    pool = browser_pool(args, args.drivers)
+    catalog = open_catalog(args.catalog)
+    storage = open_storage(args.storage, near_duplicate_mode=args.near_duplicates, catalog=catalog)
+    limiters = {}
+    fetched = url_set_from_args(args)
+    processed = 0
+    logging.info("Worker %s pulling from %s", worker_id, args.queue)
+    try:
+        while True:
+            leases = queue.lease(worker_id, args.batch, args.visibility_timeout)
+            if not leases:
+                pending = queue.stats()
+                if not pending.get("pending") and not pending.get("leased"):
+                    break
+                time.sleep(IDLE_POLL_SECONDS)
+                continue
+            try:
+                processed += work_batch(args, queue, worker_id, leases, pool, storage, limiters, fetched)
+            finally:
+                # Leases this worker never started go back without costing an attempt.
+                for lease in leases:
+                    queue.release(lease.url, lease.token)
+    finally:
+        storage.close()
+        pool.close()
+        queue.close()
+        if catalog is not None:
+            catalog.close()
+    logging.info("Worker %s finished after %d pages", worker_id, processed)
+    return 0
+
+
+def work_batch(args, queue, worker_id: str, leases: list, pool, storage, limiters: dict, fetched) -> int:
+    processed = 0
+    renew_at = time.monotonic() + args.visibility_timeout / 2
+    while leases:
+        if time.monotonic() >= renew_at:
+            # A batch paced by the sites' crawl delay can outlast the visibility timeout.
+            for pending in leases:
+                queue.extend(pending.url, pending.token, args.visibility_timeout)
+            renew_at = time.monotonic() + args.visibility_timeout / 2
+        lease = leases.pop(0)
+        site = get_site(lease.payload["site"])
+        logger = site_logger(site)
+        limiter = limiters.get(site.name)
+        if limiter is None:
+            limiter = limiters[site.name] = RateLimiter(site.base_delay, site.jitter)
+            table_path = find_link_table(site.links_csv)
+            if os.path.exists(table_path):
+                seed_legacy_names(site, storage, table_path)
+        logger.info("Downloading (%s): %s", worker_id, lease.url)
+        stored = capture(
+            site,
+            pool,
+            storage,
+            limiter,
+            logger,
+            lease.url,
+            lease.payload.get("link_text", ""),
+            fetched,
+            skip_existing=False,
+            callback=functools.partial(settle, queue, lease),
+        )
+        if not stored:
+            queue.nack(lease.url, lease.token)
+            continue
+        processed += 1
+    return processed
+
+
+def check(args) -> int:
+    sites = selected_sites(args)
+    if sites is None:
+        return 2
+    return check_sites(sites, args)
+
+
+def mirror_assets(args) -> int:
+    sites = selected_sites(args)
+    if sites is None:
+        return 2
+    cache = AssetCache(os.path.join(args.output, ASSETS_DIRNAME), args.replay)
+    try:
+        for site in sites:
+            pages, _, _ = mirror_site_assets(site, cache, args.output, args.workers)
+            logging.info("Wrote %d offline pages for %s to %s", pages, site.name, args.output)
+    finally:
+        cache.close()
+    logging.info(
+        "Asset cache holds %d URLs in %d bytes; %d failed",
+        len(cache.index),
+        cache.stored_bytes,
+        len(cache.failed),
+    )
+    return 0
+
+
+def list_sites(args) -> int:
+    for site in SITES.values():
+        print(f"{site.name:24} {site.base_url:40} {site.links_csv} -> {site.output_dir}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="crawl", description="Scrape and mirror registered sites.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="download one or more sites concurrently")
+    run_parser.add_argument("--site", action="append", default=[], help="site name (repeatable)")
+    run_parser.add_argument("--all", action="store_true", help="run every registered site")
+    run_parser.add_argument("--scrape", action="store_true", help="rebuild link tables first")
+    run_parser.add_argument(
+        "--refresh-seeds", action="store_true", help="fetch seed pages instead of using saved files"
+    )
+    run_parser.add_argument(
+        "--archive-seeds",
+        action="store_true",
+        help="save the full seed page when refreshing instead of extracting links in the browser",
+    )
+    run_parser.add_argument(
+        "--link-graph",
+        action="store_true",
+        help="also write every anchor of parsed seed pages to the site's link graph CSV",
+    )
+    run_parser.add_argument(
+        "--skip-existing", action="store_true", help="skip URLs already captured in the mirror"
+    )
+    run_parser.add_argument(
+        "--budget",
+        type=int,
+        default=None,
+        help="fetch at most N pages per site, most likely changed first",
+    )
+    run_parser.add_argument("--drivers", type=int, default=0, help="browser pool size")
+    run_parser.add_argument(
+        "--near-duplicates", choices=("mark", "skip", "off"), default="mark"
+    )
+    run_parser.add_argument(
+        "--storage",
+        choices=sorted(STORAGE_BACKENDS),
+        default="files",
+        help="write captures as HTML files or into a WARC file with a CDX index",
+    )
+    run_parser.add_argument(
+        "--output-format", choices=("csv", "parquet", "arrow"), default="csv"
+    )
+    run_parser.add_argument(
+        "--replay",
+        metavar="URL",
+        help="fetch through a replay_server.py instance, e.g. http://127.0.0.1:8765",
+    )
+    run_parser.add_argument(
+        "--ignore-robots", action="store_true", help="do not apply robots.txt crawl-delay"
+    )
+    add_memory_arguments(run_parser)
+    run_parser.set_defaults(handler=run)
+
+    seed_parser = commands.add_parser("seed", help="build link tables from sitemaps")
+    seed_parser.add_argument("--site", action="append", default=[], help="site name (repeatable)")
+    seed_parser.add_argument("--all", action="store_true", help="seed every registered site")
+    seed_parser.add_argument(
+        "--full", action="store_true", help="ignore lastmod and list every sitemap URL"
+    )
+    seed_parser.add_argument(
+        "--output-format", choices=("csv", "parquet", "arrow"), default="csv"
+    )
+    seed_parser.set_defaults(handler=seed)
+
+    enqueue_parser = commands.add_parser("enqueue", help="push link tables onto a work queue")
+    enqueue_parser.add_argument("--site", action="append", default=[], help="site name (repeatable)")
+    enqueue_parser.add_argument("--all", action="store_true", help="queue every registered site")
+    enqueue_parser.add_argument(
+        "--queue", default="crawl_queue.db", help="SQLite path or work_queue.py server URL"
+    )
+    enqueue_parser.set_defaults(handler=enqueue)
+
+    work_parser = commands.add_parser(
+        "work",
+        help="download URLs leased from a work queue",
+        description="Download URLs leased from a work queue. A worker locks each site output"
+        " directory it writes to, so workers sharing a checkout must not share a site.",
+    )
+    work_parser.add_argument(
+        "--queue", default="crawl_queue.db", help="SQLite path or work_queue.py server URL"
+    )
+    work_parser.add_argument("--worker-id", help="defaults to hostname-pid")
+    work_parser.add_argument("--batch", type=int, default=1, help="URLs leased per request")
+    work_parser.add_argument(
+        "--visibility-timeout",
+        type=float,
+        default=DEFAULT_VISIBILITY_TIMEOUT,
+        help="seconds before an unacknowledged lease is handed to another worker",
+    )
+    work_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help="leases per URL before it is marked failed (local SQLite queues)",
+    )
+    work_parser.add_argument("--drivers", type=int, default=1, help="browser pool size")
+    work_parser.add_argument(
+        "--near-duplicates", choices=("mark", "skip", "off"), default="mark"
+    )
+    work_parser.add_argument(
+        "--storage",
+        choices=sorted(STORAGE_BACKENDS),
+        default="files",
+        help="write captures as HTML files or into a WARC file with a CDX index",
+    )
+    work_parser.add_argument("--replay", metavar="URL", help="fetch through a replay server")
+    add_memory_arguments(work_parser)
+    work_parser.set_defaults(handler=work)
+
+    check_parser = commands.add_parser("check", help="check extracted links for errors and redirects")
+    check_parser.add_argument("--site", action="append", default=[], help="site name (repeatable)")
+    check_parser.add_argument("--all", action="store_true", help="check every registered site")
+    check_parser.add_argument("--replay", metavar="URL", help="check through a replay server")
+    add_check_arguments(check_parser)
+    check_parser.set_defaults(handler=check)
+
+    assets_parser = commands.add_parser("assets", help="mirror page assets for offline viewing")
+    assets_parser.add_argument("--site", action="append", default=[], help="site name (repeatable)")
+    assets_parser.add_argument("--all", action="store_true", help="mirror every registered site")
+    assets_parser.add_argument("--output", default=OFFLINE_ROOT, help="directory for offline snapshots")
+    assets_parser.add_argument("--workers", type=int, default=WORKERS, help="concurrent asset downloads")
+    assets_parser.add_argument("--replay", metavar="URL", help="fetch assets through a replay server")
+    assets_parser.set_defaults(handler=mirror_assets)
+
+    sites_parser = commands.add_parser("sites", help="list registered sites")
+    sites_parser.set_defaults(handler=list_sites)
+    for command_parser in (run_parser, work_parser):
+        command_parser.add_argument(
+            "--tabs",
+            type=int,
+            default=0,
+            help="fetch through N tabs of one Chrome over DevTools instead of separate drivers",
+        )
+        command_parser.add_argument(
+            "--recycle-tabs",
+            type=int,
+            default=RECYCLE_AFTER,
+            help="replace a tab after this many pages",
+        )
+        command_parser.add_argument(
+            "--headless", action="store_true", help="run the --tabs browser headless"
+        )
+    for command_parser in (run_parser, seed_parser, work_parser):
+        command_parser.add_argument(
+            "--catalog",
+            default=CATALOG_PATH,
+            help="SQLite catalog to record links and captures in ('' to disable)",
+        )
+    for command_parser in commands.choices.values():
+        add_profile_argument(command_parser, "crawl")
+    return parser
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    args = build_parser().parse_args(argv)
+    with profile_run(args.profile):
+        return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
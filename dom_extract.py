@@ -0,0 +1,52 @@
+import json
+from functools import lru_cache
+
+from profiling import stage
+
+
+LINK_SCRIPT = """
+const containerSelector = %s;
+const excludeSelector = %s;
+const seen = new Set();
+const links = [];
+for (const container of document.querySelectorAll(containerSelector)) {
+    for (const anchor of container.querySelectorAll("a")) {
+        if (seen.has(anchor)) {
+            continue;
+        }
+        seen.add(anchor);
+        let node = anchor;
+        if (excludeSelector) {
+            node = anchor.cloneNode(true);
+            for (const hidden of node.querySelectorAll(excludeSelector)) {
+                hidden.remove();
+            }
+        }
+        const attrs = {};
+        for (const attr of anchor.attributes) {
+            attrs[attr.name] = attr.value;
+        }
+        links.push({text: node.textContent, href: anchor.getAttribute("href"), attrs: attrs});
+    }
+}
+return JSON.stringify(links);
+"""
+
+
+@lru_cache(maxsize=None)
+def link_script(container_selector: str, exclude_text_selector: str = None) -> str:
+    return LINK_SCRIPT % (json.dumps(container_selector), json.dumps(exclude_text_selector or ""))
+
+
+def decode_links(payload):
+    collected = []
+    for item in json.loads(payload or "[]"):
+        text = " ".join((item.get("text") or "").split())
+        collected.append((text, item.get("href"), item.get("attrs") or {}))
+    return collected
+
+
+def extract_links_in_browser(driver, container_selector: str, exclude_text_selector: str = None):
+    with stage("dom_extract"):
+        payload = driver.execute_script(link_script(container_selector, exclude_text_selector))
+    return decode_links(payload)
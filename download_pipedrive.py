@@ -1,4 +1,4 @@
-import csv
+import itertools
 import logging
 import os
 import random
@@ -6,16 +6,36 @@ import re
 import time
 from urllib.parse import urlparse
 
-import undetected_chromedriver as uc
-from selenium.common.exceptions import TimeoutException, WebDriverException
-
-
+from catalog import open_catalog
+from frontier import url_set
+from link_table import count_link_rows, find_link_table, read_link_rows
+from name_registry import NameRegistry, legacy_links, load_registry
+from near_duplicates import is_near_duplicate, load_index
+from pipeline import (
+    BackgroundWriter,
+    prefetch,
+    progress_label,
+    row_link,
+    save_page,
+    work_items,
+)
+from profiling import run_profiled, stage
+from revisit import content_hash
+from warc_archive import WarcArchive, save_capture
+
+
+SITE = "pipedrive"
+CATALOG_PATH = "crawl_catalog.db"
 OUTPUT_DIR = "downloaded_html_articles"
 CSV_PATH = "article_csv.csv"
 LOG_PATH = "download_articles.log"
 BASE_DELAY_SECONDS = 2
 JITTER_SECONDS = 1.5
 PAGE_LOAD_TIMEOUT = 30
+NEAR_DUPLICATE_MODE = "mark"
+ARCHIVE_FORMAT = "html"
+MEMORY_BOUNDED = False
+LINK_FILTERS = None
 
 
 def slugify(value: str) -> str:
@@ -24,35 +44,34 @@ def slugify(value: str) -> str:
     return value.strip("-")
 
 
-def filename_for(link_text: str, url: str, existing_names: set, used_names: set) -> str:
+def slug_for(link_text: str, url: str) -> str:
     slug = slugify(link_text)
     if not slug:
         parsed = urlparse(url)
         path = parsed.path.strip("/")
         slug = slugify(path.replace("/", "-")) or "home"
-    name = f"{slug}.html"
-    if name in existing_names:
-        return name
-    if name in used_names:
-        index = 2
-        while True:
-            candidate = f"{slug}-{index}.html"
-            if candidate not in existing_names and candidate not in used_names:
-                name = candidate
-                break
-            index += 1
-    used_names.add(name)
-    return name
-
-
-def is_valid_url(url: str) -> bool:
-    if not url:
-        return False
-    parsed = urlparse(url)
-    return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+    return slug
+
+
+def filename_for(link_text: str, url: str, registry: NameRegistry) -> str:
+    return registry.allocate(url, slug_for(link_text, url))
+
+
+def store_page(dup_index, archive, filename: str, url: str, html: str) -> None:
+    if dup_index is not None and is_near_duplicate(dup_index, url, html):
+        if NEAR_DUPLICATE_MODE == "skip":
+            logging.info("Skipping near-duplicate: %s", url)
+            return
+    if archive is not None:
+        save_capture(archive, url, html)
+        return
+    save_page(os.path.join(OUTPUT_DIR, filename), html, url)
 
 
 def main() -> None:
+    import undetected_chromedriver as uc
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     logging.basicConfig(
         level=logging.INFO,
@@ -63,62 +82,75 @@ def main() -> None:
         ],
     )
 
-    if not os.path.exists(CSV_PATH):
-        logging.error("Missing CSV file: %s", CSV_PATH)
+    table_path = find_link_table(CSV_PATH)
+    if not os.path.exists(table_path):
+        logging.error("Missing CSV file: %s", table_path)
         return
 
-    with open(CSV_PATH, "r", encoding="utf-8") as handle:
-        reader = csv.DictReader(handle)
-        rows = list(reader)
-
-    if not rows:
-        logging.error("CSV file is empty: %s", CSV_PATH)
+    total = count_link_rows(table_path, LINK_FILTERS)
+    rows = read_link_rows(table_path, filters=LINK_FILTERS, columns=["link_text", "full_url"])
+    items = prefetch(work_items(rows, seen=url_set(MEMORY_BOUNDED)))
+    first = next(items, None)
+    if first is None:
+        logging.error("Link table is empty: %s", table_path)
         return
 
-    existing_names = set()
-    for entry in os.listdir(OUTPUT_DIR):
-        if entry.lower().endswith(".html"):
-            existing_names.add(entry)
-
-    driver = uc.Chrome()
+    legacy = legacy_links(read_link_rows(table_path), row_link, slug_for)
+    registry = load_registry(OUTPUT_DIR, url_set(MEMORY_BOUNDED), legacy)
+    dup_index = load_index(OUTPUT_DIR) if NEAR_DUPLICATE_MODE != "off" else None
+    archive = WarcArchive(OUTPUT_DIR) if ARCHIVE_FORMAT == "warc" else None
+    with stage("driver_start"):
+        driver = uc.Chrome()
     driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    catalog = open_catalog(CATALOG_PATH)
 
-    used_names = set()
     try:
-        for index, row in enumerate(rows, start=1):
-            link_text = (row.get("link_text") or "").strip()
-            url = (row.get("full_url") or "").strip()
-
-            if not is_valid_url(url):
-                logging.error("Skipping invalid URL at row %d: %s", index, url)
-                continue
-
-            filename = filename_for(link_text, url, existing_names, used_names)
-            output_path = os.path.join(OUTPUT_DIR, filename)
-            if os.path.exists(output_path):
-                logging.info("Skipping existing file: %s", output_path)
-                continue
-
-            try:
-                logging.info("Downloading (%d/%d): %s", index, len(rows), url)
-                driver.get(url)
-                html = driver.page_source
-                with open(output_path, "w", encoding="utf-8") as out:
-                    out.write(html)
-                logging.info("Saved: %s", output_path)
-                existing_names.add(filename)
-            except TimeoutException:
-                logging.error("Timeout while downloading: %s", url)
-            except WebDriverException as exc:
-                logging.error("WebDriver error for %s: %s", url, exc)
-            except OSError as exc:
-                logging.error("File write error for %s: %s", url, exc)
-
-            delay = BASE_DELAY_SECONDS + random.uniform(0, JITTER_SECONDS)
-            time.sleep(delay)
+        with BackgroundWriter() as writer:
+            for index, link_text, url in itertools.chain([first], items):
+                if archive is not None:
+                    filename = None
+                    if archive.has(url):
+                        logging.info("Skipping archived capture: %s", url)
+                        continue
+                else:
+                    filename = filename_for(link_text, url, registry)
+                    output_path = os.path.join(OUTPUT_DIR, filename)
+                    if os.path.exists(output_path):
+                        logging.info("Skipping existing file: %s", output_path)
+                        continue
+
+                fetched_at = time.time()
+                status = 0
+                try:
+                    logging.info("Downloading (%s): %s", progress_label(index, total), url)
+                    with stage("driver_get"):
+                        driver.get(url)
+                    with stage("page_source"):
+                        html = driver.page_source
+                    status = 200
+                    writer.submit(store_page, dup_index, archive, filename, url, html)
+                except TimeoutException:
+                    logging.error("Timeout while downloading: %s", url)
+                except WebDriverException as exc:
+                    logging.error("WebDriver error for %s: %s", url, exc)
+                if catalog is not None:
+                    latency_ms = (time.time() - fetched_at) * 1000
+                    size = len(html.encode("utf-8")) if status else None
+                    digest = content_hash(html) if status else None
+                    catalog.record_capture(SITE, url, status, latency_ms, size, digest, fetched_at)
+
+                delay = BASE_DELAY_SECONDS + random.uniform(0, JITTER_SECONDS)
+                time.sleep(delay)
     finally:
         driver.quit()
+        if catalog is not None:
+            catalog.close()
+        registry.close()
+        if dup_index is not None:
+            dup_index.close()
+        if archive is not None:
+            archive.close()
 
 
 if __name__ == "__main__":
-    main()
+    run_profiled(main, "download_pipedrive")
@@ -0,0 +1,271 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from functools import lru_cache
+
+from page_reader import file_chunks
+from profiling import add_profile_argument, profile_run, stage
+
+
+CACHE_PATH = "extract_cache.db"
+MAX_BYTES = 256 * 1024 * 1024
+BATCH_SIZE = 1000
+HASH_CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+def hash_bytes(data) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def source_version(path: str, *modules: str) -> str:
+    # Any edit to the extracting module, or to the named modules it reads pages through,
+    # invalidates its results; there is no number to bump.
+    digest = hashlib.blake2b(digest_size=16)
+    for source in (path, *(importlib.import_module(name).__file__ for name in modules)):
+        digest.update(hash_file(source).encode("ascii"))
+    return digest.hexdigest()
+
+
+def _encode(result) -> bytes:
+    text = json.dumps(result, ensure_ascii=False, separators=(",", ":"))
+    return zlib.compress(text.encode("utf-8"), 1)
+
+
+def _decode(payload: bytes):
+    result = json.loads(zlib.decompress(payload))
+    # JSON has no tuples; the scrapers return (text, url) pairs.
+    return [tuple(item) if isinstance(item, list) else item for item in result]
+
+
+class ExtractCache:
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.hashed = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self.total_bytes, last_used = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) FROM results"
+        ).fetchone()
+        self._clock = last_used
+        self._files = {}
+        self._results = {}
+        self._touched = {}
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def file_hash(self, path: str) -> str:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self._files.get(path)
+            if known is None:
+                known = self._db.execute(
+                    "SELECT mtime_ns, size, content_hash FROM files WHERE path = ?", (path,)
+                ).fetchone()
+        # An unchanged size and mtime is taken as an unchanged file, so it is not read at all.
+        if known is not None and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+            return known[2]
+        with stage("hash"):
+            content_hash = hash_file(path)
+        with self._lock:
+            self.hashed += 1
+            self._files[path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+            self._flush_if_full()
+        return content_hash
+
+    def key(self, content_hash: str, extractor: str, version, context: str = "") -> str:
+        return hash_bytes(f"{content_hash}\0{extractor}\0{version}\0{context}".encode("utf-8"))
+
+    def lookup(self, key: str):
+        with self._lock:
+            pending = self._results.get(key)
+            if pending is not None:
+                payload = pending[0]
+            else:
+                row = self._db.execute("SELECT payload FROM results WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                payload = row[0]
+                self._touched[key] = self._tick()
+                self._flush_if_full()
+            self.hits += 1
+        return _decode(payload)
+
+    def store(self, key: str, result) -> None:
+        payload = _encode(result)
+        with self._lock:
+            self._results[key] = (payload, len(payload), self._tick())
+            self._flush_if_full()
+
+    def extract_file(self, path: str, extractor: str, version, extract, context: str = ""):
+        key = self.key(self.file_hash(path), extractor, version, context)
+        result = self.lookup(key)
+        if result is None:
+            result = extract(file_chunks(path))
+            self.store(key, result)
+        return result
+
+    def extract_bytes(
+        self, data, extractor: str, version, extract, context: str = "", content_hash: str = None
+    ):
+        key = self.key(content_hash or hash_bytes(data), extractor, version, context)
+        result = self.lookup(key)
+        if result is None:
+            result = extract(data)
+            self.store(key, result)
+        return result
+
+    def _flush_if_full(self) -> None:
+        if len(self._files) + len(self._results) + len(self._touched) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        files, results, touched = self._files, self._results, self._touched
+        if not files and not results and not touched:
+            return
+        self._files, self._results, self._touched = {}, {}, {}
+        with stage("extract_cache"):
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO files (path, mtime_ns, size, content_hash)"
+                    " VALUES (?, ?, ?, ?)",
+                    [(path, *entry) for path, entry in files.items()],
+                )
+                replaced = self._stored_sizes(list(results))
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO results (key, payload, size, used) VALUES (?, ?, ?, ?)",
+                    [(key, *entry) for key, entry in results.items()],
+                )
+                self._db.executemany(
+                    "UPDATE results SET used = ? WHERE key = ?",
+                    [(used, key) for key, used in touched.items()],
+                )
+                self.total_bytes += sum(entry[1] for entry in results.values()) - replaced
+                if self.total_bytes > self.max_bytes:
+                    self._evict()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _stored_sizes(self, keys) -> int:
+        total = 0
+        for start in range(0, len(keys), 500):
+            batch = keys[start : start + 500]
+            placeholders = ",".join("?" * len(batch))
+            (size,) = self._db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM results WHERE key IN ({placeholders})", batch
+            ).fetchone()
+            total += size
+        return total
+
+    def _evict(self) -> None:
+        # Drop least recently used results until the cache is back under 90% of its bound.
+        excess = self.total_bytes - int(self.max_bytes * 0.9)
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM results ORDER BY used"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+            self.total_bytes -= size
+        self._db.executemany("DELETE FROM results WHERE key = ?", evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._flush()
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM results").fetchone()
+            (files,) = self._db.execute("SELECT COUNT(*) FROM files").fetchone()
+        return {"entries": entries, "bytes": self.total_bytes, "files": files}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._files, self._results, self._touched = {}, {}, {}
+            self._db.execute("DELETE FROM results")
+            self._db.execute("DELETE FROM files")
+            self.total_bytes = 0
+        self._db.execute("VACUUM")
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def open_extract_cache(path: str = CACHE_PATH, max_bytes: int = MAX_BYTES):
+    return ExtractCache(path, max_bytes) if path else None
+
+
+def extract_file(path: str, extractor: str, version, extract, cache_path: str = CACHE_PATH):
+    cache = open_extract_cache(cache_path)
+    if cache is None:
+        return extract(file_chunks(path))
+    with cache:
+        return cache.extract_file(path, extractor, version, extract)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or clear the extraction memo cache.")
+    parser.add_argument("--cache", default=CACHE_PATH, help="SQLite cache path")
+    parser.add_argument("--clear", action="store_true", help="drop every cached result")
+    add_profile_argument(parser, "extract_cache")
+    args = parser.parse_args(argv)
+
+    with profile_run(args.profile):
+        with ExtractCache(args.cache) as cache:
+            if args.clear:
+                cache.clear()
+            stats = cache.stats()
+    print(f"{stats['entries']} results, {stats['bytes'] / 1e6:.1f} MB, {stats['files']} files tracked")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
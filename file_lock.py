@@ -0,0 +1,51 @@
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+DIRECTORY_LOCK_FILENAME = ".crawl.lock"
+
+
+def lock_file(handle, blocking: bool = True) -> bool:
+    if fcntl is not None:
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        try:
+            fcntl.flock(handle.fileno(), flags)
+        except BlockingIOError:
+            return False
+        return True
+    handle.seek(0)
+    while True:
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
+
+
+def unlock_file(handle) -> None:
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        return
+    handle.seek(0)
+    msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def directory_lock(directory: str):
+    # Held only around allocations and appends, so several processes can share a mirror.
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, DIRECTORY_LOCK_FILENAME), "a+b") as handle:
+        lock_file(handle)
+        try:
+            yield
+        finally:
+            unlock_file(handle)
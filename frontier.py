@@ -0,0 +1,212 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+from collections import deque
+
+
+BLOOM_CAPACITY = 100_000
+BLOOM_ERROR_RATE = 0.001
+BLOOM_GROWTH = 2
+BLOOM_TIGHTENING = 0.5
+FRONTIER_RAM_ITEMS = 100_000
+FRONTIER_SEGMENT_ITEMS = 50_000
+
+
+def _hash_pair(item: str):
+    digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        first, second = _hash_pair(item)
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(item))
+
+    def add(self, item: str) -> bool:
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not self.bits[position >> 3] & mask:
+                self.bits[position >> 3] |= mask
+                added = True
+        self.count += added
+        return added
+
+
+class ScalableBloomFilter:
+    def __init__(
+        self,
+        capacity: int = BLOOM_CAPACITY,
+        error_rate: float = BLOOM_ERROR_RATE,
+        growth: int = BLOOM_GROWTH,
+        tightening: float = BLOOM_TIGHTENING,
+    ) -> None:
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        # Each new filter tightens its error rate so the compound rate stays below error_rate.
+        self.filters = [BloomFilter(capacity, error_rate * (1 - tightening))]
+
+    def __contains__(self, item: str) -> bool:
+        return any(item in bloom for bloom in reversed(self.filters))
+
+    def __len__(self) -> int:
+        return sum(bloom.count for bloom in self.filters)
+
+    def add(self, item: str) -> bool:
+        if item in self:
+            return False
+        current = self.filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(
+                current.capacity * self.growth, current.error_rate * self.tightening
+            )
+            self.filters.append(current)
+            logging.debug(
+                "Bloom filter grown to %d slices (%d bytes)", len(self.filters), self.memory_bytes
+            )
+        current.add(item)
+        return True
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(len(bloom.bits) for bloom in self.filters)
+
+
+def url_set(
+    memory_bounded: bool = False,
+    capacity: int = BLOOM_CAPACITY,
+    error_rate: float = BLOOM_ERROR_RATE,
+):
+    if memory_bounded:
+        return ScalableBloomFilter(capacity, error_rate)
+    return set()
+
+
+class DiskFrontier:
+    def __init__(
+        self,
+        ram_items: int = FRONTIER_RAM_ITEMS,
+        segment_items: int = FRONTIER_SEGMENT_ITEMS,
+        directory: str = None,
+    ) -> None:
+        self.ram_items = max(1, ram_items)
+        self.segment_items = max(1, min(segment_items, self.ram_items))
+        self._directory = directory
+        self._owns_directory = False
+        self._head = deque()
+        self._tail = []
+        self._segments = deque()
+        self._spilled = 0
+        self._next_segment = 0
+
+    def __len__(self) -> int:
+        return len(self._head) + self._spilled + len(self._tail)
+
+    def append(self, item) -> None:
+        in_memory = not self._segments and not self._tail
+        if in_memory and len(self._head) < self.ram_items - self.segment_items:
+            self._head.append(item)
+            return
+        self._tail.append(item)
+        if len(self._tail) >= self.segment_items:
+            self._spill()
+
+    def _spill(self) -> None:
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="frontier-")
+            self._owns_directory = True
+        os.makedirs(self._directory, exist_ok=True)
+        path = os.path.join(self._directory, f"segment-{self._next_segment:06d}.jsonl")
+        self._next_segment += 1
+        with open(path, "w", encoding="utf-8") as out:
+            for item in self._tail:
+                out.write(json.dumps(item, ensure_ascii=False) + "\n")
+        self._segments.append((path, len(self._tail)))
+        self._spilled += len(self._tail)
+        self._tail = []
+
+    def _load_segment(self) -> None:
+        path, count = self._segments.popleft()
+        with open(path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                item = json.loads(line)
+                self._head.append(tuple(item) if isinstance(item, list) else item)
+        self._spilled -= count
+        os.remove(path)
+
+    def popleft(self):
+        if not self._head:
+            if self._segments:
+                self._load_segment()
+            elif self._tail:
+                self._head.extend(self._tail)
+                self._tail = []
+            else:
+                raise IndexError("pop from an empty frontier")
+        return self._head.popleft()
+
+    def __iter__(self):
+        while len(self):
+            yield self.popleft()
+        self.close()
+
+    def close(self) -> None:
+        while self._segments:
+            os.remove(self._segments.popleft()[0])
+        if self._owns_directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+        self._head.clear()
+        self._tail = []
+        self._spilled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def url_frontier(memory_bounded: bool = False, ram_items: int = FRONTIER_RAM_ITEMS):
+    if memory_bounded:
+        return DiskFrontier(ram_items)
+    return []
+
+
+def add_memory_arguments(parser) -> None:
+    parser.add_argument(
+        "--memory-bounded",
+        action="store_true",
+        help="track seen URLs in a Bloom filter instead of an exact set",
+    )
+    parser.add_argument(
+        "--bloom-capacity",
+        type=int,
+        default=BLOOM_CAPACITY,
+        help="URLs in the first Bloom slice; later slices grow geometrically",
+    )
+    parser.add_argument(
+        "--bloom-error-rate",
+        type=float,
+        default=BLOOM_ERROR_RATE,
+        help="target false-positive rate (lower costs more memory)",
+    )
+
+
+def url_set_from_args(args):
+    return url_set(args.memory_bounded, args.bloom_capacity, args.bloom_error_rate)
@@ -0,0 +1,381 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import ssl
+import sys
+import time
+from collections import Counter
+from urllib.parse import urljoin, urlsplit
+
+from link_table import find_link_table, read_link_rows
+from pipeline import canonicalize_url, is_valid_url
+from profiling import add_profile_argument, profile_run, stage
+from replay_server import original_url, replay_url
+from sites import SITES
+
+
+CACHE_PATH = "link_check_cache.jsonl"
+REPORT_PATH = "link_check.csv"
+REPORT_COLUMNS = [
+    "site",
+    "link_text",
+    "url",
+    "status",
+    "final_url",
+    "latency_ms",
+    "error",
+    "cached",
+]
+CONCURRENCY = 200
+PER_HOST_LIMIT = 8
+TIMEOUT_SECONDS = 10.0
+CACHE_TTL_SECONDS = 24 * 3600
+MAX_REDIRECTS = 5
+# Servers that reject or mishandle HEAD get a one-byte ranged GET instead.
+FALLBACK_STATUSES = {400, 403, 405, 501}
+DRAIN_LIMIT = 64 * 1024
+USER_AGENT = "Mozilla/5.0 (link-check)"
+
+
+async def read_response(reader, method: str):
+    while True:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        version, status, _ = (status_line.decode("latin-1").split(None, 2) + [""])[:3]
+        status = int(status)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if status >= 200:
+            break
+
+    reusable = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if method == "HEAD" or status in (204, 304):
+        return status, headers, reusable
+    length = headers.get("content-length")
+    if "chunked" in headers.get("transfer-encoding", "").lower() or length is None:
+        # Not worth draining an unbounded body just to keep the socket.
+        return status, headers, False
+    if int(length) > DRAIN_LIMIT:
+        return status, headers, False
+    await reader.readexactly(int(length))
+    return status, headers, reusable
+
+
+class HostConnections:
+    def __init__(self, limit: int) -> None:
+        self.semaphore = asyncio.Semaphore(limit)
+        self.idle = []
+
+
+class ConnectionPool:
+    def __init__(self, per_host: int = PER_HOST_LIMIT) -> None:
+        self.per_host = per_host
+        self.opened = 0
+        self.requests = 0
+        self._hosts = {}
+        self._ssl = None
+
+    def _context(self):
+        if self._ssl is None:
+            self._ssl = ssl.create_default_context()
+        return self._ssl
+
+    async def _connect(self, host: str, port: int, secure: bool):
+        self.opened += 1
+        return await asyncio.open_connection(host, port, ssl=self._context() if secure else None)
+
+    async def request(self, method: str, url: str, headers: dict = None):
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        port = parts.port or (443 if secure else 80)
+        key = (parts.scheme, parts.hostname, port)
+        connections = self._hosts.get(key)
+        if connections is None:
+            connections = self._hosts[key] = HostConnections(self.per_host)
+
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+        lines = [
+            f"{method} {target} HTTP/1.1",
+            f"Host: {host_header}",
+            f"User-Agent: {USER_AGENT}",
+            "Accept: */*",
+            "Connection: keep-alive",
+        ]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+        async with connections.semaphore:
+            while True:
+                reused = bool(connections.idle)
+                if reused:
+                    reader, writer = connections.idle.pop()
+                else:
+                    reader, writer = await self._connect(parts.hostname, port, secure)
+                try:
+                    writer.write(payload)
+                    await writer.drain()
+                    status, response_headers, reusable = await read_response(reader, method)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        # The server dropped an idle keep-alive socket; retry on a fresh one.
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                self.requests += 1
+                if reusable:
+                    connections.idle.append((reader, writer))
+                else:
+                    writer.close()
+                return status, response_headers
+
+    def close(self) -> None:
+        for connections in self._hosts.values():
+            for _, writer in connections.idle:
+                writer.close()
+            connections.idle.clear()
+
+
+async def check_url(
+    pool: ConnectionPool, url: str, replay_base: str = None, timeout: float = TIMEOUT_SECONDS
+):
+    started = time.perf_counter()
+    record = {"url": url, "status": 0, "final_url": "", "latency_ms": None, "error": ""}
+    current = url
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            target = replay_url(replay_base, current)
+            status, headers = await asyncio.wait_for(pool.request("HEAD", target), timeout)
+            if status in FALLBACK_STATUSES:
+                status, headers = await asyncio.wait_for(
+                    pool.request("GET", target, {"Range": "bytes=0-0"}), timeout
+                )
+            location = headers.get("location")
+            if not (300 <= status < 400 and location):
+                break
+            current = original_url(replay_base, urljoin(target, location))
+        else:
+            record["error"] = "too many redirects"
+        record["status"] = status
+        record["final_url"] = current
+    except asyncio.TimeoutError:
+        record["error"] = "timeout"
+    except (OSError, ValueError, asyncio.IncompleteReadError) as exc:
+        record["error"] = str(exc) or type(exc).__name__
+    record["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    record["checked_at"] = time.time()
+    return record
+
+
+class CheckCache:
+    def __init__(self, path: str, ttl: float = CACHE_TTL_SECONDS) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.results = {}
+        self._journal = None
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        cutoff = time.time() - self.ttl
+        with open(self.path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Ignoring corrupt link check record in %s", self.path)
+                    continue
+                if record.get("checked_at", 0) >= cutoff:
+                    self.results[canonicalize_url(record["url"])] = record
+
+    def get(self, url: str):
+        record = self.results.get(canonicalize_url(url))
+        if record is None or record["checked_at"] < time.time() - self.ttl:
+            return None
+        return record
+
+    def put(self, record: dict) -> None:
+        # Only real HTTP answers are cached; timeouts and connection errors are retried next run.
+        if not record["status"]:
+            return
+        self.results[canonicalize_url(record["url"])] = record
+        if self._journal is None:
+            self._journal = open(self.path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def open_cache(path: str = CACHE_PATH, ttl: float = CACHE_TTL_SECONDS):
+    return CheckCache(path, ttl) if path else None
+
+
+def outcome(record: dict) -> str:
+    status = record["status"]
+    if not status:
+        return "error"
+    if status >= 400:
+        return "broken"
+    if canonicalize_url(record["final_url"]) != canonicalize_url(record["url"]):
+        return "redirected"
+    return "ok"
+
+
+async def _check_all(items, report, cache, replay_base, concurrency, per_host, timeout):
+    pool = ConnectionPool(per_host)
+    pending = iter(items)
+
+    async def worker():
+        for site_name, link_text, url in pending:
+            record = cache.get(url) if cache is not None else None
+            cached = record is not None
+            if not cached:
+                record = await check_url(pool, url, replay_base, timeout)
+                if cache is not None:
+                    cache.put(record)
+            report(dict(record, site=site_name, link_text=link_text, cached=cached))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        pool.close()
+    return pool
+
+
+def check_links(
+    items,
+    report,
+    cache: CheckCache = None,
+    replay_base: str = None,
+    concurrency: int = CONCURRENCY,
+    per_host: int = PER_HOST_LIMIT,
+    timeout: float = TIMEOUT_SECONDS,
+) -> Counter:
+    counts = Counter()
+
+    def record(result: dict) -> None:
+        counts[outcome(result)] += 1
+        counts["cached"] += result["cached"]
+        report(result)
+
+    started = time.perf_counter()
+    with stage("link_check"):
+        pool = asyncio.run(
+            _check_all(items, record, cache, replay_base, concurrency, per_host, timeout)
+        )
+    elapsed = time.perf_counter() - started
+    checked = sum(counts[name] for name in ("ok", "redirected", "broken", "error"))
+    logging.info(
+        "Checked %d links in %.1fs (%.0f/s, %d requests over %d connections):"
+        " %d ok, %d redirected, %d broken, %d errors, %d from cache",
+        checked,
+        elapsed,
+        checked / elapsed if elapsed else 0,
+        pool.requests,
+        pool.opened,
+        counts["ok"],
+        counts["redirected"],
+        counts["broken"],
+        counts["error"],
+        counts["cached"],
+    )
+    return counts
+
+
+def site_links(sites):
+    seen = set()
+    for site in sites:
+        table_path = find_link_table(site.links_csv)
+        if not os.path.exists(table_path):
+            logging.warning("Missing link table for %s: %s", site.name, table_path)
+            continue
+        for row in read_link_rows(table_path):
+            link_text, url = site.row_link(row)
+            key = canonicalize_url(url) if is_valid_url(url) else None
+            if key is None or key in seen:
+                continue
+            seen.add(key)
+            yield site.name, link_text, url
+
+
+def add_check_arguments(parser) -> None:
+    parser.add_argument(
+        "--concurrency", type=int, default=CONCURRENCY, help="links checked at once"
+    )
+    parser.add_argument(
+        "--per-host", type=int, default=PER_HOST_LIMIT, help="open connections per host"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=TIMEOUT_SECONDS, help="seconds per request"
+    )
+    parser.add_argument(
+        "--cache", default=CACHE_PATH, help="JSONL cache of recent results ('' to disable)"
+    )
+    parser.add_argument(
+        "--ttl", type=float, default=CACHE_TTL_SECONDS, help="seconds a cached result stays valid"
+    )
+    parser.add_argument("--report", default=REPORT_PATH, help="CSV report of every checked link")
+
+
+def check_sites(sites, args) -> int:
+    cache = open_cache(args.cache, args.ttl)
+    try:
+        with open(args.report, "w", newline="", encoding="utf-8") as out:
+            writer = csv.DictWriter(out, fieldnames=REPORT_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            counts = check_links(
+                site_links(sites),
+                writer.writerow,
+                cache,
+                args.replay,
+                args.concurrency,
+                args.per_host,
+                args.timeout,
+            )
+    finally:
+        if cache is not None:
+            cache.close()
+    logging.info("Wrote link check report to %s", args.report)
+    return 1 if counts["broken"] else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check every extracted link concurrently.")
+    parser.add_argument("--site", action="append", default=[], help="site name (default: all)")
+    parser.add_argument(
+        "--replay", metavar="URL", help="check through a replay or synthetic server"
+    )
+    add_check_arguments(parser)
+    add_profile_argument(parser, "link_check")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    try:
+        sites = [SITES[name] for name in args.site] if args.site else list(SITES.values())
+    except KeyError as exc:
+        logging.error("Unknown site: %s", exc.args[0])
+        return 2
+    with profile_run(args.profile):
+        return check_sites(sites, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
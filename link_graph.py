@@ -0,0 +1,528 @@
+import argparse
+import csv
+import logging
+import os
+import re
+import sys
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlparse
+
+from page_reader import source_chunks
+from page_ring import PageRing, decode_chunks
+from profiling import run_profiled, stage
+
+
+EDGE_COLUMNS = ["source_page", "target_url", "link_text", "region", "scope", "site"]
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "param",
+    "source",
+    "track",
+    "wbr",
+}
+SKIPPED_SCHEMES = ("mailto:", "tel:", "javascript:", "data:")
+FEED_CHUNK_SIZE = 64 * 1024
+RESULT_POLL_SECONDS = 1.0
+
+HEADER_NAV = "header_nav"
+DROPDOWN = "dropdown"
+BODY = "body"
+FOOTER = "footer"
+FEATURED_IMAGE = "featured_image"
+DROPDOWN_TOKENS = ("dropdown", "sub-menu", "submenu", "mega-menu")
+FOOTER_TOKEN = re.compile(r"(^|-)footer")
+
+
+def parse_selector(selector: str):
+    groups = []
+    for group in (selector or "").split(","):
+        compounds = []
+        for part in group.split():
+            tag, element_id, classes = "", "", []
+            token = ""
+            kind = "tag"
+            for char in part + ".":
+                if char in ".#":
+                    if kind == "tag":
+                        tag = token.lower()
+                    elif kind == "class":
+                        classes.append(token)
+                    else:
+                        element_id = token
+                    kind = "class" if char == "." else "id"
+                    token = ""
+                else:
+                    token += char
+            compounds.append((tag, element_id, frozenset(c for c in classes if c)))
+        if compounds:
+            groups.append(compounds)
+    return groups
+
+
+def _compound_matches(compound, element) -> bool:
+    tag, element_id, classes = compound
+    if tag and tag != "*" and tag != element[0]:
+        return False
+    if element_id and element_id != element[1]:
+        return False
+    return classes <= element[2]
+
+
+def selector_matches(groups, ancestors, element) -> bool:
+    for compounds in groups:
+        if not _compound_matches(compounds[-1], element):
+            continue
+        position = len(ancestors) - 1
+        remaining = len(compounds) - 2
+        while remaining >= 0 and position >= 0:
+            if _compound_matches(compounds[remaining], ancestors[position]):
+                remaining -= 1
+            position -= 1
+        if remaining < 0:
+            return True
+    return False
+
+
+class Edge:
+    __slots__ = ("source", "target", "href", "text", "region", "internal", "containers", "attrs")
+
+    def __init__(self, source, target, href, text, region, internal, containers, attrs) -> None:
+        self.source = source
+        self.target = target
+        self.href = href
+        self.text = text
+        self.region = region
+        self.internal = internal
+        self.containers = containers
+        self.attrs = attrs
+
+    def as_row(self, site_name: str = "") -> dict:
+        return {
+            "source_page": self.source,
+            "target_url": self.target,
+            "link_text": self.text,
+            "region": self.region,
+            "scope": "internal" if self.internal else "external",
+            "site": site_name,
+        }
+
+
+class LinkGraphParser(HTMLParser):
+    def __init__(self, page_url: str, domain: str = "", containers=None, exclude_text=None) -> None:
+        super().__init__(convert_charrefs=True)
+        self.page_url = page_url
+        self.domain = domain or urlparse(page_url).netloc.lower()
+        self.containers = {name: parse_selector(value) for name, value in (containers or {}).items()}
+        self.exclude_text = parse_selector(exclude_text) if exclude_text else []
+        self.base_url = page_url
+        self.edges = []
+        self._elements = []
+        self._frames = []
+        self._anchor = None
+
+    def _classify(self, parent_region: str, element, in_container: bool) -> str:
+        tag, element_id, classes = element
+        tokens = classes | {element_id} if element_id else classes
+        if parent_region == FEATURED_IMAGE or any("featured-image" in token for token in tokens):
+            return FEATURED_IMAGE
+        if parent_region == FOOTER or tag == "footer" or any(map(FOOTER_TOKEN.search, tokens)):
+            return FOOTER
+        if parent_region in (HEADER_NAV, DROPDOWN):
+            if any(marker in token for token in tokens for marker in DROPDOWN_TOKENS):
+                return DROPDOWN
+            return parent_region
+        if tag in ("header", "nav") or element_id == "masthead" or in_container:
+            return HEADER_NAV
+        return parent_region
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "base" and attrs.get("href"):
+            self.base_url = urljoin(self.page_url, attrs["href"])
+        if tag in VOID_TAGS:
+            return
+        element = (tag, attrs.get("id") or "", frozenset((attrs.get("class") or "").split()))
+        if self._frames:
+            region, inherited, excluded = self._frames[-1][1:]
+        else:
+            region, inherited, excluded = BODY, frozenset(), False
+        matched = [
+            name
+            for name, groups in self.containers.items()
+            if name not in inherited and selector_matches(groups, self._elements, element)
+        ]
+        if matched:
+            inherited = inherited | frozenset(matched)
+        region = self._classify(region, element, bool(matched))
+        if self._anchor is not None and not excluded and self.exclude_text:
+            excluded = selector_matches(self.exclude_text, self._elements, element)
+        if tag == "a":
+            self._finish_anchor()
+            excluded = bool(self.exclude_text) and selector_matches(
+                self.exclude_text, self._elements, element
+            )
+            self._anchor = (attrs.get("href"), attrs, region, inherited, [])
+        self._elements.append(element)
+        self._frames.append((tag, region, inherited, excluded))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        for index in range(len(self._frames) - 1, -1, -1):
+            if self._frames[index][0] == tag:
+                del self._frames[index:]
+                del self._elements[index:]
+                break
+        else:
+            return
+        if tag == "a" or (self._anchor is not None and not any(f[0] == "a" for f in self._frames)):
+            self._finish_anchor()
+
+    def handle_data(self, data):
+        if self._anchor is not None and not (self._frames and self._frames[-1][3]):
+            self._anchor[4].append(data)
+
+    def _finish_anchor(self) -> None:
+        if self._anchor is None:
+            return
+        href, attrs, region, containers, parts = self._anchor
+        self._anchor = None
+        text = " ".join("".join(parts).split())
+        target = ""
+        internal = False
+        if href and href.strip() and not href.strip().startswith(("#",) + SKIPPED_SCHEMES):
+            target = urldefrag(urljoin(self.base_url, href.strip()))[0]
+            netloc = urlparse(target).netloc.lower()
+            internal = bool(netloc) and netloc.endswith(self.domain)
+        self.edges.append(
+            Edge(self.page_url, target, href, text, region, internal, containers, attrs)
+        )
+
+    def close(self) -> None:
+        super().close()
+        self._finish_anchor()
+
+    def pop_edges(self):
+        edges, self.edges = self.edges, []
+        return edges
+
+
+def site_parser(site, page_url: str) -> LinkGraphParser:
+    containers = {"links": site.link_selector} if site.link_selector else {}
+    return LinkGraphParser(page_url, site.domain, containers, site.exclude_text_selector)
+
+
+def iter_edges(parser: LinkGraphParser, html_text, chunk_size: int = FEED_CHUNK_SIZE):
+    if isinstance(html_text, str):
+        starts = range(0, len(html_text), chunk_size)
+        chunks = (html_text[start : start + chunk_size] for start in starts)
+    elif isinstance(html_text, (bytes, bytearray, memoryview)):
+        chunks = decode_chunks(html_text, chunk_size=chunk_size)
+    else:
+        chunks = html_text
+    with stage("parse"):
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.pop_edges()
+        parser.close()
+        yield from parser.pop_edges()
+
+
+class PageLinks:
+    def __init__(self, edges) -> None:
+        self.edges = edges
+
+    def collected(self, container: str = "links"):
+        return [
+            (edge.text, edge.href, edge.attrs) for edge in self.edges if container in edge.containers
+        ]
+
+    def graph_edges(self):
+        return [edge for edge in self.edges if edge.target]
+
+
+def page_links(site, page_url: str, html_text: str) -> PageLinks:
+    return PageLinks(list(iter_edges(site_parser(site, page_url), html_text)))
+
+
+class EdgeWriter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.count = 0
+        # Each run rewrites the graph; appending would repeat every edge of the previous run.
+        self._handle = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._handle, fieldnames=EDGE_COLUMNS)
+        self._writer.writeheader()
+
+    def write(self, edge: Edge, site_name: str = "") -> None:
+        self.write_row(edge.as_row(site_name))
+
+    def write_row(self, row: dict) -> None:
+        self._writer.writerow(row)
+        self.count += 1
+
+    def close(self) -> None:
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def graph_path(site) -> str:
+    return os.path.splitext(site.links_csv)[0] + "_graph.csv"
+
+
+def capture_names(site) -> dict:
+    from link_table import find_link_table, read_link_rows
+    from name_registry import registry_names, site_legacy_names
+
+    # Keyed by file, so a page stored under several URLs (aliases) is parsed once.
+    names = {}
+    for url, name in registry_names(site.output_dir, aliases=False):
+        names[name] = url
+    # Mirrors from before the name registry only have the link table to go by.
+    table_path = find_link_table(site.links_csv)
+    if os.path.exists(table_path):
+        for url, name in site_legacy_names(site, read_link_rows(table_path)):
+            names.setdefault(name, url)
+    return names
+
+
+def iter_capture_sources(site, mirror):
+    from warc_archive import has_archive, iter_archive
+
+    if has_archive(site.output_dir):
+        for record in iter_archive(site.output_dir):
+            yield record.url, None, record
+    # Sources are ("file", path) or, for mirrors only kept as a zip, ("zip", path, member).
+    for name, url in capture_names(site).items():
+        source = mirror.locate(site, name)
+        if source is not None:
+            yield url, source, None
+
+
+def graph_extractor(site, internal_only: bool = False):
+    from extract_cache import source_version
+
+    # Site selectors and the domain shape the edges as much as the parser does.
+    rules = (site.domain, site.link_selector, site.exclude_text_selector, internal_only)
+    version = source_version(__file__, "page_reader", "page_ring")
+    return f"link_graph.{site.name}", f"{version}:{rules!r}"
+
+
+def capture_key(cache, site, url: str, source, record, internal_only: bool = False):
+    from extract_cache import hash_bytes
+
+    extractor, version = graph_extractor(site, internal_only)
+    if record is None:
+        content_hash = cache.file_hash(source[1])
+        if source[0] == "zip":
+            # The archive hash is memoized by size and mtime, so members are never read for it.
+            content_hash = f"{content_hash}:{source[2]}"
+    else:
+        content_hash = record.headers.get("WARC-Payload-Digest") or hash_bytes(record.payload)
+    # Relative links resolve against the page URL, so it is part of the key.
+    return cache.key(content_hash, extractor, version, url)
+
+
+def site_edge_rows(site, internal_only: bool = False, cache=None):
+    from page_reader import MirrorSource
+
+    for url, source, record in iter_capture_sources(site, MirrorSource()):
+        key = None
+        if cache is not None:
+            key = capture_key(cache, site, url, source, record, internal_only)
+            rows = cache.lookup(key)
+            if rows is not None:
+                yield rows
+                continue
+        html = source_chunks(source) if record is None else record.payload
+        rows = edge_rows(site, url, html, internal_only)
+        if key is not None:
+            cache.store(key, rows)
+        yield rows
+
+
+def edge_rows(site, page_url: str, html_text, internal_only: bool = False):
+    return [
+        edge.as_row(site.name)
+        for edge in iter_edges(site_parser(site, page_url), html_text)
+        if edge.target and (edge.internal or not internal_only)
+    ]
+
+
+class ParseWorkerError(RuntimeError):
+    pass
+
+
+def parse_worker(ring: PageRing, results, internal_only: bool) -> None:
+    import traceback
+
+    from sites import get_site
+
+    try:
+        while True:
+            page = ring.get()
+            if page is None:
+                return
+            site_name, page_url, key = page.meta
+            with page:
+                rows = edge_rows(get_site(site_name), page_url, page.view, internal_only)
+            results.put((key, rows))
+    except Exception:
+        # Sent as text: the original exception may not survive pickling.
+        results.put(ParseWorkerError(traceback.format_exc()))
+    finally:
+        results.put(None)
+
+
+def parallel_edge_rows(sites, workers: int, internal_only: bool = False, cache=None):
+    import multiprocessing
+    import queue
+    import threading
+
+    from page_reader import MirrorSource
+
+    ring = PageRing()
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=parse_worker, args=(ring, results, internal_only))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    stop = threading.Event()
+    failures = []
+
+    def offer(payload, meta) -> bool:
+        while not stop.is_set():
+            try:
+                ring.put(payload, meta, timeout=RESULT_POLL_SECONDS)
+                return True
+            except queue.Empty:
+                continue
+        return False
+
+    def produce():
+        try:
+            mirror = MirrorSource()
+            for site in sites:
+                for url, source, record in iter_capture_sources(site, mirror):
+                    key = None
+                    if cache is not None:
+                        key = capture_key(cache, site, url, source, record, internal_only)
+                        rows = cache.lookup(key)
+                        if rows is not None:
+                            # Cached pages skip the ring and the workers entirely.
+                            results.put((None, rows))
+                            continue
+                    payload = record.payload if record is not None else mirror.read(source)
+                    if not offer(payload, (site.name, url, key)):
+                        return
+        except Exception as exc:
+            failures.append(exc)
+        finally:
+            ring.finish(workers)
+            # Sent after any cached rows, so the reader knows they have all arrived.
+            results.put(None)
+
+    producer = threading.Thread(target=produce, name="link-graph-reader", daemon=True)
+    producer.start()
+    completed = False
+    try:
+        finished = 0
+        while finished < workers + 1:
+            try:
+                item = results.get(timeout=RESULT_POLL_SECONDS)
+            except queue.Empty:
+                # A worker killed outright never posts its sentinel.
+                for process in processes:
+                    if process.exitcode not in (None, 0):
+                        raise ParseWorkerError(
+                            f"Parse worker {process.pid} exited with code {process.exitcode}"
+                        )
+                continue
+            if item is None:
+                if failures:
+                    raise failures[0]
+                finished += 1
+                continue
+            if isinstance(item, ParseWorkerError):
+                raise item
+            key, rows = item
+            if key is not None:
+                cache.store(key, rows)
+            yield rows
+        completed = True
+    finally:
+        stop.set()
+        producer.join()
+        for process in processes:
+            if not completed:
+                # A worker with unread results would never exit; none are needed now.
+                process.terminate()
+            process.join()
+        ring.close()
+
+
+def main(argv=None) -> int:
+    from extract_cache import CACHE_PATH, open_extract_cache
+    from sites import SITES, get_site
+
+    parser = argparse.ArgumentParser(description="Write the link graph of mirrored pages.")
+    parser.add_argument("--site", action="append", default=[], help="site name (repeatable)")
+    parser.add_argument("--output", default="link_graph.csv", help="edge list CSV, rewritten each run")
+    parser.add_argument("--internal-only", action="store_true", help="skip external edges")
+    parser.add_argument(
+        "--workers", type=int, default=0, help="parse in N processes fed through shared memory"
+    )
+    parser.add_argument(
+        "--cache", default=CACHE_PATH, help="memo of extracted edges per page ('' to disable)"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    sites = [get_site(name) for name in args.site] if args.site else list(SITES.values())
+    cache = open_extract_cache(args.cache)
+    try:
+        with EdgeWriter(args.output) as writer:
+            if args.workers > 0:
+                for rows in parallel_edge_rows(sites, args.workers, args.internal_only, cache):
+                    for row in rows:
+                        writer.write_row(row)
+            else:
+                for site in sites:
+                    pages = 0
+                    for rows in site_edge_rows(site, args.internal_only, cache):
+                        pages += 1
+                        for row in rows:
+                            writer.write_row(row)
+                    logging.info("%s: %d pages", site.name, pages)
+    finally:
+        if cache is not None:
+            cache.close()
+    logging.info("Wrote %d edges to %s", writer.count, args.output)
+    if cache is not None:
+        logging.info(
+            "Extraction cache: %d hits, %d misses, %d files hashed",
+            cache.hits,
+            cache.misses,
+            cache.hashed,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_profiled(main, "link_graph"))
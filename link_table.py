@@ -0,0 +1,258 @@
+import csv
+import os
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+
+LINK_COLUMNS = ["link_text", "full_url", "host", "source_page", "site", "fetch_time", "run_id"]
+DICTIONARY_COLUMNS = ["link_text", "host", "source_page", "site", "run_id"]
+COLUMNAR_EXTENSIONS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+CSV_COLUMNS = ["link_text", "full_url"]
+CSV_ALIASES = {"post_url": "full_url"}
+ROW_GROUP_SIZE = 65536
+
+
+def new_run_id() -> str:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return f"{stamp}-{uuid.uuid4().hex[:8]}"
+
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def table_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    return COLUMNAR_EXTENSIONS.get(extension, "csv")
+
+
+def columnar_path(csv_path: str, output_format: str) -> str:
+    stem = os.path.splitext(csv_path)[0]
+    if output_format == "parquet":
+        return f"{stem}.parquet"
+    if output_format == "arrow":
+        return f"{stem}.arrow"
+    return csv_path
+
+
+def find_link_table(csv_path: str) -> str:
+    candidates = [csv_path]
+    for output_format in ("parquet", "arrow"):
+        candidates.append(columnar_path(csv_path, output_format))
+    existing = [path for path in candidates if os.path.exists(path)]
+    if not existing:
+        return csv_path
+    return max(existing, key=os.path.getmtime)
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as exc:
+        raise RuntimeError(
+            "Columnar link tables need pyarrow (pip install pyarrow)"
+        ) from exc
+    return pyarrow
+
+
+def _arrow_schema(pa):
+    fields = []
+    for name in LINK_COLUMNS:
+        if name in DICTIONARY_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+class LinkTableWriter:
+    def __init__(
+        self, path: str, site: str, run_id: str = None, csv_columns=None, catalog=None
+    ) -> None:
+        self.path = path
+        self.site = site
+        self.catalog = catalog
+        self.run_id = run_id or new_run_id()
+        self.format = table_format(path)
+        self.csv_columns = csv_columns or CSV_COLUMNS
+        self.count = 0
+        self._buffer = {name: [] for name in LINK_COLUMNS}
+        self._handle = None
+        self._csv = None
+        self._arrow_writer = None
+        self._pa = None
+        self._schema = None
+
+        if self.format == "csv":
+            self._handle = open(path, "w", newline="", encoding="utf-8")
+            self._csv = csv.writer(self._handle)
+            self._csv.writerow(self.csv_columns)
+        else:
+            self._pa = _require_pyarrow()
+            self._schema = _arrow_schema(self._pa)
+
+    def write(
+        self,
+        text: str,
+        full_url: str,
+        source_page: str = "",
+        fetch_time: str = None,
+        record_link: bool = True,
+    ) -> None:
+        self.count += 1
+        record = {
+            "link_text": text,
+            "full_url": full_url,
+            "host": urlparse(full_url).netloc.lower(),
+            "source_page": source_page,
+            "site": self.site,
+            "fetch_time": fetch_time or utc_now(),
+            "run_id": self.run_id,
+        }
+        if self.catalog is not None and record_link:
+            self.catalog.record_link(
+                self.site, full_url, text, source_page, record["fetch_time"], self.run_id
+            )
+        if self._csv is not None:
+            self._csv.writerow([record[CSV_ALIASES.get(name, name)] for name in self.csv_columns])
+            return
+        for name in LINK_COLUMNS:
+            self._buffer[name].append(record[name])
+        if len(self._buffer["full_url"]) >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def writerows(self, rows, source_page: str = "", fetch_time: str = None) -> None:
+        for text, full_url in rows:
+            self.write(text, full_url, source_page, fetch_time)
+
+    def _flush(self) -> None:
+        pa = self._pa
+        if self._arrow_writer is None:
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+
+                self._arrow_writer = pq.ParquetWriter(
+                    self.path,
+                    self._schema,
+                    use_dictionary=DICTIONARY_COLUMNS,
+                    compression="zstd",
+                )
+            else:
+                self._arrow_writer = pa.ipc.new_file(self.path, self._schema)
+        arrays = []
+        for field in self._schema:
+            array = pa.array(self._buffer[field.name], type=pa.string())
+            if field.name in DICTIONARY_COLUMNS:
+                array = array.dictionary_encode()
+            arrays.append(array)
+        table = pa.Table.from_arrays(arrays, schema=self._schema)
+        if self.format == "parquet":
+            self._arrow_writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        else:
+            self._arrow_writer.write_table(table, max_chunksize=ROW_GROUP_SIZE)
+        self._buffer = {name: [] for name in LINK_COLUMNS}
+
+    def close(self) -> None:
+        if self.catalog is not None:
+            self.catalog.flush()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            return
+        if self._buffer["full_url"] or self._arrow_writer is None:
+            self._flush()
+        self._arrow_writer.close()
+        self._arrow_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _filter_expression(filters):
+    import pyarrow.compute as pc
+
+    operators = {
+        "=": lambda field, value: field == value,
+        "==": lambda field, value: field == value,
+        "!=": lambda field, value: field != value,
+        "<": lambda field, value: field < value,
+        "<=": lambda field, value: field <= value,
+        ">": lambda field, value: field > value,
+        ">=": lambda field, value: field >= value,
+        "in": lambda field, value: field.isin(list(value)),
+        "not in": lambda field, value: ~field.isin(list(value)),
+    }
+    expression = None
+    for column, operator, value in filters:
+        if operator not in operators:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        term = operators[operator](pc.field(column), value)
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def _row_matches(row: dict, filters) -> bool:
+    for column, operator, value in filters:
+        cell = row.get(column)
+        if operator in ("=", "=="):
+            matched = cell == value
+        elif operator == "!=":
+            matched = cell != value
+        elif operator == "in":
+            matched = cell in value
+        elif operator == "not in":
+            matched = cell not in value
+        elif cell is None:
+            matched = False
+        elif operator == "<":
+            matched = cell < value
+        elif operator == "<=":
+            matched = cell <= value
+        elif operator == ">":
+            matched = cell > value
+        elif operator == ">=":
+            matched = cell >= value
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        if not matched:
+            return False
+    return True
+
+
+def count_link_rows(path: str, filters=None):
+    output_format = table_format(path)
+    if output_format == "csv" or filters:
+        return None
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet" if output_format == "parquet" else "ipc")
+    return dataset.count_rows()
+
+
+def read_link_rows(path: str, filters=None, columns=None):
+    output_format = table_format(path)
+    if output_format == "csv":
+        with open(path, "r", encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                if "host" not in row:
+                    url = row.get("full_url") or row.get("post_url") or ""
+                    row["host"] = urlparse(url.strip()).netloc.lower()
+                if filters and not _row_matches(row, filters):
+                    continue
+                if columns:
+                    row = {name: row.get(name) for name in columns}
+                yield row
+        return
+
+    _require_pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet" if output_format == "parquet" else "ipc")
+    expression = _filter_expression(filters) if filters else None
+    for batch in dataset.to_batches(columns=columns, filter=expression):
+        yield from batch.to_pylist()
@@ -0,0 +1,400 @@
+import argparse
+import glob
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlparse
+
+from profiling import add_profile_argument, profile_run, stage
+
+
+LOG_PATTERN = "download_*.log"
+# Log-spaced buckets 5% wide keep percentiles within 5% in constant memory.
+BUCKET_GROWTH = 1.05
+MAX_PENDING = 256
+# Gaps longer than this between downloads are idle time, not part of the throughput window.
+IDLE_GAP_SECONDS = 300
+HISTOGRAM_WIDTH = 40
+QUANTILES = (0.5, 0.95, 0.99)
+
+LINE_PATTERN = re.compile(r"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:,(\d{3}))? \[(\w+)\] (.*)$")
+DOWNLOADING_PATTERN = re.compile(r"^Downloading \(([^)]*)\): (\S+)")
+FAILURE_PATTERNS = (
+    re.compile(r"^Timeout while downloading: (\S+)"),
+    re.compile(r"^WebDriver error for (\S+?):"),
+    re.compile(r"^File write error for (\S+?):"),
+    re.compile(r"^WARC write error for (\S+?):"),
+)
+REDIRECTED_PATTERN = re.compile(r"^Redirected: (\S+) -> (\S+)$")
+# Lines that end a download without a failure; each names the URL it belongs to.
+FINISHED_PATTERNS = (
+    (re.compile(r"^Saved: .+ from (\S+)$"), "ok"),
+    (re.compile(r"^Skipping near-duplicate: (\S+)"), "skipped"),
+    (re.compile(r"^Skipping capture stored by another tab: (\S+)"), "skipped"),
+    (re.compile(r"^Redirected to an existing capture: (\S+) -> "), "skipped"),
+    (re.compile(r"^Skipping known redirect: (\S+) -> "), "skipped"),
+)
+RUN_START_MARKERS = ("patching driver executable",)
+
+
+def parse_timestamp(date_time: str, millis: str = None) -> float:
+    stamp = datetime.fromisoformat(date_time).timestamp()
+    return stamp + int(millis) / 1000 if millis else stamp
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value_ms: float) -> None:
+        bucket = int(math.log(max(value_ms, 1.0), BUCKET_GROWTH))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value_ms
+        self.minimum = value_ms if self.minimum is None else min(self.minimum, value_ms)
+        self.maximum = value_ms if self.maximum is None else max(self.maximum, value_ms)
+
+    def quantile(self, q: float):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                # Report the bucket midpoint, clamped to the observed range.
+                value = BUCKET_GROWTH ** (bucket + 0.5)
+                return min(max(value, self.minimum), self.maximum)
+        return self.maximum
+
+    def render(self, width: int = HISTOGRAM_WIDTH):
+        # Fold the fine buckets into power-of-two bins for display.
+        bins = {}
+        for bucket, count in self.buckets.items():
+            exponent = max(0, math.ceil(math.log2(BUCKET_GROWTH ** (bucket + 1))))
+            bins[exponent] = bins.get(exponent, 0) + count
+        if not bins:
+            return []
+        peak = max(bins.values())
+        lines = []
+        for exponent in range(min(bins), max(bins) + 1):
+            count = bins.get(exponent, 0)
+            bar = "#" * max(1 if count else 0, round(count / peak * width))
+            lines.append(f"  <= {format_ms(2 ** exponent):>8} {count:>7} {bar}")
+        return lines
+
+
+def format_ms(value) -> str:
+    if value is None:
+        return "-"
+    if value >= 1000:
+        return f"{value / 1000:.1f}s"
+    return f"{value:.0f}ms"
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.errors = 0
+        self.skipped = 0
+        self.unmatched = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.active_seconds = 0.0
+
+    def _advance(self, started: float, finished: float) -> None:
+        cursor = self.last_seen
+        if cursor is None or cursor < started - IDLE_GAP_SECONDS:
+            self.active_seconds += finished - started
+        elif cursor < finished:
+            self.active_seconds += finished - cursor
+        if self.first_seen is None or started < self.first_seen:
+            self.first_seen = started
+        if self.last_seen is None or finished > self.last_seen:
+            self.last_seen = finished
+
+    def record(self, outcome: str, started: float, finished: float) -> None:
+        self._advance(started, finished)
+        if outcome == "ok":
+            self.latency.add((finished - started) * 1000)
+        elif outcome == "skipped":
+            self.skipped += 1
+            self.latency.add((finished - started) * 1000)
+        elif outcome == "error":
+            self.errors += 1
+        else:
+            self.unmatched += 1
+
+    def summary(self) -> dict:
+        attempts = self.latency.count + self.errors
+        elapsed = self.active_seconds
+        result = {
+            "pages": self.latency.count,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "unmatched": self.unmatched,
+            "error_rate": round(self.errors / attempts, 4) if attempts else None,
+            "pages_per_minute": round(self.latency.count / elapsed * 60, 2) if elapsed else None,
+            "mean_ms": round(self.latency.total / self.latency.count, 1)
+            if self.latency.count
+            else None,
+            "min_ms": round(self.latency.minimum, 1) if self.latency.count else None,
+            "max_ms": round(self.latency.maximum, 1) if self.latency.count else None,
+            "active_seconds": round(self.active_seconds, 1),
+            "first_seen": _iso(self.first_seen),
+            "last_seen": _iso(self.last_seen),
+        }
+        for q in QUANTILES:
+            value = self.latency.quantile(q)
+            result[f"p{round(q * 100)}_ms"] = round(value, 1) if value is not None else None
+        return result
+
+
+def _iso(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds")
+
+
+def open_log(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def _structured_events(record: dict, source: str):
+    url = record.get("url")
+    timestamp = record.get("fetched_at") or record.get("ts") or record.get("time")
+    if not url or timestamp is None:
+        return
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp).timestamp()
+    latency = record.get("latency_ms")
+    status = record.get("status")
+    failed = bool(record.get("error")) or status == 0 or (status is not None and status >= 400)
+    started = timestamp - (latency or 0) / 1000
+    run = record.get("run_id") or f"{source}@{_iso(timestamp)[:10]}"
+    yield run, url, "error" if failed or latency is None else "ok", started, timestamp
+
+
+def _finished(message: str):
+    for pattern, outcome in FINISHED_PATTERNS:
+        match = pattern.match(message)
+        if match:
+            return match.group(1), outcome
+    return None
+
+
+def log_events(path: str):
+    source = os.path.basename(path)
+    pending = OrderedDict()
+    run = None
+    last_index = None
+
+    def flush_pending():
+        while pending:
+            url, started = pending.popitem(last=False)
+            yield run, url, "unmatched", started, started
+
+    with open_log(path) as handle:
+        for line in handle:
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield from _structured_events(record, source)
+                continue
+            match = LINE_PATTERN.match(line.rstrip("\r\n"))
+            if match is None:
+                continue
+            date_time, millis, _, message = match.groups()
+            timestamp = parse_timestamp(date_time, millis)
+
+            if message.startswith(RUN_START_MARKERS):
+                yield from flush_pending()
+                run, last_index = None, None
+                continue
+            downloading = DOWNLOADING_PATTERN.match(message)
+            if downloading:
+                index = downloading.group(1).split("/", 1)[0]
+                index = int(index) if index.isdigit() else None
+                restarted = index is not None and last_index is not None and index <= last_index
+                if run is None or restarted:
+                    yield from flush_pending()
+                    run = f"{source}@{_iso(timestamp)}"
+                last_index = index
+                url = downloading.group(2)
+                pending.pop(url, None)
+                pending[url] = timestamp
+                # A lost completion line must not let the join window grow without bound.
+                while len(pending) > MAX_PENDING:
+                    lost_url, started = pending.popitem(last=False)
+                    yield run, lost_url, "unmatched", started, started
+                continue
+            redirected = REDIRECTED_PATTERN.match(message)
+            if redirected:
+                # The capture is stored, and logged, under the URL the browser landed on.
+                source_url, landed = redirected.groups()
+                if source_url in pending:
+                    pending[landed] = pending.pop(source_url)
+                continue
+            finished = _finished(message)
+            if finished is not None:
+                url, outcome = finished
+                if url in pending:
+                    yield run, url, outcome, pending.pop(url), timestamp
+                continue
+            if message.startswith("Saved: "):
+                # Older logs name only the file, which the sequential downloaders wrote in order.
+                if pending:
+                    url, started = pending.popitem(last=False)
+                    yield run, url, "ok", started, timestamp
+                continue
+            for pattern in FAILURE_PATTERNS:
+                failed = pattern.match(message)
+                if failed:
+                    url = failed.group(1)
+                    started = pending.pop(url, timestamp)
+                    yield run or f"{source}@{_iso(timestamp)}", url, "error", started, timestamp
+                    break
+    yield from flush_pending()
+
+
+class LogReport:
+    def __init__(self) -> None:
+        self.total = Stats()
+        self.hosts = {}
+        self.runs = {}
+
+    def add(self, run: str, url: str, outcome: str, started: float, finished: float) -> None:
+        host = urlparse(url).hostname or ""
+        for stats in (self.total, self._stats(self.hosts, host), self._stats(self.runs, run or "")):
+            stats.record(outcome, started, finished)
+
+    @staticmethod
+    def _stats(table: dict, key: str) -> Stats:
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = Stats()
+        return stats
+
+    def read(self, path: str) -> None:
+        with stage("log_stats"):
+            for event in log_events(path):
+                self.add(*event)
+
+    def summary(self) -> dict:
+        return {
+            "total": self.total.summary(),
+            "hosts": {host: stats.summary() for host, stats in sorted(self.hosts.items())},
+            "runs": {
+                run: stats.summary()
+                for run, stats in sorted(self.runs.items(), key=lambda item: item[1].first_seen or 0)
+            },
+        }
+
+    def render(self) -> str:
+        lines = []
+        columns = f"{'pages':>6} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'pages/min':>10}"
+        for title, table in (("host", self.hosts), ("run", self.runs)):
+            lines.append(f"{title:52} {columns}")
+            rows = sorted(table.items(), key=lambda item: item[1].first_seen or 0)
+            for name, stats in rows:
+                lines.append(f"{name[:52]:52} {_row(stats.summary())}")
+            lines.append("")
+        lines.append(f"{'total':52} {_row(self.total.summary())}")
+        histograms = [("all pages", self.total)]
+        histograms.extend((f"host {host}", stats) for host, stats in sorted(self.hosts.items()))
+        for title, stats in histograms:
+            histogram = stats.latency.render()
+            if histogram:
+                lines.append("")
+                lines.append(f"latency, {title}:")
+                lines.extend(histogram)
+        return "\n".join(lines)
+
+
+def _row(summary: dict) -> str:
+    error_rate = summary["error_rate"]
+    error_pct = f"{error_rate * 100:.1f}" if error_rate is not None else "-"
+    per_minute = summary["pages_per_minute"]
+    return (
+        f"{summary['pages']:>6} {error_pct:>6} {format_ms(summary['p50_ms']):>8} "
+        f"{format_ms(summary['p95_ms']):>8} {format_ms(summary['p99_ms']):>8} "
+        f"{per_minute if per_minute is not None else '-':>10}"
+    )
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for host, now in current["hosts"].items():
+        before = baseline.get("hosts", {}).get(host)
+        if not before:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            if before.get(key) and now.get(key) and now[key] > before[key] * (1 + threshold):
+                regressions.append(f"{host}: {key} {before[key]:.0f} -> {now[key]:.0f}")
+        if (now.get("error_rate") or 0) > (before.get("error_rate") or 0) + threshold / 10:
+            regressions.append(
+                f"{host}: error rate {before.get('error_rate') or 0:.2%} -> {now['error_rate']:.2%}"
+            )
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize download latency from crawl logs.")
+    parser.add_argument("logs", nargs="*", help=f"log files (default: {LOG_PATTERN})")
+    parser.add_argument("--json", metavar="PATH", help="write the summary as JSON ('-' for stdout)")
+    parser.add_argument(
+        "--baseline", metavar="PATH", help="earlier --json summary to compare against"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative latency increase flagged as a regression",
+    )
+    add_profile_argument(parser, "log_stats")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    paths = args.logs or sorted(glob.glob(LOG_PATTERN))
+    if not paths:
+        logging.error("No logs found matching %s", LOG_PATTERN)
+        return 2
+
+    report = LogReport()
+    with profile_run(args.profile):
+        for path in paths:
+            report.read(path)
+    summary = report.summary()
+    if args.json == "-":
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+    else:
+        print(report.render())
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as out:
+                json.dump(summary, out, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            regressions = compare(summary, json.load(handle), args.threshold)
+        for regression in regressions:
+            logging.warning("Regression: %s", regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import threading
+
+from file_lock import directory_lock
+from pipeline import canonicalize_url, is_valid_url
+from profiling import stage
+
+
+REGISTRY_FILENAME = ".names.jsonl"
+
+
+def legacy_links(rows, row_link, slug_for):
+    for row in rows:
+        link_text, url = row_link(row)
+        if is_valid_url(url):
+            # Slugs come from the row as written; allocate() is keyed by canonical URL.
+            yield canonicalize_url(url), slug_for(link_text, url)
+
+
+def legacy_names(links):
+    # The downloaders used to number colliding slugs in link-table order, starting from -2.
+    used_names = set()
+    for url, slug in links:
+        name = f"{slug}.html"
+        index = 2
+        while name in used_names:
+            name = f"{slug}-{index}.html"
+            index += 1
+        used_names.add(name)
+        yield url, name
+
+
+def site_legacy_names(site, rows):
+    return legacy_names(legacy_links(rows, site.row_link, site.slug_for))
+
+
+def registry_names(output_dir: str, aliases: bool = True):
+    path = os.path.join(output_dir, REGISTRY_FILENAME)
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("url") and (aliases or "alias_of" not in record):
+                yield record["url"], record["name"]
+
+
+class NameRegistry:
+    def __init__(self, path: str, taken=None, legacy=None) -> None:
+        self.path = path
+        self.directory = os.path.dirname(path) or "."
+        self.names = {}
+        self.counters = {}
+        # A false positive here only costs a numbered suffix, so a Bloom filter is safe.
+        self._taken = set() if taken is None else taken
+        self._legacy = set()
+        self._offset = 0
+        self._lock = threading.Lock()
+
+        with directory_lock(self.directory):
+            is_new = not os.path.exists(path)
+            if not is_new:
+                self._refresh()
+            self._journal = open(path, "a", encoding="utf-8")
+            if is_new:
+                self._adopt_existing_files(self.directory, legacy)
+
+    def _refresh(self) -> None:
+        # Other workers append to the same journal; pick up whatever they wrote since last time.
+        with open(self.path, "rb") as handle:
+            handle.seek(self._offset)
+            data = handle.read()
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for line in data[:end].decode("utf-8").splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning("Ignoring corrupt name registry record in %s", self.path)
+                continue
+            self._apply(record)
+
+    def _apply(self, record: dict) -> None:
+        name = record["name"]
+        url = record.get("url")
+        self._taken.add(name)
+        if url is None:
+            self._legacy.add(name)
+        else:
+            self._legacy.discard(name)
+            self.names[url] = name
+        slug = record.get("slug")
+        if slug is not None:
+            self.counters[slug] = max(self.counters.get(slug, 2), record.get("next", 2))
+
+    def _adopt_existing_files(self, directory: str, legacy) -> None:
+        entries = {entry for entry in os.listdir(directory) if entry.lower().endswith(".html")}
+        for url, name in legacy_names(legacy or ()):
+            if name in entries and url not in self.names:
+                entries.discard(name)
+                self._taken.add(name)
+                self.names[url] = name
+                self._append({"url": url, "name": name})
+        for entry in sorted(entries):
+            self._legacy.add(entry)
+            self._taken.add(entry)
+            self._append({"name": entry, "url": None})
+
+    def _append(self, record: dict) -> None:
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+
+    def get(self, url: str):
+        return self.names.get(url)
+
+    def allocate(self, url: str, slug: str) -> str:
+        with stage("filename"), self._lock, directory_lock(self.directory):
+            self._refresh()
+            name = self.names.get(url)
+            if name is not None:
+                return name
+
+            name = f"{slug}.html"
+            record = {"url": url, "name": name}
+            if name in self._legacy:
+                self._legacy.discard(name)
+            elif name in self._taken:
+                index = self.counters.get(slug, 2)
+                name = f"{slug}-{index}.html"
+                while name in self._taken and name not in self._legacy:
+                    index += 1
+                    name = f"{slug}-{index}.html"
+                self._legacy.discard(name)
+                self.counters[slug] = index + 1
+                record = {"url": url, "name": name, "slug": slug, "next": index + 1}
+
+            self._taken.add(name)
+            self.names[url] = name
+            self._append(record)
+            return name
+
+    def alias(self, url: str, target_url: str):
+        with self._lock, directory_lock(self.directory):
+            self._refresh()
+            name = self.names.get(target_url)
+            if name is None or self.names.get(url) == name:
+                return name
+            self.names[url] = name
+            self._append({"url": url, "name": name, "alias_of": target_url})
+            return name
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def load_registry(output_dir: str, taken=None, legacy=None) -> NameRegistry:
+    return NameRegistry(os.path.join(output_dir, REGISTRY_FILENAME), taken, legacy)
@@ -0,0 +1,317 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from html.parser import HTMLParser
+
+from profiling import run_profiled, stage
+from warc_archive import has_archive, iter_archive
+
+
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+SHINGLE_SIZE = 5
+JACCARD_THRESHOLD = 0.9
+SIMHASH_MAX_DISTANCE = 3
+INDEX_FILENAME = ".near_duplicates.jsonl"
+# Journal records from another signature scheme cannot be compared and are skipped.
+SIGNATURE_SCHEME = "oph1"
+
+_HASH_MASK = (1 << 64) - 1
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class VisibleTextParser(HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.parts = []
+        self._skip_depth = 0
+        self._skip_tags = {"script", "style", "noscript", "template", "svg"}
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._skip_tags:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self._skip_tags and self._skip_depth > 0:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth == 0:
+            self.parts.append(data)
+
+
+def visible_text(html_text: str) -> str:
+    parser = VisibleTextParser()
+    parser.feed(html_text)
+    parser.close()
+    return " ".join(parser.parts)
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def hash64(value: str) -> int:
+    digest = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shingle_hashes(tokens: list, size: int = SHINGLE_SIZE) -> set:
+    if len(tokens) < size:
+        return {hash64(" ".join(tokens))} if tokens else set()
+    return {
+        hash64(" ".join(tokens[index:index + size]))
+        for index in range(len(tokens) - size + 1)
+    }
+
+
+def minhash(hashes: set):
+    # One-permutation hashing: each shingle lands in one bin, so a page costs a single pass
+    # instead of NUM_PERMUTATIONS passes.
+    if not hashes:
+        return None
+    bins = [_HASH_MASK] * NUM_PERMUTATIONS
+    for value in hashes:
+        index = value % NUM_PERMUTATIONS
+        value //= NUM_PERMUTATIONS
+        if value < bins[index]:
+            bins[index] = value
+    # Empty bins borrow the nearest filled bin to their right, offset by the distance, so
+    # short pages still produce comparable signatures.
+    offset = (_HASH_MASK // NUM_PERMUTATIONS) + 1
+    filled = next(index for index in range(NUM_PERMUTATIONS) if bins[index] != _HASH_MASK)
+    borrowed = (bins[filled], filled + NUM_PERMUTATIONS)
+    for index in range(NUM_PERMUTATIONS - 1, -1, -1):
+        if bins[index] != _HASH_MASK:
+            borrowed = (bins[index], index)
+        else:
+            bins[index] = borrowed[0] + (borrowed[1] - index) * offset
+    return tuple(bins)
+
+
+def simhash(tokens: list) -> int:
+    weights = {}
+    for token in tokens:
+        weights[token] = weights.get(token, 0) + 1
+    totals = [0] * 64
+    for token, weight in weights.items():
+        value = hash64(token)
+        for bit in range(64):
+            if value >> bit & 1:
+                totals[bit] += weight
+            else:
+                totals[bit] -= weight
+    result = 0
+    for bit, total in enumerate(totals):
+        if total > 0:
+            result |= 1 << bit
+    return result
+
+
+def hamming_distance(left: int, right: int) -> int:
+    return bin(left ^ right).count("1")
+
+
+def estimate_jaccard(left: tuple, right: tuple) -> float:
+    matches = sum(1 for a, b in zip(left, right) if a == b)
+    return matches / len(left)
+
+
+def page_signature(html_text: str) -> tuple:
+    tokens = tokenize(visible_text(html_text))
+    return minhash(shingle_hashes(tokens)), simhash(tokens)
+
+
+class NearDuplicateIndex:
+    def __init__(
+        self,
+        bands: int = LSH_BANDS,
+        jaccard_threshold: float = JACCARD_THRESHOLD,
+        simhash_max_distance: int = SIMHASH_MAX_DISTANCE,
+    ) -> None:
+        if NUM_PERMUTATIONS % bands:
+            raise ValueError("bands must divide NUM_PERMUTATIONS")
+        self.bands = bands
+        self.rows = NUM_PERMUTATIONS // bands
+        self.jaccard_threshold = jaccard_threshold
+        self.simhash_max_distance = simhash_max_distance
+        self.signatures = {}
+        self._buckets = [{} for _ in range(bands)]
+        self._journal = None
+
+    def _band_keys(self, signature: tuple):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, hash(signature[start:start + self.rows])
+
+    def _unindex(self, key: str) -> bool:
+        known = self.signatures.pop(key, None)
+        if known is None:
+            return False
+        for band, band_key in self._band_keys(known[0]):
+            members = self._buckets[band][band_key]
+            members.remove(key)
+            if not members:
+                del self._buckets[band][band_key]
+        return True
+
+    def _log(self, record: dict) -> None:
+        if self._journal is not None:
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+
+    def add(self, key: str, signature: tuple, simhash_value: int) -> None:
+        # A re-fetched page replaces its old signature; the old content no longer exists.
+        if self.signatures.get(key) == (signature, simhash_value):
+            return
+        self._unindex(key)
+        self.signatures[key] = (signature, simhash_value)
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+        self._log(
+            {
+                "key": key,
+                "minhash": list(signature),
+                "simhash": simhash_value,
+                "scheme": SIGNATURE_SCHEME,
+            }
+        )
+
+    def discard(self, key: str) -> None:
+        if self._unindex(key):
+            self._log({"key": key, "removed": True, "scheme": SIGNATURE_SCHEME})
+
+    def candidates(self, signature: tuple) -> set:
+        found = set()
+        for band, band_key in self._band_keys(signature):
+            found.update(self._buckets[band].get(band_key, ()))
+        return found
+
+    def query(self, signature: tuple, simhash_value: int, exclude: str = None):
+        best_key = None
+        best_score = 0.0
+        for key in self.candidates(signature):
+            if key == exclude:
+                continue
+            other_signature, other_simhash = self.signatures[key]
+            score = estimate_jaccard(signature, other_signature)
+            if score < self.jaccard_threshold:
+                if hamming_distance(simhash_value, other_simhash) > self.simhash_max_distance:
+                    continue
+            if score > best_score or best_key is None:
+                best_key = key
+                best_score = score
+        return best_key, best_score
+
+    def check_and_add(self, key: str, html_text: str):
+        signature, simhash_value = page_signature(html_text)
+        if signature is None:
+            # Pages without visible text would all look identical to each other.
+            return None, 0.0
+        match, score = self.query(signature, simhash_value, exclude=key)
+        if match is None:
+            self.add(key, signature, simhash_value)
+        else:
+            self.discard(key)
+        return match, score
+
+    def clusters(self) -> list:
+        parent = {key: key for key in self.signatures}
+
+        def find(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for buckets in self._buckets:
+            for members in buckets.values():
+                for other in members[1:]:
+                    left_sig, left_sim = self.signatures[members[0]]
+                    right_sig, right_sim = self.signatures[other]
+                    if (
+                        estimate_jaccard(left_sig, right_sig) >= self.jaccard_threshold
+                        or hamming_distance(left_sim, right_sim) <= self.simhash_max_distance
+                    ):
+                        parent[find(other)] = find(members[0])
+
+        groups = {}
+        for key in self.signatures:
+            groups.setdefault(find(key), []).append(key)
+        return [sorted(group) for group in groups.values() if len(group) > 1]
+
+    def open_journal(self, path: str) -> None:
+        stale = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning("Ignoring corrupt near-duplicate record in %s", path)
+                        continue
+                    if record.get("scheme") != SIGNATURE_SCHEME:
+                        stale += 1
+                        continue
+                    if record.get("removed"):
+                        self._unindex(record["key"])
+                        continue
+                    self.add(record["key"], tuple(record["minhash"]), record["simhash"])
+        if stale:
+            logging.warning("Ignoring %d near-duplicate records from an older scheme in %s", stale, path)
+        self._journal = open(path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def load_index(output_dir: str) -> NearDuplicateIndex:
+    index = NearDuplicateIndex()
+    index.open_journal(os.path.join(output_dir, INDEX_FILENAME))
+    return index
+
+
+def is_near_duplicate(index: NearDuplicateIndex, url: str, html_text: str) -> bool:
+    with stage("near_duplicate"):
+        match, score = index.check_and_add(url, html_text)
+    if match is None:
+        return False
+    logging.warning("Near-duplicate of %s (similarity %.2f): %s", match, score, url)
+    return True
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    directories = sys.argv[1:] or ["downloaded_html"]
+    index = NearDuplicateIndex()
+    for directory in directories:
+        if has_archive(directory):
+            for record in iter_archive(directory):
+                signature, simhash_value = page_signature(record.text())
+                if signature is not None:
+                    index.add(record.url, signature, simhash_value)
+        for entry in sorted(os.listdir(directory)):
+            if not entry.lower().endswith(".html"):
+                continue
+            path = os.path.join(directory, entry)
+            with open(path, "r", encoding="utf-8") as handle:
+                signature, simhash_value = page_signature(handle.read())
+            if signature is not None:
+                index.add(path, signature, simhash_value)
+
+    for group in index.clusters():
+        logging.info("Near-duplicate cluster (%d pages):", len(group))
+        for path in group:
+            logging.info("  %s", path)
+
+
+if __name__ == "__main__":
+    run_profiled(main, "near_duplicates")
@@ -0,0 +1,190 @@
+import codecs
+import mmap
+import os
+import struct
+import zipfile
+from urllib.parse import urlparse
+
+
+READ_CHUNK_SIZE = 64 * 1024
+_LOCAL_HEADER_SIZE = 30
+EXTRA_MIRRORS = {"fantezii-articles": ["downloaded_htm_articles"]}
+
+
+def _decode(blocks, encoding: str):
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    try:
+        for block in blocks:
+            text = decoder.decode(block)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+    finally:
+        close = getattr(blocks, "close", None)
+        if close is not None:
+            close()
+
+
+def _mapped_blocks(handle, offset: int, length: int, chunk_size: int):
+    if length <= 0:
+        return
+    with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        view = memoryview(mapped)
+        try:
+            end = offset + length
+            for start in range(offset, end, chunk_size):
+                block = view[start : min(start + chunk_size, end)]
+                try:
+                    yield block
+                finally:
+                    block.release()
+        finally:
+            view.release()
+
+
+def file_chunks(path: str, encoding: str = "utf-8", chunk_size: int = READ_CHUNK_SIZE):
+    with open(path, "rb") as handle:
+        size = os.fstat(handle.fileno()).st_size
+        yield from _decode(_mapped_blocks(handle, 0, size, chunk_size), encoding)
+
+
+def _member_offset(handle, info: zipfile.ZipInfo) -> int:
+    handle.seek(info.header_offset)
+    header = handle.read(_LOCAL_HEADER_SIZE)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length
+
+
+def zip_chunks(archive, member: str, encoding: str = "utf-8", chunk_size: int = READ_CHUNK_SIZE):
+    owned = not isinstance(archive, zipfile.ZipFile)
+    if owned:
+        archive = zipfile.ZipFile(archive)
+    try:
+        info = archive.getinfo(member)
+        if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+            # Stored members are plain bytes inside the archive, so they can be mapped directly.
+            with open(archive.filename, "rb") as handle:
+                offset = _member_offset(handle, info)
+                blocks = _mapped_blocks(handle, offset, info.file_size, chunk_size)
+                yield from _decode(blocks, encoding)
+            return
+        with archive.open(info) as stream:
+            yield from _decode(iter(lambda: stream.read(chunk_size), b""), encoding)
+    finally:
+        if owned:
+            archive.close()
+
+
+def source_chunks(source, encoding: str = "utf-8", chunk_size: int = READ_CHUNK_SIZE):
+    if source[0] == "file":
+        return file_chunks(source[1], encoding, chunk_size)
+    if source[0] == "zip":
+        return zip_chunks(source[1], source[2], encoding, chunk_size)
+    raise ValueError(f"Unsupported page source: {source[0]}")
+
+
+def feed_parser(parser, chunks) -> int:
+    # Parsers that set `done` once their container closes stop the read early.
+    fed = 0
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+            fed += len(chunk)
+            if getattr(parser, "done", False):
+                break
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return fed
+
+
+def lookup_keys(url: str):
+    from pipeline import canonicalize_url
+
+    canonical = canonicalize_url(url)
+    yield canonical
+    parsed = urlparse(canonical)
+    path = parsed.path
+    alternate_path = path[:-1] if path.endswith("/") and path != "/" else path + "/"
+    for scheme in (parsed.scheme, "https" if parsed.scheme == "http" else "http"):
+        for candidate_path in (path, alternate_path):
+            yield parsed._replace(scheme=scheme, path=candidate_path).geturl()
+
+
+class MirrorSource:
+    def __init__(self, root: str = ".") -> None:
+        self.root = root
+        self.entries = {}
+        self._zips = {}
+
+    def _path(self, *parts) -> str:
+        return os.path.join(self.root, *parts)
+
+    def locate(self, site, name: str):
+        directories = [site.output_dir] + EXTRA_MIRRORS.get(site.name, [])
+        for directory in directories:
+            path = self._path(directory, name)
+            if os.path.exists(path):
+                return ("file", path)
+        zip_path = self._path(f"{site.output_dir}.zip")
+        if os.path.exists(zip_path):
+            archive = self._zips.get(zip_path)
+            if archive is None:
+                archive = zipfile.ZipFile(zip_path)
+                self._zips[zip_path] = archive
+            member = f"{site.output_dir}/{name}"
+            if member in archive.NameToInfo:
+                return ("zip", zip_path, member)
+        return None
+
+    def add(self, url: str, source) -> None:
+        from pipeline import canonicalize_url
+
+        self.entries.setdefault(canonicalize_url(url), source)
+
+    def load_archive(self, directory: str) -> None:
+        # Mirror reading pulls in the archive and registry modules; scrapers only need the readers above.
+        from pipeline import canonicalize_url
+        from warc_archive import CDX_FILENAME, CdxIndex
+
+        for entry in CdxIndex(os.path.join(directory, CDX_FILENAME)):
+            warc_path = os.path.join(directory, entry.filename)
+            self.entries[canonicalize_url(entry.url)] = ("warc", warc_path, entry.offset, entry.length)
+
+    def load_sites(self, sites) -> None:
+        from link_table import find_link_table, read_link_rows
+        from name_registry import registry_names, site_legacy_names
+
+        for site in sites:
+            if site.seed_html and os.path.exists(self._path(site.seed_html)):
+                self.add(site.seed_urls[0], ("file", self._path(site.seed_html)))
+            self.load_archive(self._path(site.output_dir))
+            table_path = find_link_table(self._path(site.links_csv))
+            if not os.path.exists(table_path):
+                continue
+            mapping = dict(site_legacy_names(site, read_link_rows(table_path)))
+            mapping.update(registry_names(self._path(site.output_dir)))
+            for url, name in mapping.items():
+                source = self.locate(site, name)
+                if source is not None:
+                    self.add(url, source)
+
+    def find(self, url: str):
+        for key in lookup_keys(url):
+            source = self.entries.get(key)
+            if source is not None:
+                return source
+        return None
+
+    def read(self, source) -> bytes:
+        if source[0] == "file":
+            with open(source[1], "rb") as handle:
+                return handle.read()
+        if source[0] == "warc":
+            from warc_archive import read_record
+
+            return read_record(source[1], source[2], source[3]).payload
+        return self._zips[source[1]].read(source[2])
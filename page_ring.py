@@ -0,0 +1,145 @@
+import codecs
+import multiprocessing
+import sys
+
+from profiling import stage
+
+
+RING_SLOTS = 32
+SLOT_SIZE = 1024 * 1024
+DECODE_CHUNK_SIZE = 64 * 1024
+_OVERSIZE = -1
+
+
+def _attach(name: str):
+    from multiprocessing import resource_tracker, shared_memory
+
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    memory = shared_memory.SharedMemory(name=name)
+    # Only the creating process may unlink the block; stop the tracker from doing it on exit.
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+
+def decode_chunks(data, encoding: str = "utf-8", chunk_size: int = DECODE_CHUNK_SIZE):
+    view = memoryview(data)
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for start in range(0, len(view), chunk_size):
+        text = decoder.decode(view[start : start + chunk_size])
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def text_chunks(source, encoding: str = "utf-8"):
+    if isinstance(source, str):
+        # Slicing lets parsers that finish early skip the rest of the page.
+        starts = range(0, len(source), DECODE_CHUNK_SIZE)
+        return (source[start : start + DECODE_CHUNK_SIZE] for start in starts)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return decode_chunks(source, encoding)
+    return source
+
+
+class RingPage:
+    def __init__(self, ring, slot: int, length: int, meta, payload: bytes = None) -> None:
+        self.ring = ring
+        self.slot = slot
+        self.length = length
+        self.meta = meta
+        self._payload = payload
+        self._view = None
+
+    @property
+    def view(self) -> memoryview:
+        if self._view is None:
+            if self._payload is not None:
+                self._view = memoryview(self._payload)
+            else:
+                offset = self.slot * self.ring.slot_size
+                self._view = self.ring.buffer[offset : offset + self.length]
+        return self._view
+
+    def chunks(self, encoding: str = "utf-8"):
+        return decode_chunks(self.view, encoding)
+
+    def release(self) -> None:
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self.slot != _OVERSIZE:
+            self.ring._free.put(self.slot)
+            self.slot = _OVERSIZE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class PageRing:
+    def __init__(self, slots: int = RING_SLOTS, slot_size: int = SLOT_SIZE, context=None) -> None:
+        from multiprocessing import shared_memory
+
+        context = context or multiprocessing.get_context()
+        self.slots = slots
+        self.slot_size = slot_size
+        self._memory = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self._owner = True
+        self._free = context.Queue()
+        self._ready = context.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_memory"] = self._memory.name
+        state["_owner"] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._memory = _attach(state["_memory"])
+
+    @property
+    def buffer(self) -> memoryview:
+        return self._memory.buf
+
+    def put(self, data, meta=None, timeout: float = None) -> None:
+        length = len(data)
+        if length > self.slot_size:
+            # Rare oversized pages fall back to the pickled control channel.
+            self._ready.put((_OVERSIZE, length, meta, bytes(data)))
+            return
+        with stage("ring_wait"):
+            slot = self._free.get(timeout=timeout)
+        offset = slot * self.slot_size
+        self._memory.buf[offset : offset + length] = data
+        self._ready.put((slot, length, meta, None))
+
+    def get(self, timeout: float = None):
+        item = self._ready.get(timeout=timeout)
+        if item is None:
+            return None
+        slot, length, meta, payload = item
+        return RingPage(self, slot, length, meta, payload)
+
+    def finish(self, consumers: int = 1) -> None:
+        for _ in range(consumers):
+            self._ready.put(None)
+
+    def close(self) -> None:
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+            self._owner = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
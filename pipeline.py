@@ -0,0 +1,181 @@
+import logging
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlparse, urlunparse
+
+from profiling import stage
+
+
+QUEUE_SIZE = 64
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_DONE = object()
+
+
+def is_valid_url(url: str) -> bool:
+    if not url:
+        return False
+    parsed = urlparse(url)
+    return parsed.scheme in ("http", "https") and bool(parsed.netloc)
+
+
+def canonicalize_url(url: str) -> str:
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    netloc = host
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parsed.port}"
+    if parsed.username:
+        credentials = parsed.username
+        if parsed.password:
+            credentials = f"{credentials}:{parsed.password}"
+        netloc = f"{credentials}@{netloc}"
+    path = parsed.path or "/"
+    return urlunparse((scheme, netloc, path, parsed.params, parsed.query, ""))
+
+
+def row_link(row: dict):
+    link_text = (row.get("link_text") or "").strip()
+    url = (row.get("full_url") or "").strip()
+    return link_text, url
+
+
+def read_stage(rows):
+    yield from enumerate(rows, start=1)
+
+
+def validate_stage(numbered_rows, extract=row_link):
+    for index, row in numbered_rows:
+        link_text, url = extract(row)
+        if not is_valid_url(url):
+            logging.error("Skipping invalid URL at row %d: %s", index, url)
+            continue
+        yield index, link_text, url
+
+
+def canonicalize_stage(items):
+    for index, link_text, url in items:
+        yield index, link_text, canonicalize_url(url)
+
+
+def dedup_stage(items, seen=None):
+    seen = set() if seen is None else seen
+    for index, link_text, url in items:
+        if url in seen:
+            logging.info("Skipping duplicate URL at row %d: %s", index, url)
+            continue
+        seen.add(url)
+        yield index, link_text, url
+
+
+def work_items(rows, extract=row_link, seen=None):
+    return dedup_stage(canonicalize_stage(validate_stage(read_stage(rows), extract)), seen)
+
+
+def prefetch(iterable, maxsize: int = QUEUE_SIZE):
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def offer(item) -> bool:
+        # Gives up once the consumer has stopped, so a full buffer never blocks forever.
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            with stage("read_links"):
+                for item in iterable:
+                    if not offer(item):
+                        return
+        except BaseException as exc:
+            offer((_DONE, exc))
+            return
+        offer((_DONE, None))
+
+    thread = threading.Thread(target=produce, name="pipeline-reader", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if isinstance(item, tuple) and len(item) == 2 and item[0] is _DONE:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def progress_label(index: int, total: int = None) -> str:
+    if total is None:
+        return f"{index}/?"
+    return f"{index}/{total}"
+
+
+class BackgroundWriter:
+    def __init__(self, maxsize: int = QUEUE_SIZE) -> None:
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._run, name="pipeline-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is _DONE:
+                return
+            function, args = job
+            try:
+                function(*args)
+            except Exception:
+                logging.exception("Store stage failed")
+
+    def submit(self, function, *args) -> None:
+        self._queue.put((function, args))
+
+    def close(self) -> None:
+        self._queue.put(_DONE)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RateLimiter:
+    def __init__(self, base_delay: float, jitter: float = 0.0) -> None:
+        self.base_delay = base_delay
+        self.jitter = jitter
+        self._next_allowed = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_allowed:
+                time.sleep(self._next_allowed - now)
+                now = self._next_allowed
+            self._next_allowed = now + self.base_delay + random.uniform(0, self.jitter)
+
+
+def save_page(output_path: str, html: str, url: str, logger=logging) -> bool:
+    try:
+        with stage("write"):
+            with open(output_path, "w", encoding="utf-8") as out:
+                out.write(html)
+    except OSError as exc:
+        logger.error("File write error for %s: %s", url, exc)
+        return False
+    logger.info("Saved: %s from %s", output_path, url)
+    return True
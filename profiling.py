@@ -0,0 +1,248 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+DEFAULT_INTERVAL = 0.005
+MAX_STACK_DEPTH = 64
+TOP_N = 15
+MAIN_STAGE = "main"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+_active = None
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "stack", "started")
+
+    def __init__(self, profiler, name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stacks = self.profiler.stage_stacks
+        ident = threading.get_ident()
+        self.stack = stacks.get(ident)
+        if self.stack is None:
+            self.stack = stacks.setdefault(ident, [])
+        self.stack.append(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.stack.pop()
+        self.profiler.record_time(self.name, elapsed)
+        return False
+
+
+def stage(name: str):
+    profiler = _active
+    if profiler is None:
+        return _NULL_STAGE
+    return _Stage(profiler, name)
+
+
+def _frame_label(code) -> str:
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}.{code.co_name}:{code.co_firstlineno}"
+
+
+class StageProfiler:
+    def __init__(self, interval: float = DEFAULT_INTERVAL) -> None:
+        self.interval = interval
+        self.stage_stacks = {}
+        self.samples = Counter()
+        self.stage_times = defaultdict(float)
+        self.stage_calls = Counter()
+        self.started = None
+        self.elapsed = 0.0
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._main_ident = threading.main_thread().ident
+
+    def record_time(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            self.stage_times[name] += elapsed
+            self.stage_calls[name] += 1
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = _frame_label(code)
+            self._labels[code] = label
+        return label
+
+    def _sample(self) -> None:
+        own_ident = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            # The owning thread pushes and pops concurrently; work on a snapshot.
+            stages = tuple(self.stage_stacks.get(ident, ()))
+            if stages:
+                current = stages[-1]
+            elif ident == self._main_ident:
+                current = MAIN_STAGE
+            else:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[(current, tuple(stack))] += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def collapsed_lines(self):
+        for (stage_name, stack), count in sorted(self.samples.items()):
+            yield ";".join((stage_name,) + stack) + f" {count}\n"
+
+    def speedscope(self, name: str) -> dict:
+        frames = []
+        frame_index = {}
+        by_stage = defaultdict(list)
+        for (stage_name, stack), count in self.samples.items():
+            indexes = []
+            for label in stack:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indexes.append(frame_index[label])
+            by_stage[stage_name].append((indexes, count * self.interval))
+        profiles = []
+        for stage_name, entries in sorted(by_stage.items()):
+            total = sum(weight for _, weight in entries)
+            profiles.append(
+                {
+                    "type": "sampled",
+                    "name": stage_name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": total,
+                    "samples": [indexes for indexes, _ in entries],
+                    "weights": [weight for _, weight in entries],
+                }
+            )
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "profiling.py",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def summary(self, top_n: int = TOP_N) -> str:
+        stage_samples = Counter()
+        self_samples = defaultdict(Counter)
+        for (stage_name, stack), count in self.samples.items():
+            stage_samples[stage_name] += count
+            if stack:
+                self_samples[stage_name][stack[-1]] += count
+        names = set(self.stage_times) | set(stage_samples)
+        lines = [f"Profiled {self.elapsed:.2f}s, {sum(stage_samples.values())} samples"]
+        lines.append(f"{'stage':24} {'calls':>8} {'wall s':>10} {'mean ms':>10} {'samples':>8}")
+        for name in sorted(names, key=lambda item: -self.stage_times.get(item, 0.0)):
+            calls = self.stage_calls.get(name, 0)
+            wall = self.stage_times.get(name, 0.0)
+            mean = wall / calls * 1000 if calls else 0.0
+            lines.append(f"{name:24} {calls:>8} {wall:>10.3f} {mean:>10.2f} {stage_samples[name]:>8}")
+        for name in sorted(self_samples, key=lambda item: -stage_samples[item]):
+            lines.append("")
+            lines.append(f"[{name}] top {top_n} by self samples")
+            total = stage_samples[name]
+            for label, count in self_samples[name].most_common(top_n):
+                lines.append(f"{count:>8} {count / total:>6.1%}  {label}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix: str) -> None:
+        name = os.path.basename(prefix)
+        with open(f"{prefix}.collapsed.txt", "w", encoding="utf-8") as out:
+            out.writelines(self.collapsed_lines())
+        with open(f"{prefix}.speedscope.json", "w", encoding="utf-8") as out:
+            json.dump(self.speedscope(name), out)
+        report = self.summary()
+        with open(f"{prefix}.txt", "w", encoding="utf-8") as out:
+            out.write(report)
+        sys.stderr.write(report)
+        logging.info("Profile written to %s.{collapsed.txt,speedscope.json,txt}", prefix)
+
+
+@contextlib.contextmanager
+def profile_run(prefix: str = None, interval: float = DEFAULT_INTERVAL):
+    global _active
+    if not prefix:
+        yield None
+        return
+    profiler = StageProfiler(interval)
+    _active = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = None
+        profiler.write(prefix)
+
+
+def add_profile_argument(parser, name: str) -> None:
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=f"profile_{name}",
+        metavar="PREFIX",
+        help="sample per-stage stacks and write PREFIX.collapsed.txt, .speedscope.json and .txt",
+    )
+
+
+def pop_profile_argument(argv: list, name: str):
+    prefix = None
+    for index, value in enumerate(argv):
+        if value == "--profile":
+            # A bare flag never takes the next token, which is the script's own argument.
+            prefix = f"profile_{name}"
+            del argv[index]
+            break
+        if value.startswith("--profile="):
+            prefix = value.split("=", 1)[1]
+            del argv[index]
+            break
+    return prefix
+
+
+def run_profiled(main, name: str):
+    prefix = pop_profile_argument(sys.argv, name)
+    with profile_run(prefix):
+        return main()
@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from pipeline import canonicalize_url
+
+
+REDIRECTS_FILENAME = ".redirects.jsonl"
+
+
+class RedirectCache:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.finals = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+        self._journal = None
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Ignoring corrupt redirect record in %s", self.path)
+                    continue
+                self.finals[canonicalize_url(record["url"])] = record["final"]
+
+    def resolve(self, url: str) -> str:
+        with self._lock:
+            return self.finals.get(canonicalize_url(url), url)
+
+    def record(self, url: str, final_url: str) -> bool:
+        key = canonicalize_url(url)
+        with self._lock:
+            previous = self.finals.get(key)
+            if previous == final_url:
+                return False
+            if previous is None and canonicalize_url(final_url) == key:
+                return False
+            self.finals[key] = final_url
+            if self._journal is None:
+                self._journal = open(self.path, "a", encoding="utf-8")
+            record = {"url": url, "final": final_url, "seen_at": int(time.time())}
+            self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._journal.flush()
+        if canonicalize_url(final_url) != key:
+            logging.info("Redirect recorded: %s -> %s", url, final_url)
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+def load_redirects(output_dir: str) -> RedirectCache:
+    os.makedirs(output_dir, exist_ok=True)
+    return RedirectCache(os.path.join(output_dir, REDIRECTS_FILENAME))
@@ -0,0 +1,211 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from page_reader import MirrorSource
+from pipeline import canonicalize_url, is_valid_url
+from profiling import add_profile_argument, profile_run, stage
+from sites import SITES
+
+
+DEFAULT_PORT = 8765
+RECORD_INDEX = "recorded.jsonl"
+USER_AGENT = "Mozilla/5.0 (replay-recorder)"
+
+
+def replay_url(replay_base: str, url: str) -> str:
+    if not replay_base:
+        return url
+    return f"{replay_base.rstrip('/')}/{url}"
+
+
+def original_url(replay_base: str, url: str) -> str:
+    prefix = f"{replay_base.rstrip('/')}/" if replay_base else ""
+    if prefix and url.startswith(prefix):
+        return url[len(prefix):]
+    return url
+
+
+class Recorder:
+    def __init__(self, directory: str, mirror: MirrorSource) -> None:
+        self.directory = directory
+        self.mirror = mirror
+        self.index_path = os.path.join(directory, RECORD_INDEX)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    mirror.add(record["url"], ("file", os.path.join(directory, record["file"])))
+
+    def record(self, url: str):
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                body = response.read()
+                status = response.status
+                content_type = response.headers.get("Content-Type", "")
+        except urllib.error.HTTPError as exc:
+            body = exc.read()
+            status = exc.code
+            content_type = exc.headers.get("Content-Type", "")
+        filename = hashlib.sha1(canonicalize_url(url).encode("utf-8")).hexdigest() + ".body"
+        with self._lock:
+            with open(os.path.join(self.directory, filename), "wb") as out:
+                out.write(body)
+            with open(self.index_path, "a", encoding="utf-8") as index:
+                record = {
+                    "url": url,
+                    "file": filename,
+                    "status": status,
+                    "content_type": content_type,
+                    "recorded_at": time.time(),
+                }
+                index.write(json.dumps(record) + "\n")
+            if status == 200:
+                self.mirror.add(url, ("file", os.path.join(self.directory, filename)))
+        logging.info("Recorded %s (%d, %d bytes)", url, status, len(body))
+        return status, content_type, body
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    server_version = "ReplayServer/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+    def _target_url(self) -> str:
+        path = self.path
+        if path.startswith(("http://", "https://")):
+            return path
+        if path.startswith(("/http://", "/https://")):
+            return path[1:]
+        host = self.headers.get("Host", "")
+        return f"https://{host}{path}"
+
+    def _send(self, status: int, body: bytes, content_type: str, include_body: bool) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def _serve(self, include_body: bool) -> None:
+        config = self.server.config
+        url = self._target_url()
+        delay = config.delay()
+        if delay > 0:
+            time.sleep(delay)
+        if config.should_fail():
+            self._send(503, b"injected error", "text/plain", include_body)
+            return
+
+        source = self.server.mirror.find(url)
+        if source is not None:
+            body = self.server.mirror.read(source)
+            self._send(200, body, "text/html; charset=utf-8", include_body)
+            return
+        if config.recorder is not None and is_valid_url(url):
+            try:
+                status, content_type, body = config.recorder.record(url)
+            except (urllib.error.URLError, OSError) as exc:
+                logging.error("Record failed for %s: %s", url, exc)
+                self._send(502, str(exc).encode("utf-8"), "text/plain", include_body)
+                return
+            self._send(status, body, content_type or "application/octet-stream", include_body)
+            return
+        self._send(404, f"Not in replay set: {url}".encode("utf-8"), "text/plain", include_body)
+
+    def do_GET(self):
+        with stage("replay"):
+            self._serve(include_body=True)
+
+    def do_HEAD(self):
+        with stage("replay"):
+            self._serve(include_body=False)
+
+
+class ReplayConfig:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None, recorder=None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.recorder = recorder
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+
+def make_server(mirror: MirrorSource, config: ReplayConfig, host: str = "127.0.0.1", port: int = 0):
+    server = ThreadingHTTPServer((host, port), ReplayHandler)
+    server.daemon_threads = True
+    server.mirror = mirror
+    server.config = config
+    return server
+
+
+def start_in_background(server) -> threading.Thread:
+    thread = threading.Thread(target=server.serve_forever, name="replay-server", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve mirrored pages under their original URLs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--root", default=".", help="repository root holding the mirrors")
+    parser.add_argument("--site", action="append", default=[], help="limit to these sites")
+    parser.add_argument("--latency", type=float, default=0.0, help="base latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for repeatable runs")
+    parser.add_argument("--record", metavar="DIR", help="fetch and store pages missing from the mirror")
+    add_profile_argument(parser, "replay_server")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    sites = [SITES[name] for name in args.site] if args.site else list(SITES.values())
+    mirror = MirrorSource(args.root)
+    mirror.load_sites(sites)
+    recorder = Recorder(args.record, mirror) if args.record else None
+    config = ReplayConfig(args.latency, args.jitter, args.error_rate, args.seed, recorder)
+    server = make_server(mirror, config, args.host, args.port)
+    host, port = server.server_address[:2]
+    logging.info("Replaying %d URLs on http://%s:%d/", len(mirror.entries), host, port)
+    try:
+        with profile_run(args.profile):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
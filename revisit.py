@@ -0,0 +1,170 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+from near_duplicates import tokenize, visible_text
+from pipeline import canonicalize_url
+from profiling import run_profiled, stage
+
+
+REVISITS_FILENAME = ".revisits.jsonl"
+# Pages that never change are still revisited about once per MAX_REVISIT_AGE.
+MAX_REVISIT_AGE = 30 * 24 * 3600
+
+
+def content_hash(html_text: str) -> str:
+    tokens = tokenize(visible_text(html_text))
+    return hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PageHistory:
+    __slots__ = ("url", "visits", "changes", "first_seen", "last_seen", "last_hash")
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.visits = 0
+        self.changes = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.last_hash = None
+
+    def observe(self, digest: str, seen_at: float) -> bool:
+        changed = self.last_hash is not None and digest != self.last_hash
+        if self.first_seen is None:
+            self.first_seen = seen_at
+        self.visits += 1
+        self.changes += changed
+        self.last_seen = seen_at
+        self.last_hash = digest
+        return changed
+
+    def change_rate(self) -> float:
+        # Cho & Garcia-Molina estimator for changes detected over n equal-ish intervals.
+        intervals = self.visits - 1
+        span = (self.last_seen or 0) - (self.first_seen or 0)
+        if intervals <= 0 or span <= 0:
+            return None
+        mean_interval = span / intervals
+        unchanged = intervals - self.changes
+        return -math.log((unchanged + 0.5) / (intervals + 0.5)) / mean_interval
+
+    def priority(self, now: float) -> float:
+        if self.last_seen is None:
+            return 1.0
+        rate = self.change_rate()
+        if rate is None:
+            rate = 0.0
+        elapsed = max(0.0, now - self.last_seen)
+        return 1 - math.exp(-(rate + 1 / MAX_REVISIT_AGE) * elapsed)
+
+
+class RevisitHistory:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.pages = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+        self._journal = None
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning("Ignoring corrupt revisit record in %s", self.path)
+                    continue
+                self._page(record["url"]).observe(record["hash"], record["seen_at"])
+
+    def _page(self, url: str) -> PageHistory:
+        key = canonicalize_url(url)
+        page = self.pages.get(key)
+        if page is None:
+            page = self.pages[key] = PageHistory(url)
+        return page
+
+    def get(self, url: str) -> PageHistory:
+        with self._lock:
+            return self.pages.get(canonicalize_url(url))
+
+    def observe(self, url: str, html_text: str, seen_at: float = None) -> bool:
+        with stage("content_hash"):
+            digest = content_hash(html_text)
+        seen_at = time.time() if seen_at is None else seen_at
+        with self._lock:
+            changed = self._page(url).observe(digest, seen_at)
+            if self._journal is None:
+                self._journal = open(self.path, "a", encoding="utf-8")
+            record = {"url": url, "hash": digest, "seen_at": int(seen_at)}
+            self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._journal.flush()
+        return changed
+
+    def priority(self, url: str, now: float = None) -> float:
+        page = self.get(url)
+        if page is None:
+            return 1.0
+        return page.priority(time.time() if now is None else now)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+def load_history(output_dir: str) -> RevisitHistory:
+    os.makedirs(output_dir, exist_ok=True)
+    return RevisitHistory(os.path.join(output_dir, REVISITS_FILENAME))
+
+
+def plan_revisits(items, history: RevisitHistory, budget: int = None, resolve=None, now: float = None):
+    now = time.time() if now is None else now
+    scored = []
+    for position, item in enumerate(items):
+        url = item[-1]
+        target = resolve(url) if resolve is not None else url
+        scored.append((-history.priority(target, now), position, item))
+    scored.sort()
+    if budget is not None:
+        scored = scored[: max(0, budget)]
+    return [item for _, _, item in scored]
+
+
+def main(argv=None) -> int:
+    from sites import SITES, get_site
+
+    parser = argparse.ArgumentParser(description="Show estimated change rates and revisit order.")
+    parser.add_argument("--site", action="append", default=[], help="site name (repeatable)")
+    parser.add_argument("--top", type=int, default=20, help="rows to show per site")
+    args = parser.parse_args(argv)
+
+    sites = [get_site(name) for name in args.site] if args.site else list(SITES.values())
+    now = time.time()
+    for site in sites:
+        history = RevisitHistory(os.path.join(site.output_dir, REVISITS_FILENAME))
+        pages = sorted(history.pages.values(), key=lambda page: -page.priority(now))
+        print(f"{site.name}: {len(pages)} pages")
+        print(f"  {'priority':>8} {'changes/day':>11} {'visits':>6} {'changes':>7}  url")
+        for page in pages[: args.top]:
+            rate = page.change_rate()
+            per_day = f"{rate * 86400:.2f}" if rate is not None else "-"
+            print(
+                f"  {page.priority(now):>8.3f} {per_day:>11} {page.visits:>6} {page.changes:>7}  {page.url}"
+            )
+        history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_profiled(main, "revisit"))
@@ -0,0 +1,262 @@
+import argparse
+import dataclasses
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+STEPS = ("extract", "link_graph", "paginate", "link_table", "filenames", "link_check", "download")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+DOWNLOAD_MAX = 10_000
+SITE_NAMES = {"close": "close", "pipedrive": "pipedrive", "wordpress": "fantezii"}
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_site(kind: str, size: int):
+    from synth_site import SyntheticSite
+
+    return SyntheticSite(kind, size)
+
+
+def registered_site(kind: str, workdir: str):
+    from sites import SITES
+
+    return dataclasses.replace(
+        SITES[SITE_NAMES[kind]],
+        links_csv=os.path.join(workdir, "links.csv"),
+        output_dir=os.path.join(workdir, "mirror"),
+        log_path=os.path.join(workdir, "download.log"),
+        base_delay=0.0,
+        jitter=0.0,
+    )
+
+
+def write_link_table(site, synthetic, path: str) -> int:
+    from link_table import LinkTableWriter
+
+    with LinkTableWriter(path, site.name) as writer:
+        for index in range(synthetic.pages):
+            writer.write(synthetic.title(index), synthetic.page_url(index), synthetic.base_url, None)
+    return writer.count
+
+
+def step_extract(kind, size, workdir, args):
+    html_text = synthetic_site(kind, size).seed_html()
+    site = registered_site(kind, workdir)
+    started = time.perf_counter()
+    links = site.extract(html_text)
+    return len(links), time.perf_counter() - started
+
+
+def step_link_graph(kind, size, workdir, args):
+    from link_graph import page_links
+
+    html_text = synthetic_site(kind, size).seed_html()
+    site = registered_site(kind, workdir)
+    started = time.perf_counter()
+    page = page_links(site, site.base_url, html_text)
+    links = site.filter_links(page.collected())
+    return len(links) + len(page.graph_edges()), time.perf_counter() - started
+
+
+def step_paginate(kind, size, workdir, args):
+    from scraper_fantezii_articles import extract_post_links
+
+    synthetic = synthetic_site("wordpress", size)
+    started = time.perf_counter()
+    posts = 0
+    for page_number in range(1, synthetic.listing_pages + 1):
+        posts += len(extract_post_links(synthetic.listing_html(page_number)))
+    return posts, time.perf_counter() - started
+
+
+def step_link_table(kind, size, workdir, args):
+    from frontier import url_set
+    from link_table import count_link_rows, read_link_rows
+    from pipeline import work_items
+
+    site = registered_site(kind, workdir)
+    started = time.perf_counter()
+    write_link_table(site, synthetic_site(kind, size), site.links_csv)
+    count_link_rows(site.links_csv)
+    seen = url_set(args.memory_bounded)
+    items = sum(1 for _ in work_items(read_link_rows(site.links_csv), site.row_link, seen))
+    return items, time.perf_counter() - started
+
+
+def step_filenames(kind, size, workdir, args):
+    from frontier import url_set
+    from name_registry import load_registry
+
+    synthetic = synthetic_site(kind, size)
+    site = registered_site(kind, workdir)
+    os.makedirs(site.output_dir, exist_ok=True)
+    registry = load_registry(site.output_dir, url_set(args.memory_bounded))
+    started = time.perf_counter()
+    for index in range(size):
+        url = synthetic.page_url(index)
+        registry.allocate(url, site.slug_for(synthetic.title(index), url))
+    registry.close()
+    return size, time.perf_counter() - started
+
+
+def serve_synthetic(synthetic):
+    import multiprocessing
+
+    from replay_server import ReplayConfig, make_server
+    from synth_site import SyntheticMirror
+
+    server = make_server(SyntheticMirror(synthetic), ReplayConfig())
+    host, port = server.server_address[:2]
+    serving = multiprocessing.Process(target=server.serve_forever, daemon=True)
+    serving.start()
+    server.server_close()
+    return serving, f"http://{host}:{port}"
+
+
+def step_link_check(kind, size, workdir, args):
+    from link_check import check_links
+
+    synthetic = synthetic_site(kind, size)
+    serving, replay_base = serve_synthetic(synthetic)
+    items = ((kind, synthetic.title(index), synthetic.page_url(index)) for index in range(size))
+    started = time.perf_counter()
+    try:
+        counts = check_links(items, lambda record: None, replay_base=replay_base)
+    finally:
+        serving.terminate()
+    return counts["ok"], time.perf_counter() - started
+
+
+def step_download(kind, size, workdir, args):
+    import logging
+
+    from browser import DriverPool
+    from crawl import download_site, site_logger
+    from pipeline import RateLimiter
+    from revisit import REVISITS_FILENAME
+    from storage import open_storage
+    from synth_site import UrllibDriver
+
+    synthetic = synthetic_site(kind, size)
+    site = registered_site(kind, workdir)
+    write_link_table(site, synthetic, site.links_csv)
+    serving, replay_base = serve_synthetic(synthetic)
+    logging.getLogger().setLevel(logging.WARNING)
+    pool = DriverPool(1, replay_base=replay_base, factory=UrllibDriver)
+    storage = open_storage(args.storage, near_duplicate_mode=args.near_duplicates)
+    started = time.perf_counter()
+    try:
+        download_site(site, pool, storage, RateLimiter(0.0), site_logger(site), False)
+    finally:
+        storage.close()
+        pool.close()
+        serving.terminate()
+    elapsed = time.perf_counter() - started
+    with open(os.path.join(site.output_dir, REVISITS_FILENAME), encoding="utf-8") as handle:
+        stored = sum(1 for _ in handle)
+    return stored, elapsed
+
+
+def run_child(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="scale-")
+    try:
+        step = globals()[f"step_{args.child}"]
+        items, seconds = step(args.kind, args.size, workdir, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    result = {
+        "step": args.child,
+        "kind": args.kind,
+        "size": args.size,
+        "items": items,
+        "seconds": round(seconds, 4),
+        "rate": round(items / seconds, 1) if seconds else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print(json.dumps(result))
+    return 0
+
+
+def child_command(args, step: str, size: int):
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--child",
+        step,
+        "--kind",
+        args.kind,
+        "--size",
+        str(size),
+        "--storage",
+        args.storage,
+        "--near-duplicates",
+        args.near_duplicates,
+    ]
+    if args.memory_bounded:
+        command.append("--memory-bounded")
+    return command
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run scrapers and downloaders against synthetic sites."
+    )
+    parser.add_argument("--kind", choices=sorted(SITE_NAMES), default="close")
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(size) for size in DEFAULT_SIZES),
+        help="comma-separated page counts",
+    )
+    parser.add_argument("--steps", default=",".join(STEPS), help="comma-separated steps to run")
+    parser.add_argument(
+        "--download-max", type=int, default=DOWNLOAD_MAX, help="skip downloads above this size"
+    )
+    parser.add_argument("--storage", choices=("files", "warc"), default="files")
+    parser.add_argument("--near-duplicates", choices=("mark", "skip", "off"), default="mark")
+    parser.add_argument("--memory-bounded", action="store_true", help="use Bloom-filter seen sets")
+    parser.add_argument("--output", help="also write results as JSON to this path")
+    parser.add_argument("--child", choices=STEPS, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return run_child(args)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    steps = [step for step in args.steps.split(",") if step]
+    results = []
+    failures = 0
+    print(f"{'step':12} {'size':>9} {'items':>9} {'seconds':>9} {'items/s':>11} {'peak MB':>9}")
+    for step in steps:
+        for size in sizes:
+            if step == "download" and size > args.download_max:
+                continue
+            completed = subprocess.run(child_command(args, step, size), capture_output=True, text=True)
+            if completed.returncode != 0:
+                failures += 1
+                error = completed.stderr.strip().splitlines()[-1:] or ["no output"]
+                print(f"{step:12} {size:>9} failed: {error[0]}")
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(
+                f"{step:12} {size:>9} {result['items']:>9} {result['seconds']:>9.2f} "
+                f"{result['rate'] or 0:>11.0f} {result['peak_rss_mb']:>9.1f}"
+            )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,20 @@
-import csv
 from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse
 
+from catalog import Catalog
+from extract_cache import extract_file, source_version
+from link_table import LinkTableWriter, columnar_path
+from page_reader import feed_parser
+from page_ring import text_chunks
+from profiling import run_profiled, stage
+
 
 BASE_URL = "https://www.digitalwealthpartners.net"
+SITE = "digitalwealthpartners"
+CATALOG_PATH = "crawl_catalog.db"
+EXTRACT_CACHE_PATH = "extract_cache.db"
+OUTPUT_FORMAT = "csv"
+NAV_SELECTOR = "nav.navbar"
 
 
 class TopNavParser(HTMLParser):
@@ -16,6 +27,7 @@ class TopNavParser(HTMLParser):
         self.anchor_text_parts = []
         self.anchor_attrs = {}
         self.collected = []
+        self.done = False
         self._class_stack = []
 
         self._void_tags = {
@@ -70,6 +82,7 @@ class TopNavParser(HTMLParser):
             if self.nav_depth <= 0:
                 self.in_nav = False
                 self.nav_depth = 0
+                self.done = True
 
     def handle_data(self, data):
         if self.in_nav and self.in_anchor:
@@ -110,13 +123,11 @@ def should_skip_link(text: str, href: str, attrs: dict) -> bool:
     return False
 
 
-def extract_top_nav_links(html_text: str):
-    parser = TopNavParser()
-    parser.feed(html_text)
+def filter_top_nav_links(collected):
     results = []
     seen_urls = set()
 
-    for text, href, attrs in parser.collected:
+    for text, href, attrs in collected:
         if should_skip_link(text, href, attrs):
             continue
         full_url = normalize_link(href)
@@ -130,17 +141,28 @@ def extract_top_nav_links(html_text: str):
     return results
 
 
-def main() -> None:
-    with open("digitalwealthpartners.html", "r", encoding="utf-8") as handle:
-        html_text = handle.read()
+def extract_top_nav_links(html_text: str):
+    parser = TopNavParser()
+    with stage("parse"):
+        feed_parser(parser, text_chunks(html_text))
+    return filter_top_nav_links(parser.collected)
 
-    links = extract_top_nav_links(html_text)
 
-    with open("navigation_links_digitalwealthpartners.csv", "w", newline="", encoding="utf-8") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["link_text", "full_url"])
-        writer.writerows(links)
+def main() -> None:
+    links = extract_file(
+        "digitalwealthpartners.html",
+        f"{SITE}.top_nav",
+        source_version(__file__, "page_reader", "page_ring", "link_table"),
+        extract_top_nav_links,
+        EXTRACT_CACHE_PATH,
+    )
+
+    output_path = columnar_path("navigation_links_digitalwealthpartners.csv", OUTPUT_FORMAT)
+    with Catalog(CATALOG_PATH) as catalog, LinkTableWriter(
+        output_path, SITE, catalog=catalog
+    ) as writer:
+        writer.writerows(links, source_page=BASE_URL)
 
 
 if __name__ == "__main__":
-    main()
+    run_profiled(main, "scraper_digital")
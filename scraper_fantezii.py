@@ -1,15 +1,28 @@
-import csv
 import logging
+import os
 import random
 import time
 from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse
 
-import undetected_chromedriver as uc
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from catalog import Catalog
+from dom_extract import extract_links_in_browser
+from frontier import url_frontier, url_set
+from link_table import LinkTableWriter, columnar_path, utc_now
+from page_reader import feed_parser
+from page_ring import text_chunks
+from profiling import run_profiled, stage
 
 
 BASE_URL = "https://fanteziigreieriprostii.ro/"
+SITE = "fantezii"
+OUTPUT_CSV = "navigation_links_fantezii.csv"
+CATALOG_PATH = "crawl_catalog.db"
+OUTPUT_FORMAT = "csv"
+NAV_SELECTOR = "header#masthead nav#access"
+ARCHIVE_PAGES = False
+MEMORY_BOUNDED = False
+ARCHIVE_DIR = "scraped_pages_fantezii"
 LAST_PAGE = 11
 PAGE_LOAD_TIMEOUT = 30
 BASE_DELAY_SECONDS = 2
@@ -27,6 +40,7 @@ class NavigationParser(HTMLParser):
         self.anchor_text_parts = []
         self.anchor_attrs = {}
         self.collected = []
+        self.done = False
         self._class_stack = []
 
         self._void_tags = {
@@ -81,6 +95,7 @@ class NavigationParser(HTMLParser):
             if self.nav_depth <= 0:
                 self.in_nav = False
                 self.nav_depth = 0
+                self.done = True
         if self.in_header and tag == "header":
             self.in_header = False
 
@@ -123,13 +138,11 @@ def should_skip_link(text: str, href: str, attrs: dict) -> bool:
     return False
 
 
-def extract_navigation_links(html_text: str):
-    parser = NavigationParser()
-    parser.feed(html_text)
+def filter_navigation_links(collected):
     results = []
     seen_urls = set()
 
-    for text, href, attrs in parser.collected:
+    for text, href, attrs in collected:
         if should_skip_link(text, href, attrs):
             continue
         full_url = normalize_link(href)
@@ -143,12 +156,29 @@ def extract_navigation_links(html_text: str):
     return results
 
 
+def extract_navigation_links(html_text: str):
+    parser = NavigationParser()
+    with stage("parse"):
+        feed_parser(parser, text_chunks(html_text))
+    return filter_navigation_links(parser.collected)
+
+
+def archive_page(page_number: int, html_text: str) -> None:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIR, f"page-{page_number}.html"), "w", encoding="utf-8") as out:
+        out.write(html_text)
+
+
 def main() -> None:
+    import undetected_chromedriver as uc
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+
     logging.basicConfig(level=logging.INFO, format="%(message)s")
-    all_links = []
-    seen_urls = set()
+    all_links = url_frontier(MEMORY_BOUNDED)
+    seen_urls = url_set(MEMORY_BOUNDED)
 
-    driver = uc.Chrome()
+    with stage("driver_start"):
+        driver = uc.Chrome()
     driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
     try:
         for page_number in range(1, LAST_PAGE + 1):
@@ -158,8 +188,18 @@ def main() -> None:
                 page_url = f"{BASE_URL}page/{page_number}/"
             logging.info("Scraping navigation from %s", page_url)
             try:
-                driver.get(page_url)
-                html_text = driver.page_source
+                with stage("driver_get"):
+                    driver.get(page_url)
+                fetch_time = utc_now()
+                if ARCHIVE_PAGES:
+                    with stage("page_source"):
+                        html_text = driver.page_source
+                    archive_page(page_number, html_text)
+                    links = extract_navigation_links(html_text)
+                else:
+                    links = filter_navigation_links(
+                        extract_links_in_browser(driver, NAV_SELECTOR)
+                    )
             except TimeoutException:
                 logging.warning("Timeout while loading %s", page_url)
                 continue
@@ -167,23 +207,24 @@ def main() -> None:
                 logging.warning("WebDriver error for %s: %s", page_url, exc)
                 continue
 
-            links = extract_navigation_links(html_text)
             for text, url in links:
                 if url in seen_urls:
                     continue
                 seen_urls.add(url)
-                all_links.append((text, url))
+                all_links.append((text, url, page_url, fetch_time))
 
             delay = BASE_DELAY_SECONDS + random.uniform(0, JITTER_SECONDS)
             time.sleep(delay)
     finally:
         driver.quit()
 
-    with open("navigation_links_fantezii.csv", "w", newline="", encoding="utf-8") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["link_text", "full_url"])
-        writer.writerows(all_links)
+    output_path = columnar_path(OUTPUT_CSV, OUTPUT_FORMAT)
+    with Catalog(CATALOG_PATH) as catalog, LinkTableWriter(
+        output_path, SITE, catalog=catalog
+    ) as writer:
+        for text, url, page_url, fetch_time in all_links:
+            writer.write(text, url, page_url, fetch_time)
 
 
 if __name__ == "__main__":
-    main()
+    run_profiled(main, "scraper_fantezii")
@@ -1,12 +1,17 @@
-import csv
 import logging
+import os
 import random
 import time
 from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse
 
-import undetected_chromedriver as uc
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from catalog import Catalog
+from dom_extract import extract_links_in_browser
+from frontier import url_frontier, url_set
+from link_table import LinkTableWriter, columnar_path, utc_now
+from page_reader import feed_parser
+from page_ring import text_chunks
+from profiling import run_profiled, stage
 
 
 BASE_URL = "https://fanteziigreieriprostii.ro/"
@@ -14,6 +19,13 @@ PAGE_LOAD_TIMEOUT = 30
 BASE_DELAY_SECONDS = 2
 JITTER_SECONDS = 1.5
 OUTPUT_CSV = "article_csv.csv"
+CATALOG_PATH = "crawl_catalog.db"
+OUTPUT_FORMAT = "csv"
+SITE = "fantezii"
+POST_SELECTOR = "div.featured-image-overlay"
+ARCHIVE_PAGES = False
+MEMORY_BOUNDED = False
+ARCHIVE_DIR = "scraped_pages_fantezii_articles"
 
 CATEGORY_PAGES = [
     ("https://fanteziigreieriprostii.ro/category/poezie/", 7),
@@ -70,13 +82,11 @@ def normalize_link(href: str) -> str:
     return urljoin(BASE_URL, href)
 
 
-def extract_post_links(html_text: str):
-    parser = FeaturedImageLinkParser()
-    parser.feed(html_text)
+def filter_post_links(hrefs):
     results = []
     seen = set()
 
-    for href in parser.links:
+    for href in hrefs:
         full_url = normalize_link(href.strip())
         if not is_fantezii_domain(full_url):
             continue
@@ -88,18 +98,36 @@ def extract_post_links(html_text: str):
     return results
 
 
+def extract_post_links(html_text: str):
+    parser = FeaturedImageLinkParser()
+    with stage("parse"):
+        feed_parser(parser, text_chunks(html_text))
+    return filter_post_links(parser.links)
+
+
 def page_url_for(base_url: str, page_number: int) -> str:
     if page_number == 1:
         return base_url
     return f"{base_url}page/{page_number}/"
 
 
+def archive_page(page_url: str, html_text: str) -> None:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    name = urlparse(page_url).path.strip("/").replace("/", "-") or "index"
+    with open(os.path.join(ARCHIVE_DIR, f"{name}.html"), "w", encoding="utf-8") as out:
+        out.write(html_text)
+
+
 def main() -> None:
+    import undetected_chromedriver as uc
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+
     logging.basicConfig(level=logging.INFO, format="%(message)s")
-    all_links = []
-    seen_urls = set()
+    all_links = url_frontier(MEMORY_BOUNDED)
+    seen_urls = url_set(MEMORY_BOUNDED)
 
-    driver = uc.Chrome()
+    with stage("driver_start"):
+        driver = uc.Chrome()
     driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
     try:
         for base_url, max_page in CATEGORY_PAGES:
@@ -107,8 +135,17 @@ def main() -> None:
                 page_url = page_url_for(base_url, page_number)
                 logging.info("Scraping posts from %s", page_url)
                 try:
-                    driver.get(page_url)
-                    html_text = driver.page_source
+                    with stage("driver_get"):
+                        driver.get(page_url)
+                    fetch_time = utc_now()
+                    if ARCHIVE_PAGES:
+                        with stage("page_source"):
+                            html_text = driver.page_source
+                        archive_page(page_url, html_text)
+                        links = extract_post_links(html_text)
+                    else:
+                        collected = extract_links_in_browser(driver, POST_SELECTOR)
+                        links = filter_post_links(href for _, href, _ in collected if href)
                 except TimeoutException:
                     logging.warning("Timeout while loading %s", page_url)
                     continue
@@ -116,26 +153,26 @@ def main() -> None:
                     logging.warning("WebDriver error for %s: %s", page_url, exc)
                     continue
 
-                links = extract_post_links(html_text)
                 for url in links:
                     if url in seen_urls:
                         continue
                     seen_urls.add(url)
-                    all_links.append(url)
+                    all_links.append((url, page_url, fetch_time))
 
                 delay = BASE_DELAY_SECONDS + random.uniform(0, JITTER_SECONDS)
                 time.sleep(delay)
     finally:
         driver.quit()
 
-    with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["post_url"])
-        for url in all_links:
-            writer.writerow([url])
+    output_path = columnar_path(OUTPUT_CSV, OUTPUT_FORMAT)
+    with Catalog(CATALOG_PATH) as catalog, LinkTableWriter(
+        output_path, SITE, csv_columns=["post_url"], catalog=catalog
+    ) as writer:
+        for url, page_url, fetch_time in all_links:
+            writer.write("", url, page_url, fetch_time)
 
-    logging.info("Saved %d unique post links to %s", len(all_links), OUTPUT_CSV)
+    logging.info("Saved %d unique post links to %s", writer.count, output_path)
 
 
 if __name__ == "__main__":
-    main()
+    run_profiled(main, "scraper_fantezii_articles")
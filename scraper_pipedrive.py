@@ -1,8 +1,19 @@
-import csv
 from html.parser import HTMLParser
 from urllib.parse import urljoin, urlparse
 
+from catalog import Catalog
+from extract_cache import extract_file, source_version
+from link_table import LinkTableWriter, columnar_path
+from page_reader import feed_parser
+from page_ring import text_chunks
+from profiling import run_profiled, stage
+
 BASE_URL = "https://www.pipedrive.com"
+SITE = "pipedrive"
+CATALOG_PATH = "crawl_catalog.db"
+EXTRACT_CACHE_PATH = "extract_cache.db"
+OUTPUT_FORMAT = "csv"
+NAV_SELECTOR = "header.puco-header"
 
 class TopNavParser(HTMLParser):
     def __init__(self) -> None:
@@ -13,6 +24,7 @@ class TopNavParser(HTMLParser):
         self.anchor_text_parts = []
         self.anchor_attrs = {}
         self.collected = []
+        self.done = False
         self._class_stack = []
 
         self._void_tags = {
@@ -61,6 +73,7 @@ class TopNavParser(HTMLParser):
             self._class_stack.pop()
         if self.in_header and tag == "header":
             self.in_header = False
+            self.done = True
 
     def handle_data(self, data):
         if self.in_header and self.in_anchor:
@@ -104,13 +117,11 @@ def should_skip_link(text: str, href: str, attrs: dict) -> bool:
     return False
 
 
-def extract_top_nav_links(html_text: str):
-    parser = TopNavParser()
-    parser.feed(html_text)
+def filter_top_nav_links(collected):
     results = []
     seen_urls = set()
 
-    for text, href, attrs in parser.collected:
+    for text, href, attrs in collected:
         if should_skip_link(text, href, attrs):
             continue
         full_url = normalize_link(href)
@@ -124,18 +135,29 @@ def extract_top_nav_links(html_text: str):
     return results
 
 
-def main() -> None:
-    with open("pipedrive.html", "r", encoding="utf-8") as handle:
-        html_text = handle.read()
+def extract_top_nav_links(html_text: str):
+    parser = TopNavParser()
+    with stage("parse"):
+        feed_parser(parser, text_chunks(html_text))
+    return filter_top_nav_links(parser.collected)
 
-    links = extract_top_nav_links(html_text)
 
-    with open("navigation_links_pipedrive.csv", "w", newline="", encoding="utf-8") as handle:
-        writer = csv.writer(handle)
-        writer.writerow(["link_text", "full_url"])
-        writer.writerows(links)
+def main() -> None:
+    links = extract_file(
+        "pipedrive.html",
+        f"{SITE}.top_nav",
+        source_version(__file__, "page_reader", "page_ring", "link_table"),
+        extract_top_nav_links,
+        EXTRACT_CACHE_PATH,
+    )
+
+    output_path = columnar_path("navigation_links_pipedrive.csv", OUTPUT_FORMAT)
+    with Catalog(CATALOG_PATH) as catalog, LinkTableWriter(
+        output_path, SITE, catalog=catalog
+    ) as writer:
+        writer.writerows(links, source_page=BASE_URL)
 
 
 if __name__ == "__main__":
-    main()
+    run_profiled(main, "scraper_pipedrive")
 
@@ -0,0 +1,293 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+from pipeline import RateLimiter
+
+
+STATE_DIR = ".crawl_state"
+ROBOTS_CACHE = "robots_cache.json"
+SITEMAP_STATE = "sitemap_state.json"
+ROBOTS_TTL_SECONDS = 24 * 3600
+USER_AGENT = "Mozilla/5.0 (compatible; nav-scraper)"
+FALLBACK_SITEMAPS = ("sitemap_index.xml", "sitemap.xml", "wp-sitemap.xml")
+CHUNK_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 30
+DEFAULT_DELAY_SECONDS = 1.0
+SITEMAP_NAMESPACES = (
+    "",
+    "http://www.sitemaps.org/schemas/sitemap/0.9",
+    "http://www.google.com/schemas/sitemap/0.84",
+)
+
+
+def _state_path(name: str, state_dir: str = STATE_DIR) -> str:
+    os.makedirs(state_dir, exist_ok=True)
+    return os.path.join(state_dir, name)
+
+
+def _load_json(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (OSError, json.JSONDecodeError) as exc:
+        logging.warning("Ignoring unreadable state file %s: %s", path, exc)
+        return {}
+
+
+def _save_json(path: str, data: dict) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as handle:
+        json.dump(data, handle, indent=1, sort_keys=True)
+    os.replace(temporary, path)
+
+
+def parse_lastmod(value: str):
+    if not value:
+        return None
+    value = value.strip()
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_crawl_delay(body: str, user_agent: str = USER_AGENT):
+    agent_token = user_agent.split("/")[0].lower()
+    specific = None
+    default = None
+    agents = []
+    in_rules = False
+    for line in body.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if ":" not in line:
+            continue
+        key, value = (part.strip() for part in line.split(":", 1))
+        key = key.lower()
+        if key == "user-agent":
+            if in_rules:
+                agents = []
+                in_rules = False
+            agents.append(value.lower())
+            continue
+        in_rules = True
+        if key != "crawl-delay":
+            continue
+        try:
+            delay = float(value)
+        except ValueError:
+            continue
+        for agent in agents:
+            if agent == "*":
+                default = delay
+            elif agent in agent_token or agent_token in agent:
+                specific = delay
+    return specific if specific is not None else default
+
+
+def host_root(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class RobotsCache:
+    def __init__(self, state_dir: str = STATE_DIR, ttl: int = ROBOTS_TTL_SECONDS) -> None:
+        self.path = _state_path(ROBOTS_CACHE, state_dir)
+        self.ttl = ttl
+        self._entries = _load_json(self.path)
+        self._parsers = {}
+        self._lock = threading.Lock()
+
+    def _fetch(self, root: str) -> dict:
+        request = urllib.request.Request(f"{root}/robots.txt", headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                body = response.read().decode("utf-8", errors="replace")
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            body = ""
+            status = exc.code
+        except (urllib.error.URLError, OSError) as exc:
+            logging.warning("Could not fetch robots.txt for %s: %s", root, exc)
+            body = ""
+            status = 0
+        return {"fetched_at": time.time(), "status": status, "body": body}
+
+    def parser_for(self, url: str) -> RobotFileParser:
+        root = host_root(url)
+        with self._lock:
+            parser = self._parsers.get(root)
+            if parser is not None:
+                return parser
+            entry = self._entries.get(root)
+            if entry is None or time.time() - entry["fetched_at"] > self.ttl:
+                entry = self._fetch(root)
+                self._entries[root] = entry
+                _save_json(self.path, self._entries)
+            parser = RobotFileParser(f"{root}/robots.txt")
+            if entry["status"] in (401, 403):
+                parser.disallow_all = True
+            elif entry["status"] >= 400 or entry["status"] == 0:
+                parser.allow_all = True
+            else:
+                parser.parse(entry["body"].splitlines())
+            parser.modified()
+            self._parsers[root] = parser
+            return parser
+
+    def crawl_delay(self, url: str, user_agent: str = USER_AGENT):
+        parser = self.parser_for(url)
+        entry = self._entries.get(host_root(url), {})
+        delay = parse_crawl_delay(entry.get("body", ""), user_agent)
+        if delay is None:
+            rate = parser.request_rate(user_agent)
+            if rate is not None and rate.requests:
+                delay = rate.seconds / rate.requests
+        return delay
+
+    def can_fetch(self, url: str, user_agent: str = USER_AGENT) -> bool:
+        return self.parser_for(url).can_fetch(user_agent, url)
+
+    def sitemaps(self, url: str) -> list:
+        return list(self.parser_for(url).site_maps() or [])
+
+
+def _split_tag(tag: str):
+    if tag.startswith("{"):
+        namespace, _, name = tag[1:].partition("}")
+        return namespace, name
+    return "", tag
+
+
+def _sitemap_name(tag: str):
+    # Extension elements (image:loc, video:…, news:…, xhtml:link) reuse the same local names.
+    namespace, name = _split_tag(tag)
+    return name if namespace in SITEMAP_NAMESPACES else None
+
+
+def stream_sitemap(url: str):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    parser = XMLPullParser(events=("start", "end"))
+    decompressor = None
+    root = None
+    open_tags = []
+    entry = {}
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+        encoding = response.headers.get("Content-Encoding", "")
+        if url.endswith(".gz") or encoding == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = element
+                    open_tags.append(_sitemap_name(element.tag))
+                    continue
+                name = open_tags.pop()
+                parent = open_tags[-1] if open_tags else None
+                if name in ("loc", "lastmod"):
+                    if parent in ("url", "sitemap"):
+                        entry[name] = (element.text or "").strip()
+                elif name in ("url", "sitemap"):
+                    if entry.get("loc"):
+                        yield name, entry["loc"], parse_lastmod(entry.get("lastmod"))
+                    entry = {}
+                    root.clear()
+    parser.close()
+
+
+def discover_sitemaps(base_url: str, robots: RobotsCache):
+    listed = robots.sitemaps(base_url)
+    if listed:
+        return listed, False
+    root = host_root(base_url)
+    return [urljoin(root + "/", name) for name in FALLBACK_SITEMAPS], True
+
+
+def seed_urls(
+    base_url: str,
+    robots: RobotsCache,
+    since=None,
+    url_pattern: str = None,
+    sitemap_pattern: str = None,
+):
+    pattern = re.compile(url_pattern) if url_pattern else None
+    sitemap_filter = re.compile(sitemap_pattern) if sitemap_pattern else None
+    delay = robots.crawl_delay(base_url)
+    limiter = RateLimiter(delay if delay is not None else DEFAULT_DELAY_SECONDS)
+    pending, guessed = discover_sitemaps(base_url, robots)
+    fallbacks = set(pending) if guessed else set()
+    visited = set()
+
+    while pending:
+        sitemap_url = pending.pop(0)
+        if sitemap_url in visited:
+            continue
+        visited.add(sitemap_url)
+        if not robots.can_fetch(sitemap_url):
+            logging.info("robots.txt disallows %s", sitemap_url)
+            continue
+        limiter.wait()
+        logging.info("Reading sitemap %s", sitemap_url)
+        produced = False
+        try:
+            for kind, loc, lastmod in stream_sitemap(sitemap_url):
+                produced = True
+                if since is not None and lastmod is not None and lastmod <= since:
+                    continue
+                if kind == "sitemap":
+                    if sitemap_filter is None or sitemap_filter.search(loc):
+                        pending.append(loc)
+                    continue
+                if pattern and not pattern.search(loc):
+                    continue
+                if not robots.can_fetch(loc):
+                    continue
+                yield loc, lastmod
+        except urllib.error.HTTPError as exc:
+            if exc.code != 404:
+                logging.warning("Sitemap %s returned HTTP %d", sitemap_url, exc.code)
+        except (urllib.error.URLError, OSError, ParseError) as exc:
+            logging.warning("Could not read sitemap %s: %s", sitemap_url, exc)
+        if produced and sitemap_url in fallbacks:
+            pending = [url for url in pending if url not in fallbacks]
+
+
+class SitemapState:
+    def __init__(self, state_dir: str = STATE_DIR) -> None:
+        self.path = _state_path(SITEMAP_STATE, state_dir)
+        self.data = _load_json(self.path)
+
+    def last_run(self, site_name: str):
+        value = self.data.get(site_name, {}).get("last_run")
+        return parse_lastmod(value) if value else None
+
+    def mark_run(self, site_name: str, started: datetime, count: int) -> None:
+        self.data[site_name] = {
+            "last_run": started.isoformat(timespec="seconds"),
+            "last_count": count,
+        }
+        _save_json(self.path, self.data)
@@ -0,0 +1,188 @@
+import re
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+from scraper import EXCLUDE_TEXT_SELECTOR as CLOSE_EXCLUDE_TEXT_SELECTOR
+from scraper import NAV_SELECTOR as CLOSE_NAV_SELECTOR
+from scraper import extract_top_nav_links as extract_close_links
+from scraper import filter_top_nav_links as filter_close_links
+from scraper_digital import NAV_SELECTOR as DIGITALWEALTHPARTNERS_NAV_SELECTOR
+from scraper_digital import extract_top_nav_links as extract_digitalwealthpartners_links
+from scraper_digital import filter_top_nav_links as filter_digitalwealthpartners_links
+from scraper_familyoffice import NAV_SELECTOR as DIGITALFAMILYOFFICE_NAV_SELECTOR
+from scraper_familyoffice import extract_top_nav_links as extract_digitalfamilyoffice_links
+from scraper_familyoffice import filter_top_nav_links as filter_digitalfamilyoffice_links
+from scraper_fantezii import LAST_PAGE as FANTEZII_LAST_PAGE
+from scraper_fantezii import NAV_SELECTOR as FANTEZII_NAV_SELECTOR
+from scraper_fantezii import extract_navigation_links as extract_fantezii_links
+from scraper_fantezii import filter_navigation_links as filter_fantezii_links
+from scraper_fantezii_articles import (
+    CATEGORY_PAGES,
+    POST_SELECTOR,
+    extract_post_links,
+    filter_post_links,
+    page_url_for,
+)
+from scraper_pipedrive import NAV_SELECTOR as PIPEDRIVE_NAV_SELECTOR
+from scraper_pipedrive import extract_top_nav_links as extract_pipedrive_links
+from scraper_pipedrive import filter_top_nav_links as filter_pipedrive_links
+
+
+def slugify(value: str) -> str:
+    value = value.lower().strip()
+    value = re.sub(r"[^a-z0-9]+", "-", value)
+    return value.strip("-")
+
+
+def extract_fantezii_posts(html_text: str):
+    return [("", url) for url in extract_post_links(html_text)]
+
+
+def filter_fantezii_posts(collected):
+    return [("", url) for url in filter_post_links(href for _, href, _ in collected if href)]
+
+
+@dataclass(frozen=True)
+class Site:
+    name: str
+    base_url: str
+    domain: str
+    extract: object
+    links_csv: str
+    output_dir: str
+    log_path: str
+    seed_urls: tuple
+    seed_html: str = None
+    slug_source: str = "text"
+    default_slug: str = "home"
+    csv_columns: tuple = ("link_text", "full_url")
+    base_delay: float = 2.0
+    jitter: float = 1.5
+    sitemap_url_pattern: str = None
+    sitemap_index_pattern: str = None
+    link_selector: str = None
+    exclude_text_selector: str = None
+    filter_links: object = None
+
+    def owns(self, url: str) -> bool:
+        netloc = urlparse(url).netloc.lower()
+        return bool(netloc) and netloc.endswith(self.domain)
+
+    def slug_for(self, link_text: str, url: str) -> str:
+        slug = slugify(link_text) if self.slug_source == "text" else ""
+        if not slug:
+            path = urlparse(url).path.strip("/")
+            slug = slugify(path.replace("/", "-")) or self.default_slug
+        return slug
+
+    def row_link(self, row: dict):
+        link_text = (row.get("link_text") or "").strip()
+        for key in ("full_url", "post_url", "url"):
+            url = (row.get(key) or "").strip()
+            if url:
+                return link_text, url
+        return link_text, ""
+
+
+SITES = {
+    site.name: site
+    for site in (
+        Site(
+            name="close",
+            base_url="https://www.close.com",
+            domain="close.com",
+            extract=extract_close_links,
+            links_csv="navigation_links.csv",
+            output_dir="downloaded_html",
+            log_path="download_html.log",
+            seed_urls=("https://www.close.com",),
+            seed_html="close.html",
+            link_selector=CLOSE_NAV_SELECTOR,
+            exclude_text_selector=CLOSE_EXCLUDE_TEXT_SELECTOR,
+            filter_links=filter_close_links,
+        ),
+        Site(
+            name="pipedrive",
+            base_url="https://www.pipedrive.com",
+            domain="pipedrive.com",
+            extract=extract_pipedrive_links,
+            links_csv="navigation_links_pipedrive.csv",
+            output_dir="downloaded_html_pipedrive",
+            log_path="download_pipedrive.log",
+            seed_urls=("https://www.pipedrive.com",),
+            seed_html="pipedrive.html",
+            link_selector=PIPEDRIVE_NAV_SELECTOR,
+            filter_links=filter_pipedrive_links,
+        ),
+        Site(
+            name="digitalwealthpartners",
+            base_url="https://www.digitalwealthpartners.net",
+            domain="digitalwealthpartners.net",
+            extract=extract_digitalwealthpartners_links,
+            links_csv="navigation_links_digitalwealthpartners.csv",
+            output_dir="downloaded_html_digitalwealthpartners",
+            log_path="download_digitalwealthpartners.log",
+            seed_urls=("https://www.digitalwealthpartners.net",),
+            seed_html="digitalwealthpartners.html",
+            link_selector=DIGITALWEALTHPARTNERS_NAV_SELECTOR,
+            filter_links=filter_digitalwealthpartners_links,
+        ),
+        Site(
+            name="digitalfamilyoffice",
+            base_url="https://digitalfamilyoffice.io",
+            domain="digitalfamilyoffice.io",
+            extract=extract_digitalfamilyoffice_links,
+            links_csv="navigation_links_digitalfamilyoffice.csv",
+            output_dir="downloaded_html_digitalfamilyoffice",
+            log_path="download_digitalfamilyoffice.log",
+            seed_urls=("https://digitalfamilyoffice.io",),
+            seed_html="digitalfamilyoffice.html",
+            link_selector=DIGITALFAMILYOFFICE_NAV_SELECTOR,
+            filter_links=filter_digitalfamilyoffice_links,
+        ),
+        Site(
+            name="fantezii",
+            base_url="https://fanteziigreieriprostii.ro/",
+            domain="fanteziigreieriprostii.ro",
+            extract=extract_fantezii_links,
+            links_csv="navigation_links_fantezii.csv",
+            output_dir="downloaded_html_fantezii",
+            log_path="download_fantezii.log",
+            seed_urls=tuple(
+                page_url_for("https://fanteziigreieriprostii.ro/", page_number)
+                for page_number in range(1, FANTEZII_LAST_PAGE + 1)
+            ),
+            seed_html="fanteziigreieriprostii.html",
+            link_selector=FANTEZII_NAV_SELECTOR,
+            filter_links=filter_fantezii_links,
+        ),
+        Site(
+            name="fantezii-articles",
+            base_url="https://fanteziigreieriprostii.ro/",
+            domain="fanteziigreieriprostii.ro",
+            extract=extract_fantezii_posts,
+            links_csv="article_csv.csv",
+            output_dir="downloaded_html_fantezii_articles",
+            log_path="download_fantezii_articles.log",
+            seed_urls=tuple(
+                page_url_for(base_url, page_number)
+                for base_url, max_page in CATEGORY_PAGES
+                for page_number in range(1, max_page + 1)
+            ),
+            slug_source="path",
+            default_slug="article",
+            csv_columns=("post_url",),
+            sitemap_url_pattern=r"/\d{4}/\d{2}/\d{2}/[^/]+/?$",
+            sitemap_index_pattern=r"post",
+            link_selector=POST_SELECTOR,
+            filter_links=filter_fantezii_posts,
+        ),
+    )
+}
+
+
+def get_site(name: str) -> Site:
+    try:
+        return SITES[name]
+    except KeyError:
+        raise KeyError(f"Unknown site: {name} (known: {', '.join(sorted(SITES))})") from None
@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+
+from name_registry import load_registry
+from near_duplicates import is_near_duplicate, load_index
+from pipeline import QUEUE_SIZE, BackgroundWriter, save_page
+from redirect_cache import load_redirects
+from revisit import load_history
+from warc_archive import WarcArchive, save_capture
+
+
+class FileStorage:
+    def __init__(
+        self, near_duplicate_mode: str = "mark", queue_size: int = QUEUE_SIZE, catalog=None
+    ) -> None:
+        self.near_duplicate_mode = near_duplicate_mode
+        self.catalog = catalog
+        self._writer = BackgroundWriter(queue_size)
+        self._targets = {}
+        self._indexes = {}
+        self._redirects = {}
+        self._histories = {}
+        self._legacy = {}
+        self._lock = threading.Lock()
+
+    def _open_target(self, output_dir: str, legacy):
+        return load_registry(output_dir, legacy=legacy)
+
+    def seed_legacy_names(self, output_dir: str, links) -> None:
+        with self._lock:
+            if output_dir not in self._targets:
+                self._legacy[output_dir] = links
+
+    def _open(self, output_dir: str):
+        with self._lock:
+            if output_dir not in self._targets:
+                os.makedirs(output_dir, exist_ok=True)
+                legacy = self._legacy.pop(output_dir, None)
+                self._targets[output_dir] = self._open_target(output_dir, legacy)
+                if self.near_duplicate_mode != "off":
+                    self._indexes[output_dir] = load_index(output_dir)
+            return self._targets[output_dir], self._indexes.get(output_dir)
+
+    def has(self, output_dir: str, url: str) -> bool:
+        registry, _ = self._open(output_dir)
+        filename = registry.get(url)
+        return filename is not None and os.path.exists(os.path.join(output_dir, filename))
+
+    def _redirect_cache(self, output_dir: str):
+        with self._lock:
+            cache = self._redirects.get(output_dir)
+            if cache is None:
+                cache = self._redirects[output_dir] = load_redirects(output_dir)
+            return cache
+
+    def history(self, output_dir: str):
+        with self._lock:
+            history = self._histories.get(output_dir)
+            if history is None:
+                history = self._histories[output_dir] = load_history(output_dir)
+            return history
+
+    def resolve(self, output_dir: str, url: str) -> str:
+        return self._redirect_cache(output_dir).resolve(url)
+
+    def record_redirect(self, output_dir: str, url: str, final_url: str) -> None:
+        self._redirect_cache(output_dir).record(url, final_url)
+
+    def alias(self, output_dir: str, url: str, target_url: str, logger=logging, callback=None) -> None:
+        self._writer.submit(self._alias, output_dir, url, target_url, logger, callback)
+
+    def _alias(self, output_dir: str, url: str, target_url: str, logger, callback) -> None:
+        stored = False
+        try:
+            target, _ = self._open(output_dir)
+            stored = target.alias(url, target_url) is not None
+            if not stored:
+                logger.warning("No capture of %s to alias %s to", target_url, url)
+        finally:
+            if callback is not None:
+                callback(stored)
+
+    def _write(self, registry, output_dir: str, slug: str, url: str, html: str, logger) -> bool:
+        filename = registry.allocate(url, slug)
+        return save_page(os.path.join(output_dir, filename), html, url, logger)
+
+    def store(
+        self,
+        output_dir: str,
+        slug: str,
+        url: str,
+        html: str,
+        logger=logging,
+        callback=None,
+        aliases=(),
+        capture=None,
+    ) -> None:
+        self._writer.submit(
+            self._store, output_dir, slug, url, html, logger, callback, aliases, capture
+        )
+
+    def _store(
+        self, output_dir: str, slug: str, url: str, html: str, logger, callback, aliases, capture
+    ) -> None:
+        stored = False
+        try:
+            target, dup_index = self._open(output_dir)
+            history = self.history(output_dir)
+            if history.observe(url, html):
+                logger.info("Content changed since last visit: %s", url)
+            if self.catalog is not None and capture is not None:
+                self.catalog.record_capture(
+                    capture.get("site"),
+                    url,
+                    200,
+                    capture.get("latency_ms"),
+                    len(html.encode("utf-8")),
+                    history.get(url).last_hash,
+                    capture.get("fetched_at"),
+                )
+            if dup_index is not None and is_near_duplicate(dup_index, url, html):
+                if self.near_duplicate_mode == "skip":
+                    logger.info("Skipping near-duplicate: %s", url)
+                    stored = True
+                    return
+            if self._write(target, output_dir, slug, url, html, logger):
+                for alias in aliases:
+                    target.alias(alias, url)
+                stored = True
+        finally:
+            if callback is not None:
+                callback(stored)
+
+    def close(self) -> None:
+        self._writer.close()
+        with self._lock:
+            for target in self._targets.values():
+                target.close()
+            for dup_index in self._indexes.values():
+                dup_index.close()
+            for cache in self._redirects.values():
+                cache.close()
+            for history in self._histories.values():
+                history.close()
+            self._redirects = {}
+            self._histories = {}
+            self._targets = {}
+            self._indexes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class WarcStorage(FileStorage):
+    def _open_target(self, output_dir: str, legacy):
+        return WarcArchive(output_dir)
+
+    def has(self, output_dir: str, url: str) -> bool:
+        archive, _ = self._open(output_dir)
+        return archive.has(url)
+
+    def _write(self, archive, output_dir: str, slug: str, url: str, html: str, logger) -> bool:
+        return save_capture(archive, url, html, logger)
+
+
+STORAGE_BACKENDS = {"files": FileStorage, "warc": WarcStorage}
+
+
+def open_storage(
+    kind: str = "files",
+    near_duplicate_mode: str = "mark",
+    queue_size: int = QUEUE_SIZE,
+    catalog=None,
+):
+    return STORAGE_BACKENDS[kind](near_duplicate_mode, queue_size, catalog)
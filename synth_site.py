@@ -0,0 +1,259 @@
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+from urllib.parse import urlparse
+
+from profiling import add_profile_argument, profile_run
+from replay_server import ReplayConfig, make_server
+
+
+KINDS = ("close", "pipedrive", "wordpress")
+POSTS_PER_PAGE = 10
+HEADER_LINKS = 12
+PAGE_WORDS = 6000
+WORDS = (
+    "sales pipeline lead deal contact email call report team revenue forecast customer "
+    "workflow automation integration pricing product feature support webinar blog guide "
+    "template poezie fantezii greieri prostii ludic mistic senzual carnal atingi unde"
+).split()
+
+SITE_HOSTS = {
+    "close": "https://www.close.com",
+    "pipedrive": "https://www.pipedrive.com",
+    "wordpress": "https://fanteziigreieriprostii.ro",
+}
+PAGE_PATTERNS = {
+    "close": re.compile(r"^/p/(\d+)/$"),
+    "pipedrive": re.compile(r"^/en/p/(\d+)$"),
+    "wordpress": re.compile(r"^/\d{4}/\d{2}/\d{2}/post-(\d+)/$"),
+}
+LISTING_PATTERN = re.compile(r"^/(?:page/(\d+)/)?$")
+
+
+class SyntheticSite:
+    def __init__(self, kind: str, pages: int, page_words: int = PAGE_WORDS, seed: int = 0) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown synthetic site kind: {kind}")
+        self.kind = kind
+        self.pages = pages
+        self.page_words = page_words
+        self.seed = seed
+        self.base_url = SITE_HOSTS[kind]
+
+    @property
+    def listing_pages(self) -> int:
+        return max(1, -(-self.pages // POSTS_PER_PAGE))
+
+    def page_path(self, index: int) -> str:
+        if self.kind == "close":
+            return f"/p/{index}/"
+        if self.kind == "pipedrive":
+            return f"/en/p/{index}"
+        day = index % 28 + 1
+        return f"/2024/{index % 12 + 1:02d}/{day:02d}/post-{index}/"
+
+    def page_url(self, index: int) -> str:
+        return self.base_url + self.page_path(index)
+
+    def listing_url(self, page_number: int) -> str:
+        if page_number == 1:
+            return self.base_url + "/"
+        return f"{self.base_url}/page/{page_number}/"
+
+    def title(self, index: int) -> str:
+        # Titles repeat every 100 pages so slug collisions are exercised.
+        words = random.Random(index % 100).sample(WORDS, 2)
+        return " ".join(word.capitalize() for word in words)
+
+    def _nav_links(self, indexes) -> str:
+        if self.kind == "close":
+            items = "".join(
+                f'<div class="g--nav-item"><a class="g--nav-item-link" href="{self.page_path(i)}">'
+                f'<span class="g--nav-item-text">{self.title(i)}</span>'
+                f'<span class="g--nav-item-text-2">About {self.title(i).lower()}</span></a></div>'
+                for i in indexes
+            )
+            return (
+                '<div class="g--nav-desktop"><a class="g--nav-logo" href="/">Close</a>'
+                f'<div class="g--nav-items">{items}</div></div>'
+            )
+        if self.kind == "pipedrive":
+            items = "".join(
+                f'<li><a class="puco-link" href="{self.page_path(i)}">{self.title(i)}</a></li>'
+                for i in indexes
+            )
+            return f'<header class="puco-header"><nav><ul>{items}</ul></nav></header>'
+        items = "".join(
+            f'<li><a href="{self.base_url}{self.page_path(i)}">{self.title(i)}</a></li>'
+            for i in indexes
+        )
+        return (
+            '<header id="masthead"><h1 class="site-title"><a href="/">FGP</a></h1>'
+            f'<nav id="access"><ul class="menu">{items}</ul></nav></header>'
+        )
+
+    def _document(self, title: str, header: str, body: str) -> str:
+        return (
+            f"<!DOCTYPE html><html><head><title>{title}</title>"
+            '<script>window.dataLayer = [];</script></head><body>'
+            f"{header}<main>{body}</main>"
+            '<footer class="site-footer"><a href="/about/">About</a>'
+            '<a href="mailto:hello@example.com">Contact</a></footer></body></html>'
+        )
+
+    def seed_html(self) -> str:
+        # The seed page lists every synthetic page in the site's navigation markup.
+        return self._document("Home", self._nav_links(range(self.pages)), "<p>Welcome</p>")
+
+    def listing_html(self, page_number: int) -> str:
+        start = (page_number - 1) * POSTS_PER_PAGE
+        posts = "".join(
+            f'<article><div class="featured-image-overlay"><a href="{self.page_url(i)}">'
+            f'<img src="/img/{i}.jpg"></a></div><h2><a href="{self.page_url(i)}">'
+            f"{self.title(i)}</a></h2></article>"
+            for i in range(start, min(start + POSTS_PER_PAGE, self.pages))
+        )
+        pager = ""
+        if page_number < self.listing_pages:
+            pager = f'<a class="next" href="{self.listing_url(page_number + 1)}">Next</a>'
+        header = self._nav_links(range(min(HEADER_LINKS, self.pages)))
+        return self._document(f"Page {page_number}", header, posts + pager)
+
+    def page_html(self, index: int) -> str:
+        generator = random.Random(self.seed * 1_000_003 + index)
+        paragraphs = []
+        remaining = self.page_words
+        while remaining > 0:
+            count = min(remaining, 120)
+            paragraphs.append("<p>" + " ".join(generator.choices(WORDS, k=count)) + "</p>")
+            remaining -= count
+        related = "".join(
+            f'<a href="{self.page_path(generator.randrange(self.pages))}">Related</a>'
+            for _ in range(5)
+        )
+        header = self._nav_links(range(min(HEADER_LINKS, self.pages)))
+        return self._document(self.title(index), header, "".join(paragraphs) + related)
+
+    def locate(self, url: str):
+        parsed = urlparse(url)
+        if f"{parsed.scheme}://{parsed.netloc}" != self.base_url:
+            return None
+        match = PAGE_PATTERNS[self.kind].match(parsed.path)
+        if match and int(match.group(1)) < self.pages:
+            return ("page", int(match.group(1)))
+        match = LISTING_PATTERN.match(parsed.path or "/")
+        if match:
+            page_number = int(match.group(1) or 1)
+            if page_number == 1 and self.kind != "wordpress":
+                return ("seed", 0)
+            if page_number <= self.listing_pages:
+                return ("listing", page_number)
+        return None
+
+    def render_location(self, location) -> str:
+        kind, number = location
+        if kind == "page":
+            return self.page_html(number)
+        if kind == "listing":
+            return self.listing_html(number)
+        return self.seed_html()
+
+    def render(self, url: str):
+        location = self.locate(url)
+        return self.render_location(location) if location is not None else None
+
+
+class SyntheticMirror:
+    def __init__(self, site: SyntheticSite) -> None:
+        self.site = site
+        self.entries = range(site.pages)
+
+    def find(self, url: str):
+        return self.site.locate(url)
+
+    def read(self, source) -> bytes:
+        return self.site.render_location(source).encode("utf-8")
+
+
+class UrllibDriver:
+    def __init__(self, timeout: float = 30) -> None:
+        self.timeout = timeout
+        self.current_url = None
+        self.page_source = ""
+
+    def set_page_load_timeout(self, timeout: float) -> None:
+        self.timeout = timeout
+
+    def get(self, url: str) -> None:
+        import urllib.error
+        import urllib.request
+
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                self.page_source = response.read().decode("utf-8", errors="replace")
+                self.current_url = response.geturl()
+        except urllib.error.HTTPError as exc:
+            self.page_source = exc.read().decode("utf-8", errors="replace")
+            self.current_url = url
+
+    def quit(self) -> None:
+        pass
+
+
+def write_site(site: SyntheticSite, directory: str) -> int:
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "index.html"), "w", encoding="utf-8") as out:
+        out.write(site.seed_html() if site.kind != "wordpress" else site.listing_html(1))
+    for page_number in range(2, site.listing_pages + 1):
+        with open(os.path.join(directory, f"page-{page_number}.html"), "w", encoding="utf-8") as out:
+            out.write(site.listing_html(page_number))
+    for index in range(site.pages):
+        with open(os.path.join(directory, f"p-{index}.html"), "w", encoding="utf-8") as out:
+            out.write(site.page_html(index))
+    return site.pages
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate or serve synthetic sites for scale tests.")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("--pages", type=int, default=10_000)
+    parser.add_argument("--page-words", type=int, default=PAGE_WORDS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--write", metavar="DIR", help="write pages to DIR instead of serving them")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="base latency in seconds")
+    add_profile_argument(parser, "synth_site")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    site = SyntheticSite(args.kind, args.pages, args.page_words, args.seed)
+    with profile_run(args.profile):
+        if args.write:
+            written = write_site(site, args.write)
+            logging.info("Wrote %d synthetic %s pages to %s", written, args.kind, args.write)
+            return 0
+        server = make_server(SyntheticMirror(site), ReplayConfig(args.latency), args.host, args.port)
+        host, port = server.server_address[:2]
+        logging.info(
+            "Serving %d synthetic %s pages on http://%s:%d/%s/",
+            site.pages,
+            args.kind,
+            host,
+            port,
+            site.base_url,
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,462 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import heapq
+import logging
+import os
+import sys
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+from file_lock import directory_lock, lock_file, unlock_file
+from pipeline import canonicalize_url
+from profiling import add_profile_argument, profile_run, stage
+
+
+WARC_FILENAME = "captures.warc.gz"
+CDX_FILENAME = "captures.cdx"
+PENDING_SUFFIX = ".pending"
+CDX_HEADER = b" CDX N b a m s k r M S V g\n"
+WARC_VERSION = "WARC/1.1"
+HTML_CONTENT_TYPE = "text/html; charset=utf-8"
+CHUNK_SIZE = 64 * 1024
+
+
+def surt_key(url: str) -> str:
+    parsed = urlparse(canonicalize_url(url))
+    host = parsed.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    key = ",".join(reversed(host.split("."))) + ")" + (parsed.path or "/")
+    if parsed.query:
+        key += "?" + parsed.query
+    return key
+
+
+def warc_date(fetch_time: str = None) -> str:
+    if fetch_time:
+        parsed = datetime.fromisoformat(fetch_time.replace("Z", "+00:00"))
+    else:
+        parsed = datetime.now(timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def cdx_timestamp(date: str) -> str:
+    return "".join(ch for ch in date if ch.isdigit())[:14]
+
+
+def sha1_digest(payload: bytes) -> str:
+    return "sha1:" + base64.b32encode(hashlib.sha1(payload).digest()).decode("ascii")
+
+
+class WarcRecord:
+    def __init__(self, headers: dict, payload: bytes) -> None:
+        self.headers = headers
+        self.payload = payload
+
+    @property
+    def url(self) -> str:
+        return self.headers.get("WARC-Target-URI")
+
+    @property
+    def record_type(self) -> str:
+        return self.headers.get("WARC-Type")
+
+    def text(self) -> str:
+        return self.payload.decode("utf-8", errors="replace")
+
+
+def build_record(record_type: str, headers: dict, payload: bytes) -> bytes:
+    lines = [WARC_VERSION, f"WARC-Type: {record_type}"]
+    lines.append(f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>")
+    for name, value in headers.items():
+        lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(payload)}")
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+    return head + payload + b"\r\n\r\n"
+
+
+def parse_record(raw: bytes) -> WarcRecord:
+    head, _, body = raw.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("utf-8", errors="replace").split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    length = int(headers.get("Content-Length", len(body)))
+    return WarcRecord(headers, body[:length])
+
+
+def read_record(warc_path: str, offset: int, length: int) -> WarcRecord:
+    with open(warc_path, "rb") as handle:
+        handle.seek(offset)
+        return parse_record(gzip.decompress(handle.read(length)))
+
+
+def iter_records(warc_path: str):
+    with open(warc_path, "rb") as handle:
+        offset = 0
+        buffer = b""
+        while True:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            parts = []
+            consumed = 0
+            while not decompressor.eof:
+                if not buffer:
+                    buffer = handle.read(CHUNK_SIZE)
+                    if not buffer:
+                        break
+                chunk = buffer
+                parts.append(decompressor.decompress(chunk))
+                buffer = decompressor.unused_data
+                consumed += len(chunk) - len(buffer)
+            if not decompressor.eof:
+                if consumed:
+                    logging.warning("Truncated WARC record at offset %d in %s", offset, warc_path)
+                return
+            yield offset, consumed, parse_record(b"".join(parts))
+            offset += consumed
+
+
+class WarcWriter:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._handle = open(path, "ab")
+        if is_new:
+            info = "software: nav-scraper\r\nformat: WARC File Format 1.1\r\n".encode("utf-8")
+            self._append(
+                build_record(
+                    "warcinfo",
+                    {
+                        "WARC-Date": warc_date(),
+                        "WARC-Filename": os.path.basename(path),
+                        "Content-Type": "application/warc-fields",
+                    },
+                    info,
+                )
+            )
+
+    def _append(self, record: bytes):
+        member = gzip.compress(record)
+        # Another process may have appended since our last write; offsets come from the real end.
+        self._handle.seek(0, os.SEEK_END)
+        offset = self._handle.tell()
+        self._handle.write(member)
+        self._handle.flush()
+        return offset, len(member)
+
+    def write_resource(
+        self, url: str, payload: bytes, fetch_time: str = None, content_type: str = HTML_CONTENT_TYPE
+    ) -> str:
+        date = warc_date(fetch_time)
+        digest = sha1_digest(payload)
+        record = build_record(
+            "resource",
+            {
+                "WARC-Target-URI": url,
+                "WARC-Date": date,
+                "WARC-Payload-Digest": digest,
+                "WARC-Block-Digest": digest,
+                "Content-Type": content_type,
+            },
+            payload,
+        )
+        with self._lock:
+            offset, length = self._append(record)
+        mime = content_type.split(";", 1)[0]
+        return cdx_line(url, cdx_timestamp(date), mime, digest, length, offset, self.path)
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
+
+
+def cdx_line(url, timestamp, mime, digest, length, offset, warc_path) -> str:
+    fields = [
+        surt_key(url),
+        timestamp,
+        url,
+        mime,
+        "-",
+        digest.split(":", 1)[-1],
+        "-",
+        "-",
+        str(length),
+        str(offset),
+        os.path.basename(warc_path),
+    ]
+    return " ".join(fields) + "\n"
+
+
+class CdxEntry:
+    def __init__(self, line: str) -> None:
+        fields = line.rstrip("\n").split(" ")
+        self.urlkey = fields[0]
+        self.timestamp = fields[1]
+        self.url = fields[2]
+        self.mime = fields[3]
+        self.digest = fields[5]
+        self.length = int(fields[8])
+        self.offset = int(fields[9])
+        self.filename = fields[10]
+
+
+class CdxIndex:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def _seek_first(self, handle, key: bytes) -> None:
+        low, high = 0, os.fstat(handle.fileno()).st_size
+        while low < high:
+            middle = (low + high) // 2
+            handle.seek(middle)
+            if middle:
+                handle.readline()
+            line = handle.readline()
+            if not line or line.split(b" ", 1)[0] >= key:
+                high = middle
+            else:
+                low = middle + 1
+        handle.seek(low)
+        if low:
+            handle.readline()
+
+    def lookup(self, url: str):
+        if not os.path.exists(self.path):
+            return []
+        key = surt_key(url).encode("utf-8")
+        matches = []
+        with open(self.path, "rb") as handle:
+            self._seek_first(handle, key)
+            for line in handle:
+                if line.startswith(b" "):
+                    continue
+                line_key = line.split(b" ", 1)[0]
+                if line_key > key:
+                    break
+                if line_key == key:
+                    matches.append(CdxEntry(line.decode("utf-8")))
+        return matches
+
+    def __iter__(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                if line.strip() and not line.startswith(" "):
+                    yield CdxEntry(line)
+
+
+def merge_cdx(cdx_path: str, new_lines) -> None:
+    new_lines = sorted(line.encode("utf-8") if isinstance(line, str) else line for line in new_lines)
+    if not new_lines:
+        return
+    temporary = f"{cdx_path}.tmp"
+    existing = open(cdx_path, "rb") if os.path.exists(cdx_path) else None
+    try:
+        current = (line for line in existing if not line.startswith(b" ")) if existing else ()
+        with open(temporary, "wb") as out:
+            out.write(CDX_HEADER)
+            previous = None
+            for line in heapq.merge(current, new_lines):
+                if line != previous:
+                    out.write(line)
+                previous = line
+    finally:
+        if existing is not None:
+            existing.close()
+    os.replace(temporary, cdx_path)
+
+
+class WarcArchive:
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.warc_path = os.path.join(directory, WARC_FILENAME)
+        self.cdx_path = os.path.join(directory, CDX_FILENAME)
+        # One pending file per writer; its lock tells other processes it is still in use.
+        self.pending_path = f"{self.cdx_path}{PENDING_SUFFIX}.{uuid.uuid4().hex[:12]}"
+        self.index = CdxIndex(self.cdx_path)
+        self._writer = None
+        self._pending_handle = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._merge_pending()
+
+    def _open_pending(self) -> None:
+        if self._pending_handle is None:
+            self._pending_handle = open(self.pending_path, "a", encoding="utf-8")
+            lock_file(self._pending_handle)
+
+    def _merge_pending(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+        prefix = os.path.basename(self.cdx_path) + PENDING_SUFFIX
+        with directory_lock(self.directory):
+            lines = []
+            merged = []
+            for entry in os.listdir(self.directory):
+                if not entry.startswith(prefix):
+                    continue
+                path = os.path.join(self.directory, entry)
+                with open(path, "r+", encoding="utf-8") as handle:
+                    if not lock_file(handle, blocking=False):
+                        continue
+                    lines.extend(line for line in handle if line.strip())
+                    unlock_file(handle)
+                merged.append(path)
+            merge_cdx(self.cdx_path, lines)
+            for path in merged:
+                os.remove(path)
+
+    def _entries(self, url: str):
+        with self._lock:
+            pending = self._pending.get(surt_key(url))
+        if pending is not None:
+            return [pending]
+        return self.index.lookup(url)
+
+    def has(self, url: str) -> bool:
+        return bool(self._entries(url))
+
+    def get(self, url: str):
+        entries = self._entries(url)
+        if not entries:
+            return None
+        latest = max(entries, key=lambda entry: entry.timestamp)
+        return read_record(os.path.join(self.directory, latest.filename), latest.offset, latest.length)
+
+    def put(self, url: str, html: str, fetch_time: str = None) -> CdxEntry:
+        with stage("write"), self._lock, directory_lock(self.directory):
+            if self._writer is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._writer = WarcWriter(self.warc_path)
+            self._open_pending()
+            line = self._writer.write_resource(url, html.encode("utf-8"), fetch_time)
+            self._pending_handle.write(line)
+            self._pending_handle.flush()
+            entry = CdxEntry(line)
+            self._pending[entry.urlkey] = entry
+        return entry
+
+    def alias(self, url: str, target_url: str):
+        entries = self._entries(target_url)
+        if not entries:
+            return None
+        latest = max(entries, key=lambda entry: entry.timestamp)
+        line = cdx_line(
+            url,
+            latest.timestamp,
+            latest.mime,
+            latest.digest,
+            latest.length,
+            latest.offset,
+            latest.filename,
+        )
+        with self._lock, directory_lock(self.directory):
+            self._open_pending()
+            self._pending_handle.write(line)
+            self._pending_handle.flush()
+            entry = CdxEntry(line)
+            self._pending[entry.urlkey] = entry
+        return entry
+
+    def close(self) -> None:
+        with self._lock:
+            if self._writer is None and self._pending_handle is None:
+                return
+            if self._writer is not None:
+                self._writer.close()
+            self._pending_handle.close()
+            self._writer = None
+            self._pending_handle = None
+            self._pending = {}
+        self._merge_pending()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def save_capture(archive: WarcArchive, url: str, html: str, logger=logging) -> bool:
+    try:
+        entry = archive.put(url, html)
+    except OSError as exc:
+        logger.error("WARC write error for %s: %s", url, exc)
+        return False
+    logger.info("Saved: %s@%d from %s", archive.warc_path, entry.offset, url)
+    return True
+
+
+def has_archive(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, WARC_FILENAME))
+
+
+def iter_archive(directory: str):
+    warc_path = os.path.join(directory, WARC_FILENAME)
+    for _, _, record in iter_records(warc_path):
+        if record.record_type in ("resource", "response"):
+            yield record
+
+
+def rebuild_index(directory: str) -> int:
+    warc_path = os.path.join(directory, WARC_FILENAME)
+    cdx_path = os.path.join(directory, CDX_FILENAME)
+    lines = []
+    for offset, length, record in iter_records(warc_path):
+        if record.record_type not in ("resource", "response"):
+            continue
+        mime = record.headers.get("Content-Type", "").split(";", 1)[0] or "-"
+        digest = record.headers.get("WARC-Payload-Digest") or sha1_digest(record.payload)
+        timestamp = cdx_timestamp(record.headers.get("WARC-Date", ""))
+        lines.append(cdx_line(record.url, timestamp, mime, digest, length, offset, warc_path))
+    if os.path.exists(cdx_path):
+        os.remove(cdx_path)
+    merge_cdx(cdx_path, lines)
+    return len(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect WARC captures and their CDX index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    get_parser = commands.add_parser("get", help="print the latest capture of a URL")
+    get_parser.add_argument("directory")
+    get_parser.add_argument("url")
+    index_parser = commands.add_parser("index", help="rebuild the CDX index from the WARC file")
+    index_parser.add_argument("directory")
+    list_parser = commands.add_parser("list", help="list indexed captures")
+    list_parser.add_argument("directory")
+    for command_parser in commands.choices.values():
+        add_profile_argument(command_parser, "warc_archive")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    with profile_run(args.profile):
+        return run_command(args)
+
+
+def run_command(args) -> int:
+    if args.command == "index":
+        count = rebuild_index(args.directory)
+        logging.info("Indexed %d captures in %s", count, args.directory)
+        return 0
+    if args.command == "list":
+        for entry in CdxIndex(os.path.join(args.directory, CDX_FILENAME)):
+            print(f"{entry.timestamp} {entry.length:>8} {entry.url}")
+        return 0
+    record = WarcArchive(args.directory).get(args.url)
+    if record is None:
+        logging.error("No capture for %s", args.url)
+        return 1
+    sys.stdout.write(record.text())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
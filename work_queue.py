@@ -0,0 +1,364 @@
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from profiling import add_profile_argument, profile_run, stage
+
+
+DEFAULT_VISIBILITY_TIMEOUT = 300
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_PORT = 8766
+RPC_METHODS = ("put", "lease", "ack", "nack", "release", "extend", "stats")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    url TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    lease_token TEXT,
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (state, enqueued_at);
+CREATE INDEX IF NOT EXISTS jobs_leases ON jobs (state, lease_expires);
+"""
+
+
+class Lease:
+    def __init__(self, url: str, payload: dict, token: str, expires: float) -> None:
+        self.url = url
+        self.payload = payload
+        self.token = token
+        self.expires = expires
+
+    def as_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "payload": self.payload,
+            "token": self.token,
+            "expires": self.expires,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Lease":
+        return cls(data["url"], data["payload"], data["token"], data["expires"])
+
+
+class SQLiteWorkQueue:
+    def __init__(self, path: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> None:
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def _transaction(self, function):
+        with stage("queue"), self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = function(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def put(self, items) -> int:
+        now = time.time()
+        rows = [(url, json.dumps(payload or {}), now) for url, payload in items]
+
+        def insert(db):
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO jobs (url, payload, enqueued_at) VALUES (?, ?, ?)", rows
+            )
+            return db.total_changes - before
+
+        return self._transaction(insert)
+
+    def _reclaim_expired(self, db, now: float) -> int:
+        # A URL whose worker keeps dying mid-lease must not be handed out forever.
+        cursor = db.execute(
+            "UPDATE jobs SET state = 'failed', lease_token = NULL, lease_owner = NULL,"
+            " lease_expires = NULL, finished_at = ?"
+            " WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.max_attempts),
+        )
+        if cursor.rowcount:
+            logging.warning(
+                "Failed %d URLs after %d expired leases", cursor.rowcount, self.max_attempts
+            )
+        cursor = db.execute(
+            "UPDATE jobs SET state = 'pending', lease_token = NULL, lease_owner = NULL,"
+            " lease_expires = NULL WHERE state = 'leased' AND lease_expires < ?",
+            (now,),
+        )
+        if cursor.rowcount:
+            logging.info("Reclaimed %d expired leases", cursor.rowcount)
+        return cursor.rowcount
+
+    def lease(
+        self, worker_id: str, count: int = 1, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT
+    ):
+        def take(db):
+            now = time.time()
+            self._reclaim_expired(db, now)
+            rows = db.execute(
+                "SELECT url, payload FROM jobs WHERE state = 'pending'"
+                " ORDER BY enqueued_at LIMIT ?",
+                (count,),
+            ).fetchall()
+            leases = []
+            expires = now + visibility_timeout
+            for url, payload in rows:
+                token = uuid.uuid4().hex
+                db.execute(
+                    "UPDATE jobs SET state = 'leased', lease_token = ?, lease_owner = ?,"
+                    " lease_expires = ?, attempts = attempts + 1 WHERE url = ?",
+                    (token, worker_id, expires, url),
+                )
+                leases.append(Lease(url, json.loads(payload), token, expires))
+            return leases
+
+        return self._transaction(take)
+
+    def ack(self, url: str, token: str) -> bool:
+        def finish(db):
+            cursor = db.execute(
+                "UPDATE jobs SET state = 'done', lease_token = NULL, lease_expires = NULL,"
+                " finished_at = ? WHERE url = ? AND state = 'leased' AND lease_token = ?",
+                (time.time(), url, token),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(finish)
+
+    def nack(self, url: str, token: str, retry: bool = True) -> bool:
+        def release(db):
+            row = db.execute(
+                "SELECT attempts FROM jobs WHERE url = ? AND state = 'leased' AND lease_token = ?",
+                (url, token),
+            ).fetchone()
+            if row is None:
+                return False
+            state = "pending" if retry and row[0] < self.max_attempts else "failed"
+            if state == "failed":
+                logging.warning("Giving up on %s after %d attempts", url, row[0])
+            db.execute(
+                "UPDATE jobs SET state = ?, lease_token = NULL, lease_owner = NULL,"
+                " lease_expires = NULL, finished_at = ? WHERE url = ?",
+                (state, time.time() if state == "failed" else None, url),
+            )
+            return True
+
+        return self._transaction(release)
+
+    def release(self, url: str, token: str) -> bool:
+        # Hands back a lease that was never worked on, so it does not count as an attempt.
+        def unlease(db):
+            cursor = db.execute(
+                "UPDATE jobs SET state = 'pending', lease_token = NULL, lease_owner = NULL,"
+                " lease_expires = NULL, attempts = MAX(attempts - 1, 0)"
+                " WHERE url = ? AND state = 'leased' AND lease_token = ?",
+                (url, token),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(unlease)
+
+    def extend(
+        self, url: str, token: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT
+    ) -> bool:
+        def touch(db):
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ?"
+                " WHERE url = ? AND state = 'leased' AND lease_token = ?",
+                (time.time() + visibility_timeout, url, token),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(touch)
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class LocalTransport:
+    def __init__(self, queue) -> None:
+        self.queue = queue
+
+    def __call__(self, method: str, params: dict):
+        return dispatch(self.queue, method, params)
+
+
+class HttpTransport:
+    def __init__(self, base_url: str, timeout: float = 30) -> None:
+        self.endpoint = base_url.rstrip("/") + "/rpc"
+        self.timeout = timeout
+
+    def __call__(self, method: str, params: dict):
+        body = json.dumps({"method": method, "params": params}).encode("utf-8")
+        request = urllib.request.Request(
+            self.endpoint, data=body, headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            reply = json.loads(response.read().decode("utf-8"))
+        if "error" in reply:
+            raise RuntimeError(f"Work queue error: {reply['error']}")
+        return reply["result"]
+
+
+class RemoteWorkQueue:
+    def __init__(self, transport) -> None:
+        self.transport = transport
+
+    def put(self, items) -> int:
+        return self.transport("put", {"items": [[url, payload] for url, payload in items]})
+
+    def lease(
+        self, worker_id: str, count: int = 1, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT
+    ):
+        result = self.transport(
+            "lease",
+            {"worker_id": worker_id, "count": count, "visibility_timeout": visibility_timeout},
+        )
+        return [Lease.from_dict(item) for item in result]
+
+    def ack(self, url: str, token: str) -> bool:
+        return self.transport("ack", {"url": url, "token": token})
+
+    def nack(self, url: str, token: str, retry: bool = True) -> bool:
+        return self.transport("nack", {"url": url, "token": token, "retry": retry})
+
+    def release(self, url: str, token: str) -> bool:
+        return self.transport("release", {"url": url, "token": token})
+
+    def extend(
+        self, url: str, token: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT
+    ) -> bool:
+        return self.transport(
+            "extend", {"url": url, "token": token, "visibility_timeout": visibility_timeout}
+        )
+
+    def stats(self) -> dict:
+        return self.transport("stats", {})
+
+    def close(self) -> None:
+        pass
+
+
+def dispatch(queue, method: str, params: dict):
+    if method not in RPC_METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    timeout = params.get("visibility_timeout", DEFAULT_VISIBILITY_TIMEOUT)
+    if method == "put":
+        return queue.put((url, payload) for url, payload in params["items"])
+    if method == "lease":
+        leases = queue.lease(params["worker_id"], params.get("count", 1), timeout)
+        return [lease.as_dict() for lease in leases]
+    if method == "stats":
+        return queue.stats()
+    if method == "extend":
+        return queue.extend(params["url"], params["token"], timeout)
+    if method == "release":
+        return queue.release(params["url"], params["token"])
+    if method == "nack":
+        return queue.nack(params["url"], params["token"], params.get("retry", True))
+    return queue.ack(params["url"], params["token"])
+
+
+class QueueRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+    def do_POST(self):
+        if self.path != "/rpc":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            result = dispatch(self.server.queue, request["method"], request.get("params", {}))
+            reply = {"result": result}
+        except (KeyError, ValueError, TypeError) as exc:
+            reply = {"error": str(exc)}
+        body = json.dumps(reply).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(queue, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+    server = ThreadingHTTPServer((host, port), QueueRequestHandler)
+    server.daemon_threads = True
+    server.queue = queue
+    return server
+
+
+def open_queue(spec: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+    if spec.startswith(("http://", "https://")):
+        return RemoteWorkQueue(HttpTransport(spec))
+    return SQLiteWorkQueue(spec, max_attempts)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Shared crawl work queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="expose a SQLite queue over HTTP")
+    serve_parser.add_argument("--db", default="crawl_queue.db")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_MAX_ATTEMPTS,
+        help="leases per URL before it is marked failed",
+    )
+    stats_parser = commands.add_parser("stats", help="print job counts by state")
+    stats_parser.add_argument("--queue", default="crawl_queue.db")
+    add_profile_argument(serve_parser, "work_queue")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.command == "stats":
+        queue = open_queue(args.queue)
+        print(json.dumps(queue.stats(), indent=1, sort_keys=True))
+        queue.close()
+        return 0
+
+    queue = SQLiteWorkQueue(args.db, args.max_attempts)
+    server = make_server(queue, args.host, args.port)
+    logging.info("Serving work queue %s on http://%s:%d/", args.db, *server.server_address[:2])
+    try:
+        with profile_run(args.profile):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())